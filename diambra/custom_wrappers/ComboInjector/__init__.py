@@ -211,13 +211,43 @@ BASE_ACTION_LOOKUP = {
     )
 }
 
-# Reverse mapping: index -> multi-discrete array.
-BASE_INPUT_LOOKUP = {}
-for combo_str, idx in BASE_ACTION_LOOKUP.items():
-    move_part, attack_part = combo_str.split('+')
-    movement_arr = BASE_MOVEMENTS[move_part]
-    attack_arr = BASE_ATTACKS[attack_part]
-    BASE_INPUT_LOOKUP[idx] = (movement_arr + attack_arr).tolist()
+def _read_only(array):
+    """Freeze a shared encoding table."""
+    array.flags.writeable = False
+    return array
+
+# Dense action encoding tables, built once and shared read-only: row i encodes action index i.
+# Multi-discrete: [move, attack], e.g. 'dr+lp' -> [6, 1].
+MULTI_DISCRETE_ACTIONS = _read_only(np.array(
+    [BASE_MOVEMENTS[move] + BASE_ATTACKS[attack] for move in BASE_MOVEMENTS for attack in BASE_ATTACKS],
+    dtype=np.int64))
+
+# Discrete: DIAMBRA's Discrete(n_moves + n_attacks - 1) space, one input per step:
+# 0 no-op, 1-8 moves, 9-14 attacks. An action with both a move and an attack keeps the attack.
+DISCRETE_ACTIONS = _read_only(np.where(MULTI_DISCRETE_ACTIONS[:, 1] > 0,
+                                       MULTI_DISCRETE_ACTIONS[:, 1] + len(BASE_MOVEMENTS) - 1,
+                                       MULTI_DISCRETE_ACTIONS[:, 0]))
+
+# Multi-binary: DIAMBRA's MultiBinary(n_moves + n_attacks - 2) button vector,
+# one button per move (columns 0-7) and per attack (columns 8-13); the no-op presses nothing.
+_buttons = np.zeros((len(MULTI_DISCRETE_ACTIONS), len(BASE_MOVEMENTS) + len(BASE_ATTACKS) - 2), dtype=np.int8)
+for _idx, (_move, _attack) in enumerate(MULTI_DISCRETE_ACTIONS):
+    if _move:
+        _buttons[_idx, _move - 1] = 1
+    if _attack:
+        _buttons[_idx, len(BASE_MOVEMENTS) - 1 + _attack - 1] = 1
+MULTI_BINARY_ACTIONS = _read_only(_buttons)
+del _buttons, _idx, _move, _attack
+
+# Encoding table of every supported action mode.
+ACTION_TABLES = {
+    'multi_discrete': MULTI_DISCRETE_ACTIONS,
+    'discrete': DISCRETE_ACTIONS,
+    'multi_binary': MULTI_BINARY_ACTIONS,
+}
+
+# Reverse mapping: index -> multi-discrete list.
+BASE_INPUT_LOOKUP = {idx: row for idx, row in enumerate(MULTI_DISCRETE_ACTIONS.tolist())}
 
 __all__ = [
     "BASE_MOVEMENTS",
@@ -225,6 +255,10 @@ __all__ = [
     "CHARACTER_MOVES",
     "BASE_ACTION_LOOKUP",
     "BASE_INPUT_LOOKUP",
+    "MULTI_DISCRETE_ACTIONS",
+    "DISCRETE_ACTIONS",
+    "MULTI_BINARY_ACTIONS",
+    "ACTION_TABLES",
     "ComboInjector",
 ]
   
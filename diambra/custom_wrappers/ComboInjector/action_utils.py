@@ -8,7 +8,7 @@ Author: ruhe (modified with debug prints)
 """
 
 import numpy as np
-from . import BASE_ACTION_LOOKUP
+from . import BASE_ACTION_LOOKUP, CHARACTER_MOVES
 
 # Mirroring table for reversing left/right movement inputs when needed.
 MIRROR_MAP = {
@@ -16,6 +16,25 @@ MIRROR_MAP = {
     'ur': 'ul', 'ul': 'ur', 'sr': 'sl', 'sl': 'sr'
 }
 
+# Movement patterns known to the 'comb' segment.
+MOVE_PATTERNS = {
+    'qc': ['d', 'dr', 'r'],
+    'dp': ['r', 'd', 'dr'],
+    'hc': ['l', 'dl', 'd', 'dr', 'r']
+}
+
+# Attacks a generic punch ('p') or kick ('k') is drawn from.
+ATTACK_CHOICES = {
+    'p': ['lp', 'mp', 'hp'],
+    'k': ['lk', 'mk', 'hk'],
+}
+
+# Placeholder for tokens missing from BASE_ACTION_LOOKUP; string_to_idx maps them to a random index.
+RANDOM_TOKEN = -1
+
+# Move probability sums further than this from 1 are flagged by the validation report.
+PROB_TOLERANCE = 1e-6
+
 def string_to_idx(string_list: list) -> list:
     """
     Convert each 'dir+attack' token into an integer action index.
@@ -55,13 +74,8 @@ def combine_actions(move_string: str, attack_string: str, side: int = 0) -> list
         A list of combined tokens, e.g. ['d+lp', 'dr+lp', 'r+lp'].
     """
     #print(f"[action_utils.combine_actions] Called with move_string='{move_string}', attack_string='{attack_string}', side={side}")
-    move_patterns = {
-        'qc': ['d', 'dr', 'r'],
-        'dp': ['r', 'd', 'dr'],
-        'hc': ['l', 'dl', 'd', 'dr', 'r']
-    }
-    if move_string in move_patterns:
-        m_seq = move_patterns[move_string]
+    if move_string in MOVE_PATTERNS:
+        m_seq = MOVE_PATTERNS[move_string]
     else:
         m_seq = [move_string]
     #print(f"[action_utils.combine_actions] Movement sequence: {m_seq}")
@@ -219,3 +233,271 @@ def decode_action_string(action_string: str, side: int = -1) -> list:
             action_sequence += raw_tokens
     #print(f"[action_utils.decode_action_string] Final decoded action sequence: {action_sequence}")
     return action_sequence
+
+
+def token_index(token: str) -> int:
+    """Return the action index of a 'dir+attack' token, or RANDOM_TOKEN if it has none."""
+    return BASE_ACTION_LOOKUP.get(token, RANDOM_TOKEN)
+
+class ComboProgram:
+    """
+    A combo string compiled once into index lists, so that sampling it only draws its random parts.
+
+    Sampling a program is equivalent to ``string_to_idx(decode_action_string(action_string, side))``:
+    the punch/kick strength, the hold duration, the repeat count and the side mirroring are
+    drawn or applied at sample time, and tokens unknown to BASE_ACTION_LOOKUP still become a
+    uniformly random action index, drawn anew for every occurrence.
+
+    Parameters
+    ----------
+    action_string : str
+        e.g. 'comb_qc_p/rep_p_0_8_t'
+    """
+
+    def __init__(self, action_string: str):
+        self.action_string = action_string
+        self.segments = []
+        for segment in action_string.split('/'):
+            parts = segment.split('_')
+            if parts[0] == 'comb':
+                self.segments.append(('comb', self._compile_comb(parts[1], parts[2])))
+            elif parts[0] == 'hold':
+                direction, min_frame, max_frame, release = parts[1:]
+                releases = [token_index(f"u+{attack}") for attack in ATTACK_CHOICES.get(release, [release])]
+                self.segments.append(('hold', token_index(f"{direction}+"), int(min_frame), int(max_frame),
+                                      releases if release else []))
+            elif parts[0] == 'rep':
+                attack_str, min_r, max_r, tap_str = parts[1:]
+                prefix = '+' if tap_str else ''
+                choices = [token_index(f"{prefix}{attack}") for attack in ATTACK_CHOICES.get(attack_str, [attack_str])]
+                self.segments.append(('rep', choices, int(min_r), int(max_r)))
+            elif parts[0] == 'raw':
+                self.segments.append(('raw', [token_index(token) for token in parts[1:]]))
+        self.max_length = sum(self._max_segment_length(segment) for segment in self.segments)
+        # The same segments with NumPy index arrays, for sample_batch.
+        self.batch_segments = [tuple(np.asarray(part, dtype=np.int64) if isinstance(part, list) else part
+                                     for part in segment) for segment in self.segments]
+        self.has_unknown = any(np.any(np.asarray(part) == RANDOM_TOKEN)
+                               for segment in self.batch_segments for part in segment[1:])
+        self.columns = np.arange(self.max_length)
+
+    @staticmethod
+    def _max_segment_length(segment: tuple) -> int:
+        """Return the longest sequence a compiled segment can produce."""
+        if segment[0] == 'comb':
+            return len(segment[1][0][0])
+        if segment[0] == 'hold':
+            return segment[3] // 4 + (1 if segment[4] else 0)
+        if segment[0] == 'rep':
+            return segment[3]
+        return len(segment[1])
+
+    @staticmethod
+    def _compile_comb(move_string: str, attack_string: str) -> list:
+        """Return the token indices of a 'comb' segment for [side][attack choice]."""
+        m_seq = MOVE_PATTERNS.get(move_string, [move_string])
+        table = []
+        for moves in (m_seq, [MIRROR_MAP.get(m, m) for m in m_seq]):
+            table.append([[token_index(f"{m}+") for m in moves[:-1]] + [token_index(f"{moves[-1]}+{attack}")]
+                          for attack in ATTACK_CHOICES.get(attack_string, [attack_string])])
+        return table
+
+    def sample(self, side: int = -1) -> list:
+        """
+        Draw one concrete action sequence from the program.
+
+        Parameters
+        ----------
+        side : int, optional
+            Side indicator (default -1); movements are mirrored when it is 1.
+
+        Returns
+        -------
+        list of int
+            The action indices, e.g. [55, 42, 35].
+        """
+        sequence = []
+        for segment in self.segments:
+            kind = segment[0]
+            if kind == 'comb':
+                choices = segment[1][1 if side == 1 else 0]
+                sequence += choices[np.random.randint(len(choices))] if len(choices) > 1 else choices[0]
+            elif kind == 'hold':
+                _, direction, min_f, max_f, releases = segment
+                sequence += [direction] * (np.random.randint(min_f, max_f + 1) // 4)
+                if releases:
+                    sequence.append(releases[np.random.randint(len(releases))] if len(releases) > 1 else releases[0])
+            elif kind == 'rep':
+                _, choices, min_r, max_r = segment
+                reps = np.random.randint(min_r, max_r + 1)
+                sequence += [choices[np.random.randint(len(choices))] if len(choices) > 1 else choices[0]] * reps
+            else:
+                sequence += segment[1]
+        unknown = sequence.count(RANDOM_TOKEN)
+        if unknown:
+            draws = iter(np.random.randint(0, len(BASE_ACTION_LOOKUP), size=unknown).tolist())
+            sequence = [next(draws) if idx == RANDOM_TOKEN else idx for idx in sequence]
+        return sequence
+
+    def sample_batch(self, sides: np.ndarray) -> tuple:
+        """
+        Draw one action sequence per entry of `sides`, with all random numbers drawn in one call.
+
+        Parameters
+        ----------
+        sides : np.ndarray
+            Side indicator of each sequence; movements are mirrored where it is 1.
+
+        Returns
+        -------
+        sequences : np.ndarray
+            (len(sides), max_length) action indices, each valid up to its length.
+        lengths : np.ndarray
+            The length of each sequence.
+        """
+        count = len(sides)
+        num_segments = len(self.batch_segments)
+        # Two uniforms per segment (a choice and a count), then one per position for unknown tokens.
+        draws = np.random.rand(count, 2 * num_segments + (self.max_length if self.has_unknown else 0))
+        sequences = np.zeros((count, self.max_length), dtype=np.int64)
+        # An int while every sequence has the same length so far, an array of lengths afterwards.
+        offset = 0
+        for i, segment in enumerate(self.batch_segments):
+            choice, amount = draws[:, 2 * i], draws[:, 2 * i + 1]
+            start = offset if isinstance(offset, int) else offset[:, None]
+            kind = segment[0]
+            if kind == 'comb' or kind == 'raw':
+                if kind == 'comb':
+                    table = segment[1]
+                    block = table[(sides == 1).astype(np.intp), (choice * table.shape[1]).astype(np.intp)]
+                else:
+                    block = segment[1]
+                width = block.shape[-1]
+                if isinstance(offset, int):
+                    sequences[:, offset:offset + width] = block
+                else:
+                    sequences[np.arange(count)[:, None], start + np.arange(width)] = block
+                offset = offset + width
+                continue
+            if kind == 'hold':
+                _, direction, min_f, max_f, releases = segment
+                runs = (min_f + (amount * (max_f - min_f + 1)).astype(np.int64)) // 4
+                values = direction
+            else:
+                _, choices, min_r, max_r = segment
+                runs = min_r + (amount * (max_r - min_r + 1)).astype(np.int64)
+                values = choices[(choice * len(choices)).astype(np.intp)][:, None]
+            run = (self.columns >= start) & (self.columns < start + runs[:, None])
+            sequences = np.where(run, values, sequences)
+            offset = offset + runs
+            if kind == 'hold' and releases.size:
+                sequences[np.arange(count), offset] = releases[(choice * len(releases)).astype(np.intp)]
+                offset += 1
+        if self.has_unknown:
+            unknown = (draws[:, 2 * num_segments:] * len(BASE_ACTION_LOOKUP)).astype(np.int64)
+            sequences = np.where(sequences == RANDOM_TOKEN, unknown, sequences)
+        return sequences, np.broadcast_to(offset, (count,))
+
+def build_alias_table(probs: np.ndarray) -> tuple:
+    """
+    Build an alias table (Vose's method) for sampling indices with the given probabilities.
+
+    Parameters
+    ----------
+    probs : np.ndarray
+        Probabilities summing to 1.
+
+    Returns
+    -------
+    accept : np.ndarray
+        Probability of keeping column i once it is drawn.
+    alias : np.ndarray
+        Index returned instead when column i is not kept.
+    """
+    size = len(probs)
+    scaled = np.asarray(probs, dtype=np.float64) * size
+    accept = np.ones(size)
+    alias = np.arange(size)
+    small = [i for i in range(size) if scaled[i] < 1.0]
+    large = [i for i in range(size) if scaled[i] >= 1.0]
+    while small and large:
+        less, more = small.pop(), large.pop()
+        accept[less] = scaled[less]
+        alias[less] = more
+        scaled[more] += scaled[less] - 1.0
+        (small if scaled[more] < 1.0 else large).append(more)
+    # Whatever is left only differs from 1 by rounding.
+    return accept, alias
+
+class MoveSampler:
+    """
+    Constant-time sampler of a character's moves, built once per (character, super_art).
+
+    The move probabilities are validated and normalized to sum to 1 (so a draw never falls
+    past the last move), then turned into an alias table: a draw costs one uniform number,
+    whatever the number of moves, and draws can be batched across many agents.
+
+    Parameters
+    ----------
+    character : str
+        Character name, e.g. 'Gouki'.
+    moves_dict : dict
+        The character's entry of CHARACTER_MOVES.
+    super_art : int
+        Super art index selecting the 'super_art' move's combo string.
+    """
+
+    def __init__(self, character: str, moves_dict: dict, super_art: int):
+        self.character = character
+        self.super_art = super_art
+        self.move_names = list(moves_dict)
+        self.action_strings = [params[f'combo_str_{super_art}'] if move_name == 'super_art' else params['combo_str']
+                               for move_name, params in moves_dict.items()]
+        probs = np.array([params['prob'] for params in moves_dict.values()], dtype=np.float64)
+        if not len(probs) or not np.isfinite(probs).all() or (probs < 0).any() or probs.sum() <= 0:
+            raise ValueError(f"Invalid move probabilities for character '{character}': {probs.tolist()}")
+        self.prob_sum = float(probs.sum())
+        self.probs = probs / self.prob_sum
+        self.accept, self.alias = build_alias_table(self.probs)
+        self.size = len(self.probs)
+        # (accept, alias) per column as Python numbers, for single draws.
+        self.columns = list(zip(self.accept.tolist(), self.alias.tolist()))
+
+    def table_probs(self) -> np.ndarray:
+        """Return the probability of every move under the alias table."""
+        probs = self.accept.copy()
+        np.add.at(probs, self.alias, 1.0 - self.accept)
+        return probs / self.size
+
+    def report(self) -> str:
+        """Return a one-line validation report of the move probabilities."""
+        deviation = abs(self.prob_sum - 1.0)
+        status = 'ok' if deviation <= PROB_TOLERANCE else f'off by {deviation:.3g}, normalized'
+        error = np.abs(self.table_probs() - self.probs).max()
+        return (f"{self.character} (super art {self.super_art}): {self.size} moves, "
+                f"probabilities sum to {self.prob_sum!r} ({status}), alias table max error {error:.1e}")
+
+    def sample(self) -> int:
+        """Draw the index of one move."""
+        scaled = np.random.rand() * self.size
+        column = int(scaled)
+        accept, alias = self.columns[column]
+        return column if scaled - column < accept else alias
+
+    def sample_batch(self, uniforms: np.ndarray) -> np.ndarray:
+        """Return the move index drawn by each of the given uniform numbers in [0, 1)."""
+        scaled = np.asarray(uniforms) * self.size
+        columns = scaled.astype(np.intp)
+        return np.where(scaled - columns < self.accept[columns], columns, self.alias[columns])
+
+def report_character_moves(environment_name: str = 'sfiii3n') -> str:
+    """
+    Validate the move probabilities of every character of an environment.
+
+    Returns
+    -------
+    str
+        One report line per character, e.g. "Gouki (super art 1): 10 moves, probabilities sum to ...".
+    """
+    return '\n'.join(MoveSampler(character, moves_dict, 1).report()
+                     for character, moves_dict in CHARACTER_MOVES[environment_name].items())
@@ -0,0 +1,230 @@
+"""
+batched_combo_injector.py
+
+Vectorized counterpart of ComboInjector for vectorized environments.
+The pending action queues of N environments live in preallocated NumPy buffers and
+the randomness of a step is drawn in vectorized calls, so the per-step cost does not
+grow with a Python loop over environments.
+"""
+
+import numpy as np
+from . import CHARACTER_MOVES, BASE_ACTION_LOOKUP, ACTION_TABLES
+from .action_utils import ComboProgram, MoveSampler
+from .combo_injector import JUMP_ACTIONS, MOVEMENT_ACTIONS
+
+# Action indices of the jump and ground movement tokens.
+JUMP_TABLE = np.array(JUMP_ACTIONS, dtype=np.int64)
+MOVEMENT_TABLE = np.array(MOVEMENT_ACTIONS, dtype=np.int64)
+
+# Longest movement-only sequence drawn by sample().
+MAX_MOVEMENT_REPEATS = 63
+
+class BatchedComboInjector:
+    def __init__(self, num_envs: int, environment_name: str = 'sfiii3n', mode: str = 'multi_discrete',
+                 frame_skip: int = 4, total_decay_steps: int = 0):
+        """
+        Initialize the BatchedComboInjector.
+
+        Parameters
+        ----------
+        num_envs : int
+            Number of environments (N) actions are generated for.
+        environment_name : str, optional
+            Name of the environment (default 'sfiii3n'). Used to select the correct character move definitions.
+        mode : str, optional
+            Action space the injected actions are encoded for: 'multi_discrete' (default),
+            'discrete' or 'multi_binary' (see ACTION_TABLES).
+        frame_skip : int, optional
+            Frame skip value that affects the duration of hold/charge combos (default 4).
+        total_decay_steps : int, optional
+            Total number of steps over which injection probability decays from 1.0 to 0.0.
+            If set to 0, decay is disabled and injection always occurs.
+        """
+        self.num_envs = num_envs
+        self.environment_name = environment_name
+        self.mode = mode
+        self.frame_skip = frame_skip
+
+        if self.mode not in ACTION_TABLES:
+            raise ValueError(f"Unsupported mode '{self.mode}', expected one of {list(ACTION_TABLES)}.")
+        # Encoding of every action index in this mode, row i for index i (shared, read-only).
+        self.action_table = ACTION_TABLES[self.mode]
+
+        # Variables for injection decay.
+        self.total_decay_steps = total_decay_steps
+        self.current_step = 0
+
+        # Compiled combo programs, indexed by the program ids of the move tables.
+        self.combo_programs = []
+        self.program_ids = {}
+
+        # Action category CDFs of sample(), per probability tuple.
+        self.category_cdfs = {}
+
+        # Move samplers per (character, super_art), and the validation report of the current envs.
+        self.move_samplers = {}
+        self.move_report = []
+
+        # Per-env alias tables of the move samplers and program ids of the moves, filled by reset().
+        self.move_count = None
+        self.move_accept = None
+        self.move_alias = None
+        self.move_programs = None
+
+        # Pending action queue of every env: a buffer row, a read cursor and a length.
+        # Sequences are only written once a queue is empty, so they always start at column 0.
+        self.queue = np.zeros((num_envs, MAX_MOVEMENT_REPEATS), dtype=np.int64)
+        self.cursor = np.zeros(num_envs, dtype=np.int64)
+        self.length = np.zeros(num_envs, dtype=np.int64)
+        self.envs = np.arange(num_envs)
+
+    def compile_combo(self, action_string: str) -> int:
+        """Return the program id of a combo string, compiling it on first use."""
+        program_id = self.program_ids.get(action_string)
+        if program_id is None:
+            program_id = self.program_ids[action_string] = len(self.combo_programs)
+            self.combo_programs.append(ComboProgram(action_string))
+        return program_id
+
+    def reset(self, characters, super_arts):
+        """
+        Reset or initialize the per-env move tables and clear the action queues.
+
+        Parameters
+        ----------
+        characters : list of str
+            Character name of each env (e.g. ['Alex', 'Gouki', ...]), N entries.
+        super_arts : list of int
+            Super art index of each env (e.g. [1, 2, ...]), N entries.
+        """
+        if len(characters) != self.num_envs or len(super_arts) != self.num_envs:
+            raise ValueError(f"Expected {self.num_envs} characters and super arts, "
+                             f"got {len(characters)} and {len(super_arts)}.")
+        samplers = []
+        for character, super_art in zip(characters, super_arts):
+            if character not in CHARACTER_MOVES[self.environment_name]:
+                raise NotImplementedError(f"Character '{character}' not supported for environment '{self.environment_name}'.")
+            if super_art not in [1, 2, 3]:
+                raise NotImplementedError(f"Super art '{super_art}' not supported.")
+            sampler = self.move_samplers.get((character, super_art))
+            if sampler is None:
+                moves_dict = CHARACTER_MOVES[self.environment_name][character]
+                sampler = self.move_samplers[(character, super_art)] = MoveSampler(character, moves_dict, super_art)
+            samplers.append(sampler)
+        self.move_report = sorted({sampler.report() for sampler in samplers})
+
+        # Pad the tables to the largest move list; padding columns are never drawn.
+        num_moves = max(sampler.size for sampler in samplers)
+        self.move_count = np.array([sampler.size for sampler in samplers])
+        self.move_accept = np.ones((self.num_envs, num_moves))
+        self.move_alias = np.zeros((self.num_envs, num_moves), dtype=np.intp)
+        self.move_programs = np.zeros((self.num_envs, num_moves), dtype=np.int64)
+        for env, sampler in enumerate(samplers):
+            self.move_accept[env, :sampler.size] = sampler.accept
+            self.move_alias[env, :sampler.size] = sampler.alias
+            self.move_programs[env, :sampler.size] = [self.compile_combo(action_string)
+                                                      for action_string in sampler.action_strings]
+
+        max_length = max([MAX_MOVEMENT_REPEATS] + [program.max_length for program in self.combo_programs])
+        if max_length > self.queue.shape[1]:
+            self.queue = np.zeros((self.num_envs, max_length), dtype=np.int64)
+        self.clear()
+
+    def clear(self, envs=slice(None)):
+        """Drop the pending actions of `envs` (indices or a mask, default every env)."""
+        self.cursor[envs] = 0
+        self.length[envs] = 0
+
+    def sample(self, obs, prob_jump=0.05, prob_basic=0.40, prob_combo=0.30,
+               prob_cancel=0.2, prob_movement=0.25) -> dict:
+        """
+        Generate the next action of every env.
+
+        Each env is injected with the decaying injection probability on its own, like one
+        ComboInjector per env would. Returns a dictionary with:
+          - 'index': (N,) action indices (BASE_ACTION_LOOKUP values).
+          - the injector's mode: the encoded actions, (N, 2) for 'multi_discrete',
+            (N,) for 'discrete' and (N, 14) for 'multi_binary'.
+          - 'injected': (N,) booleans, False where the env's own action should be used
+            (its rows above then hold action index 0).
+        If no env is injected this step, returns None.
+        """
+        # Compute injection probability (linearly decaying)
+        if self.total_decay_steps > 0:
+            injection_prob = max(0.0, 1.0 - self.current_step / self.total_decay_steps)
+        else:
+            injection_prob = 1.0
+
+        self.current_step += 1
+
+        if injection_prob >= 1.0:
+            injected = np.ones(self.num_envs, dtype=bool)
+            refill = (self.cursor >= self.length).nonzero()[0]
+        else:
+            injected = np.random.rand(self.num_envs) < injection_prob
+            if not injected.any():
+                return None
+            refill = (injected & (self.cursor >= self.length)).nonzero()[0]
+
+        probs = (prob_jump, prob_basic, prob_combo, prob_movement)
+        thresholds = self.category_cdfs.get(probs)
+        if thresholds is None:
+            raw_probs = np.array(probs)
+            raw_probs /= raw_probs.sum()
+            # The last CDF entry is 1.0; rolls past the first three are movements.
+            thresholds = self.category_cdfs[probs] = np.cumsum(raw_probs)[:3]
+
+        if refill.size:
+            self.refill(refill, self.sides(obs)[refill], thresholds, prob_cancel)
+
+        if injection_prob >= 1.0:
+            index = self.queue[self.envs, self.cursor]
+            self.cursor += 1
+        else:
+            envs = injected.nonzero()[0]
+            index = np.zeros(self.num_envs, dtype=np.int64)
+            index[envs] = self.queue[envs, self.cursor[envs]]
+            self.cursor[envs] += 1
+        return {'index': index, self.mode: self.action_table[index], 'injected': injected}
+
+    def sides(self, obs) -> np.ndarray:
+        """Return the side of every env from a (vectorized) observation's 'own_side'."""
+        side = np.asarray(obs.get("own_side", 0))
+        if side.ndim == 0:
+            return np.full(self.num_envs, int(side))
+        return side.reshape(self.num_envs, -1)[:, 0]
+
+    def refill(self, envs: np.ndarray, sides: np.ndarray, thresholds: np.ndarray, prob_cancel: float):
+        """Draw a new action sequence into the (empty) queues of `envs`, drawing the random numbers in one call."""
+        count = envs.size
+        # Category roll, basic action, jump/movement choice, movement repeats, move roll, cancel roll, cutoff.
+        draws = np.random.rand(count, 7)
+        # Same categories as ComboInjector.sample: jump, basic, combo, movement.
+        category = np.searchsorted(thresholds, draws[:, 0], side='right')
+        first = np.where(category == 0, JUMP_TABLE[(draws[:, 2] * len(JUMP_TABLE)).astype(np.intp)],
+                         (draws[:, 1] * len(BASE_ACTION_LOOKUP)).astype(np.int64))
+        movement = category == 3
+        first = np.where(movement, MOVEMENT_TABLE[(draws[:, 2] * len(MOVEMENT_TABLE)).astype(np.intp)], first)
+        lengths = np.where(movement, 12 + (draws[:, 3] * 52).astype(np.int64), 1)
+        # Basic, jump and movement sequences repeat their first action.
+        self.queue[envs] = first[:, None]
+
+        combo = (category == 2).nonzero()[0]
+        if combo.size:
+            combo_envs = envs[combo]
+            # One alias table draw per env, from the move roll.
+            scaled = draws[combo, 4] * self.move_count[combo_envs]
+            columns = scaled.astype(np.intp)
+            moves = np.where(scaled - columns < self.move_accept[combo_envs, columns], columns,
+                             self.move_alias[combo_envs, columns])
+            program_ids = self.move_programs[combo_envs, moves]
+            for program_id in set(program_ids.tolist()):
+                selected = program_ids == program_id
+                sequences, combo_lengths = self.combo_programs[program_id].sample_batch(sides[combo[selected]])
+                self.queue[combo_envs[selected], :sequences.shape[1]] = sequences
+                lengths[combo[selected]] = combo_lengths
+            cancel = combo[draws[combo, 5] < prob_cancel]
+            lengths[cancel] = 1 + (draws[cancel, 6] * lengths[cancel]).astype(np.int64)
+
+        self.cursor[envs] = 0
+        self.length[envs] = lengths
@@ -0,0 +1,141 @@
+"""
+ComboInjector sampling throughput with compiled combo programs (user-020).
+
+Four agents (Gouki, Ken, Alex and Dudley, super arts 1, 2, 3 and 2) are sampled with
+sample(), once as is and once with every agent starting a new sequence on each call
+(the case where combos are drawn), then a special combo is drawn with
+sample_character_special(), and reset() is timed last. Each figure is given for
+FormerComboInjector, an inline copy of the string-decoding reset(), sample() and
+sample_character_special() the combo programs replaced, and for ComboInjector.
+Rates are the best of 3.
+
+    python bench/bench_combo_programs.py
+"""
+
+import os
+import sys
+import time
+from collections import deque
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from ComboInjector import BASE_ACTION_LOOKUP, BASE_INPUT_LOOKUP, CHARACTER_MOVES
+from ComboInjector.combo_injector import ComboInjector
+from ComboInjector.action_utils import decode_action_string, string_to_idx
+
+CHARACTERS = ['Gouki', 'Ken', 'Alex', 'Dudley']
+SUPER_ARTS = [1, 2, 3, 2]
+OBS = {'own_side': np.array([1])}
+
+class FormerComboInjector(ComboInjector):
+    """The ComboInjector methods before the combo programs: every combo string is decoded on each draw."""
+    def reset(self, characters, super_arts):
+        self.agent_state = {}
+        for i, (character, super_art) in enumerate(zip(characters, super_arts)):
+            if character not in CHARACTER_MOVES[self.environment_name]:
+                raise NotImplementedError(f"Character '{character}' not supported for environment '{self.environment_name}'.")
+            if super_art not in [1, 2, 3]:
+                raise NotImplementedError(f"Super art '{super_art}' not supported.")
+            self.agent_state[f'agent_{i}'] = {
+                'move_sequence': deque(),
+                'character': character,
+                'super_art': super_art
+            }
+
+    def sample_character_special(self, player, obs):
+        character = self.agent_state[player]['character']
+        super_art = self.agent_state[player]['super_art']
+        player_side = obs.get("own_side", 0)
+        if isinstance(player_side, np.ndarray):
+            player_side = int(player_side[0])
+        if character not in CHARACTER_MOVES[self.environment_name]:
+            raise NotImplementedError(f"Character '{character}' not supported for environment '{self.environment_name}'.")
+        roll = np.random.rand()
+        moves_dict = CHARACTER_MOVES[self.environment_name][character]
+        prob_acc = 0.0
+        for move_name, params in moves_dict.items():
+            prob_acc += params['prob']
+            if roll <= prob_acc:
+                if move_name == 'super_art':
+                    action_str = params[f'combo_str_{super_art}']
+                else:
+                    action_str = params['combo_str']
+                return decode_action_string(action_str, side=player_side)
+        return [np.random.choice(list(BASE_ACTION_LOOKUP.keys()))]
+
+    def sample(self, obs, prob_jump=0.05, prob_basic=0.40, prob_combo=0.30,
+               prob_cancel=0.2, prob_movement=0.25):
+        if self.total_decay_steps > 0:
+            injection_prob = max(0.0, 1.0 - self.current_step / self.total_decay_steps)
+        else:
+            injection_prob = 1.0
+        self.current_step += 1
+        if np.random.rand() >= injection_prob:
+            return None
+
+        actions = {'discrete': {}, 'multi_discrete': {}}
+        raw_probs = np.array([prob_jump, prob_basic, prob_combo, prob_movement])
+        raw_probs /= raw_probs.sum()
+        cdfs = np.cumsum(raw_probs)
+        for agent_id in self.agent_state:
+            if not self.in_sequence(agent_id):
+                roll = np.random.rand()
+                if roll < cdfs[0]:
+                    seq_str = [np.random.choice(['ul+', 'u+', 'ur+'])]
+                elif roll < cdfs[1]:
+                    seq_str = [np.random.choice(list(BASE_ACTION_LOOKUP.keys()))]
+                elif roll < cdfs[2]:
+                    seq_str = self.sample_character_special(agent_id, obs)
+                    if np.random.rand() < prob_cancel:
+                        cutoff = np.random.randint(1, len(seq_str) + 1)
+                        seq_str = seq_str[:cutoff]
+                else:
+                    seq_str = [np.random.choice(['l+', 'dl+', 'd+', 'dr+', 'r+'])]
+                    num_repeats = np.random.randint(12, 64)
+                    seq_str = seq_str * num_repeats
+                self.agent_state[agent_id]['move_sequence'] = deque(string_to_idx(seq_str))
+            a_idx = self.agent_state[agent_id]['move_sequence'].popleft()
+            actions['discrete'][agent_id] = a_idx
+            actions['multi_discrete'][agent_id] = BASE_INPUT_LOOKUP[a_idx]
+        return actions
+
+def best_rate(function, calls, repeats=3):
+    """Returns the best calls/sec of `repeats` runs of `calls` calls of `function`."""
+    best = 0.0
+    for _ in range(repeats):
+        started = time.perf_counter()
+        for _ in range(calls):
+            function()
+        best = max(best, calls / (time.perf_counter() - started))
+    return best
+
+def bench(injector_class):
+    """Returns (sample(), fresh sample(), special combo calls/sec, reset() us) of an injector class."""
+    np.random.seed(1)
+    injector = injector_class()
+    injector.reset(CHARACTERS, SUPER_ARTS)
+
+    def fresh_sample():
+        for agent_state in injector.agent_state.values():
+            agent_state['move_sequence'].clear()
+        injector.sample(OBS)
+
+    rates = (best_rate(lambda: injector.sample(OBS), 50000), best_rate(fresh_sample, 20000),
+             best_rate(lambda: injector.sample_character_special('agent_0', OBS), 50000))
+    started = time.perf_counter()
+    for _ in range(1000):
+        injector.reset(CHARACTERS, SUPER_ARTS)
+    return rates + ((time.perf_counter() - started) * 1e3,)
+
+def main():
+    former, compiled = bench(FormerComboInjector), bench(ComboInjector)
+    print(f"{'':42}{'former':>10}{'compiled':>10}")
+    for row, unit, old, new in zip(['sample()', 'sample(), every agent starting a sequence',
+                                    'sample_character_special()', 'reset()'],
+                                   ['calls/s'] * 3 + ['us'], former, compiled):
+        digits = 1 if unit == 'us' else 0
+        print(f"{row:42}{old:10,.{digits}f}{new:10,.{digits}f} {unit}")
+
+if __name__ == '__main__':
+    main()
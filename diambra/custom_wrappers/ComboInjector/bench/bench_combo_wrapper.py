@@ -0,0 +1,71 @@
+"""
+ComboWrapper agent-step throughput over an env that costs 1 ms of CPU per step (user-022).
+
+The stand-in env has DIAMBRA's MultiDiscrete([9, 7]) action space and an own_side
+observation, and busy-waits 1 ms per step like a fast emulator frame batch. ComboWrapper
+(Ken, super art 2, no decay) is compared with the wrapper it replaced, which stepped the
+env once with a random action to get an observation for the injector before stepping it
+with the real action. Prints agent steps/sec and env steps per agent step.
+
+    python bench/bench_combo_wrapper.py [--steps 3000]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import gymnasium as gym
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from ComboInjector.combo_wrapper import ComboWrapper
+
+class StandInEnv(gym.Env):
+    """Burns ~1 ms of CPU per step and counts its steps; the side switches every 500 frames."""
+
+    observation_space = gym.spaces.Dict({'own_side': gym.spaces.Discrete(2)})
+    action_space = gym.spaces.MultiDiscrete([9, 7])
+    episode_frames = 3000
+
+    def __init__(self):
+        self.steps = 0
+        self.frames = 0
+
+    def reset(self, seed=None, options=None):
+        self.frames = 0
+        return {'own_side': np.array([0])}, {}
+
+    def step(self, action):
+        end = time.perf_counter() + 0.001
+        while time.perf_counter() < end:
+            pass
+        self.steps += 1
+        self.frames += 1
+        return {'own_side': np.array([self.frames // 500 % 2])}, 0.0, self.frames >= self.episode_frames, False, {}
+
+class DoubleStepComboWrapper(ComboWrapper):
+    """The former step(): an extra env step with a random action feeds the injector its observation."""
+
+    def step(self, action):
+        self.last_obs, *_ = self.env.step(self.env.action_space.sample())
+        return super().step(action)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--steps', type=int, default=3000, help='Agent steps per wrapper (default: 3000)')
+    args = parser.parse_args()
+    for name, wrapper in (('double-step wrapper', DoubleStepComboWrapper), ('ComboWrapper', ComboWrapper)):
+        env = StandInEnv()
+        wrapped = wrapper(env, ['Ken'], [2], {'environment_name': 'sfiii3n', 'total_decay_steps': 0})
+        wrapped.reset()
+        started = time.perf_counter()
+        for _ in range(args.steps):
+            *_, terminated, truncated, _ = wrapped.step(np.array([0, 0]))
+            if terminated or truncated:
+                wrapped.reset()
+        seconds = time.perf_counter() - started
+        print(f"{name:20s} {args.steps / seconds:6,.0f} agent steps/s, {env.steps / args.steps:.2f} env steps per agent step")
+
+if __name__ == '__main__':
+    main()
@@ -8,8 +8,12 @@ Also implements a decay mechanism so that the injected combo probability decreas
 
 from collections import deque
 import numpy as np
-from . import BASE_MOVEMENTS, BASE_ATTACKS, CHARACTER_MOVES, BASE_ACTION_LOOKUP, BASE_INPUT_LOOKUP
-from .action_utils import decode_action_string, string_to_idx
+from . import BASE_MOVEMENTS, BASE_ATTACKS, CHARACTER_MOVES, BASE_ACTION_LOOKUP, BASE_INPUT_LOOKUP, ACTION_TABLES
+from .action_utils import ComboProgram, MoveSampler, string_to_idx
+
+# Action indices of the jump and ground movement tokens sample() draws from.
+JUMP_ACTIONS = [BASE_ACTION_LOOKUP[token] for token in ['ul+', 'u+', 'ur+']]
+MOVEMENT_ACTIONS = [BASE_ACTION_LOOKUP[token] for token in ['l+', 'dl+', 'd+', 'dr+', 'r+']]
 
 class ComboInjector:
     def __init__(self, environment_name: str = 'sfiii3n', mode: str = 'multi_discrete',
@@ -22,7 +26,8 @@ class ComboInjector:
         environment_name : str, optional
             Name of the environment (default 'sfiii3n'). Used to select the correct character move definitions.
         mode : str, optional
-            Action mode (currently only 'multi_discrete' is supported).
+            Action space the injected actions are encoded for: 'multi_discrete' (default),
+            'discrete' or 'multi_binary' (see ACTION_TABLES).
         frame_skip : int, optional
             Frame skip value that affects the duration of hold/charge combos (default 4).
         total_decay_steps : int, optional
@@ -34,8 +39,10 @@ class ComboInjector:
         self.mode = mode
         self.frame_skip = frame_skip
 
-        if self.mode != 'multi_discrete':
-            raise ValueError("Only 'multi_discrete' mode is currently supported.")
+        if self.mode not in ACTION_TABLES:
+            raise ValueError(f"Unsupported mode '{self.mode}', expected one of {list(ACTION_TABLES)}.")
+        # Encoding of every action index in this mode (shared, read-only).
+        self.action_table = ACTION_TABLES[self.mode]
 
         # Variables for injection decay.
         self.total_decay_steps = total_decay_steps
@@ -44,27 +51,24 @@ class ComboInjector:
         # Per-agent state dictionary.
         self.agent_state = {}
 
-        # Copy base definitions.
-        self.base_movement_names = BASE_MOVEMENTS.copy()
-        self.base_attack_names = BASE_ATTACKS.copy()
+        # Combo strings compiled into ComboPrograms, shared by all agents and resets.
+        self.combo_programs = {}
 
-        # Build a flattened list of all possible "movement+attack" combos.
-        self._base_actions = []
-        for move in self.base_movement_names:
-            for attack in self.base_attack_names:
-                self._base_actions.append(f"{move}+{attack}")
-        #print(f"[ComboInjector] Built _base_actions with {len(self._base_actions)} entries.")
+        # Move samplers per (character, super_art), and the validation report of the current agents.
+        self.move_samplers = {}
+        self.move_report = []
 
-        # Mapping: combo string -> index.
-        self.action_idx_lookup = {combo: i for i, combo in enumerate(self._base_actions)}
-        #print(f"[ComboInjector] Action mappings built. Total action space size: {len(self.action_idx_lookup)}")
+        # Action category CDFs of sample(), per probability tuple.
+        self.category_cdfs = {}
 
-        # Reverse mapping: index -> multi-discrete array.
-        self.input_lookup = {}
-        for combo_str, idx in self.action_idx_lookup.items():
-            move_part, attack_part = combo_str.split('+')
-            self.input_lookup[idx] = (self.base_movement_names[move_part] + self.base_attack_names[attack_part]).tolist()
-        #print("[ComboInjector] Movement patterns initialized.")
+        # Base definitions and action mappings, shared with the package instead of rebuilt per instance.
+        self.base_movement_names = BASE_MOVEMENTS
+        self.base_attack_names = BASE_ATTACKS
+        self._base_actions = list(BASE_ACTION_LOOKUP)
+        # Mapping: combo string -> index.
+        self.action_idx_lookup = BASE_ACTION_LOOKUP
+        # Reverse mapping: index -> multi-discrete list.
+        self.input_lookup = BASE_INPUT_LOOKUP
 
         # Additional attributes for movement patterns.
         self.move_pattern_names = {
@@ -108,18 +112,38 @@ class ComboInjector:
         """
         #print("[ComboInjector] Resetting agent states...")
         self.agent_state = {}
+        self.move_report = []
         for i, (character, super_art) in enumerate(zip(characters, super_arts)):
             if character not in CHARACTER_MOVES[self.environment_name]:
                 raise NotImplementedError(f"Character '{character}' not supported for environment '{self.environment_name}'.")
             if super_art not in [1, 2, 3]:
                 raise NotImplementedError(f"Super art '{super_art}' not supported.")
+            sampler = self.move_sampler(character, super_art)
+            self.move_report.append(sampler.report())
             self.agent_state[f'agent_{i}'] = {
                 'move_sequence': deque(),
                 'character': character,
-                'super_art': super_art
+                'super_art': super_art,
+                'move_sampler': sampler,
+                'move_programs': [self.compile_combo(action_string) for action_string in sampler.action_strings],
             }
             #print(f"[ComboInjector] Agent_{i} set to character '{character}' with super_art {super_art}.")
 
+    def move_sampler(self, character: str, super_art: int) -> MoveSampler:
+        """Return the move sampler of a character and super art, building it on first use."""
+        sampler = self.move_samplers.get((character, super_art))
+        if sampler is None:
+            moves_dict = CHARACTER_MOVES[self.environment_name][character]
+            sampler = self.move_samplers[(character, super_art)] = MoveSampler(character, moves_dict, super_art)
+        return sampler
+
+    def compile_combo(self, action_string: str) -> ComboProgram:
+        """Return the ComboProgram of a combo string, compiling it on first use."""
+        program = self.combo_programs.get(action_string)
+        if program is None:
+            program = self.combo_programs[action_string] = ComboProgram(action_string)
+        return program
+
     def in_sequence(self, player: str) -> bool:
         """Return True if the specified agent has queued moves."""
         return len(self.agent_state[player]['move_sequence']) > 0
@@ -135,46 +159,30 @@ class ComboInjector:
         
         Returns
         -------
-        list of str
-            A list of combo tokens (e.g. ['d+lp', 'dr+lp', 'r+lp']).
+        list of int
+            The action indices of the combo (e.g. [55, 42, 35] for ['d+lp', 'dr+lp', 'r+lp']).
         """
         #print(f"[ComboInjector] Sampling special combo for {player}.")
-        character = self.agent_state[player]['character']
-        super_art = self.agent_state[player]['super_art']
+        state = self.agent_state[player]
         player_side = obs.get("own_side", 0)
 
         # ✅ Ensure player_side is a single integer
         if isinstance(player_side, np.ndarray):
             player_side = int(player_side[0])  # Get first element if it's an array
 
-
-        if character not in CHARACTER_MOVES[self.environment_name]:
-            raise NotImplementedError(f"Character '{character}' not supported for environment '{self.environment_name}'.")
-        roll = np.random.rand()
-        moves_dict = CHARACTER_MOVES[self.environment_name][character]
-        prob_acc = 0.0
-        for move_name, params in moves_dict.items():
-            prob_acc += params['prob']
-            if roll <= prob_acc:
-                if move_name == 'super_art':
-                    combo_key = f'combo_str_{super_art}'
-                    action_str = params[combo_key]
-                else:
-                    action_str = params['combo_str']
-                decoded = decode_action_string(action_str, side=player_side)  
-                #print(f"[ComboInjector] Selected special combo: {decoded}")
-                return decoded
-        fallback = [np.random.choice(list(BASE_ACTION_LOOKUP.keys()))]
-        #print(f"[ComboInjector] No combo selected; falling back to: {fallback}")
-        return fallback
+        move = state['move_sampler'].sample()
+        decoded = state['move_programs'][move].sample(side=player_side)
+        #print(f"[ComboInjector] Selected special combo: {decoded}")
+        return decoded
 
     def sample(self, obs, prob_jump=0.05, prob_basic=0.40, prob_combo=0.30,
             prob_cancel=0.2, prob_movement=0.25) -> dict:
         """
         Generate the next action(s) for all agents.
         Returns a dictionary with:
-          - 'discrete': mapping from agent ID to an integer action index.
-          - 'multi_discrete': mapping from agent ID to the corresponding multi-discrete action array.
+          - 'index': mapping from agent ID to an integer action index (a BASE_ACTION_LOOKUP value).
+          - the injector's mode ('multi_discrete', 'discrete' or 'multi_binary'): mapping from agent ID
+            to the encoded action, a read-only row of the mode's ACTION_TABLES entry.
         If the injection has decayed (based on the step count), returns None.
         """
         # Compute injection probability (linearly decaying)
@@ -189,10 +197,13 @@ class ComboInjector:
         if np.random.rand() >= injection_prob:
             return None
 
-        actions = {'discrete': {}, 'multi_discrete': {}}
-        raw_probs = np.array([prob_jump, prob_basic, prob_combo, prob_movement])
-        raw_probs /= raw_probs.sum()
-        cdfs = np.cumsum(raw_probs)
+        actions = {'index': {}, self.mode: {}}
+        probs = (prob_jump, prob_basic, prob_combo, prob_movement)
+        cdfs = self.category_cdfs.get(probs)
+        if cdfs is None:
+            raw_probs = np.array(probs)
+            raw_probs /= raw_probs.sum()
+            cdfs = self.category_cdfs[probs] = np.cumsum(raw_probs).tolist()
         #print("[ComboInjector] Action category CDFs:", cdfs)
 
         for i, agent_id in enumerate(self.agent_state):
@@ -200,30 +211,27 @@ class ComboInjector:
                 roll = np.random.rand()
                 #print(f"[ComboInjector] Agent '{agent_id}' move_sequence empty. Roll = {roll}")
                 if roll < cdfs[0]:
-                    seq_str = [np.random.choice(['ul+', 'u+', 'ur+'])]
-                    #print(f"[ComboInjector] Jump action chosen: {seq_str}")
+                    seq_idx = [JUMP_ACTIONS[np.random.randint(len(JUMP_ACTIONS))]]
+                    #print(f"[ComboInjector] Jump action chosen: {seq_idx}")
                 elif roll < cdfs[1]:
-                    seq_str = [np.random.choice(list(BASE_ACTION_LOOKUP.keys()))]
-                    #print(f"[ComboInjector] Basic action chosen: {seq_str}")
+                    seq_idx = [np.random.randint(len(BASE_ACTION_LOOKUP))]
+                    #print(f"[ComboInjector] Basic action chosen: {seq_idx}")
                 elif roll < cdfs[2]:
-                    seq_str = self.sample_character_special(agent_id, obs)
+                    seq_idx = self.sample_character_special(agent_id, obs)
                     if np.random.rand() < prob_cancel:
-                        cutoff = np.random.randint(1, len(seq_str) + 1)
-                        seq_str = seq_str[:cutoff]
-                        #print(f"[ComboInjector] Combo cancelled early. New sequence: {seq_str}")
+                        cutoff = np.random.randint(1, len(seq_idx) + 1)
+                        seq_idx = seq_idx[:cutoff]
+                        #print(f"[ComboInjector] Combo cancelled early. New sequence: {seq_idx}")
                 else:
-                    seq_str = [np.random.choice(['l+', 'dl+', 'd+', 'dr+', 'r+'])]
+                    seq_idx = [MOVEMENT_ACTIONS[np.random.randint(len(MOVEMENT_ACTIONS))]]
                     num_repeats = np.random.randint(12, 64)
-                    seq_str = seq_str * num_repeats
-                    #print(f"[ComboInjector] Movement-based action chosen: {seq_str}")
-                seq_idx = string_to_idx(seq_str)
-                #print(f"[ComboInjector] Converted tokens {seq_str} to indices {seq_idx}")
+                    seq_idx = seq_idx * num_repeats
+                    #print(f"[ComboInjector] Movement-based action chosen: {seq_idx}")
                 self.agent_state[agent_id]['move_sequence'] = deque(seq_idx)
             a_idx = self.agent_state[agent_id]['move_sequence'].popleft()
-            a_multi = BASE_INPUT_LOOKUP[a_idx]
-            #print(f"[ComboInjector] Agent '{agent_id}' action: index={a_idx}, multi_discrete={a_multi}")
-            actions['discrete'][agent_id] = a_idx
-            actions['multi_discrete'][agent_id] = a_multi
+            #print(f"[ComboInjector] Agent '{agent_id}' action: index={a_idx}, {self.mode}={self.action_table[a_idx]}")
+            actions['index'][agent_id] = a_idx
+            actions[self.mode][agent_id] = self.action_table[a_idx]
 
         return actions
 
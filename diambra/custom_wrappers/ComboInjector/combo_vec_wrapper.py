@@ -0,0 +1,87 @@
+"""
+combo_vec_wrapper.py
+
+A Stable-Baselines3 VecEnvWrapper that injects combo actions for all environments at once.
+It runs in the learner process on the batched observation dict, so a single BatchedComboInjector
+serves every env (instead of one ComboInjector per worker process), and the injection decays
+with one global step counter: the model's num_timesteps.
+"""
+
+import numpy as np
+from stable_baselines3.common.vec_env import VecEnvWrapper
+
+from .batched_combo_injector import BatchedComboInjector
+
+class ComboVecEnvWrapper(VecEnvWrapper):
+    def __init__(self, venv, characters, super_arts, injector_kwargs=None, model=None):
+        """
+        Initialize the ComboVecEnvWrapper.
+
+        Parameters
+        ----------
+        venv : VecEnv
+            The vectorized environment to wrap (e.g. the one returned by make_sb3_env).
+        characters : list of str
+            Character name of each env (e.g. ['Ken'] * num_envs).
+        super_arts : list of int
+            Super art index of each env (e.g. [2] * num_envs).
+        injector_kwargs : dict, optional
+            Additional keyword arguments for BatchedComboInjector (e.g., {"environment_name": "sfiii3n", "total_decay_steps": 32000000}).
+            `total_decay_steps` counts model timesteps, summed over all envs.
+        model : BaseAlgorithm, optional
+            The model trained on this env; its num_timesteps drives the decay. Can also be set later
+            with set_model(). Without a model the wrapper counts the timesteps it stepped itself.
+        """
+        super().__init__(venv)
+        if injector_kwargs is None:
+            injector_kwargs = {}
+        self.injector = BatchedComboInjector(self.num_envs, **injector_kwargs)
+        self.injector.reset(characters, super_arts)
+        self.model = model
+        self.num_timesteps = 0
+        # Latest batched observation from reset()/step_wait(), used to sample the injected actions.
+        self.last_obs = {}
+        # Env slots whose action was overridden by the last step.
+        self.injected = np.zeros(self.num_envs, dtype=bool)
+
+    def set_model(self, model):
+        """Tie the decay schedule to `model.num_timesteps` (e.g. after PPO.load)."""
+        self.model = model
+
+    def reset(self):
+        """Reset all environments and clear the injector's action queues."""
+        self.injector.clear()
+        obs = self.venv.reset()
+        self.last_obs = obs
+        return obs
+
+    def step_async(self, actions):
+        """Override the actions of the injected env slots, then step all environments."""
+        if self.model is not None:
+            self.num_timesteps = self.model.num_timesteps
+        self.injector.current_step = self.num_timesteps
+        injected = self.injector.sample(self.last_obs)
+        if injected is None:
+            # Injection has decayed; every env uses the agent's action.
+            self.injected = np.zeros(self.num_envs, dtype=bool)
+        else:
+            self.injected = injected['injected']
+            actions = np.array(actions, copy=True)
+            actions[self.injected] = injected[self.injector.mode][self.injected]
+        self.venv.step_async(actions)
+
+    def step_wait(self):
+        """
+        Wait for the step of all environments.
+
+        Each info dictionary gets a 'combo_injected' flag telling whether that env's action
+        was overridden; the queues of envs whose episode ended are cleared.
+        """
+        obs, rewards, dones, infos = self.venv.step_wait()
+        self.num_timesteps += self.num_envs
+        self.last_obs = obs
+        for env, info in enumerate(infos):
+            info['combo_injected'] = bool(self.injected[env])
+        if dones.any():
+            self.injector.clear(dones.nonzero()[0])
+        return obs, rewards, dones, infos
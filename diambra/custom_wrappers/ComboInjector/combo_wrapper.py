@@ -4,6 +4,8 @@ combo_wrapper.py
 A Gymnasium wrapper that uses ComboInjector to modify the actions passed to the environment.
 It replaces the agent’s action with a combo action generated by the injector if injection is active,
 and otherwise falls back to the agent's original action.
+The injector samples from the latest observation returned by reset/step, so every agent step
+is exactly one environment step.
 """
 
 import gymnasium as gym
@@ -34,6 +36,8 @@ class ComboWrapper(gym.Wrapper):
             injector_kwargs = {}
         self.injector = ComboInjector(**injector_kwargs)
         self.injector.reset(characters, super_arts)
+        # Latest observation from reset()/step(), used to sample the injected action.
+        self.last_obs = {}
         # Optionally adjust the underlying environment’s action space here if needed.
 
     def step(self, action):
@@ -41,22 +45,18 @@ class ComboWrapper(gym.Wrapper):
         Override the step() function to inject combo actions if injection is active.
         
         The passed action is replaced with an injected combo action when the injection probability hasn't decayed.
-        Once the injection decays, the agent's original action is used.
+        Once the injection decays, the agent's original action is used. The injected action is sampled from
+        the observation the previous reset()/step() returned, so the environment is stepped only once.
 
         Returns
         -------
         obs, reward, terminated, truncated, info : tuple
             The observation, reward, termination flag, truncation flag, and info dictionary.
         """
-
-        # Take a step with a NO-OP action (only if allowed in your environment)
-        original_obs, *_= self.env.step(self.env.action_space.sample())  
-
-
         # Try to get an injected action.
-        injected = self.injector.sample(original_obs)
+        injected = self.injector.sample(self.last_obs)
         if injected is not None:
-            modified_action = injected['multi_discrete']
+            modified_action = injected[self.injector.mode]
             if isinstance(modified_action, dict):
                 # For multi-agent environments, extract the single-agent action.
                 modified_action = list(modified_action.values())[0]
@@ -75,6 +75,7 @@ class ComboWrapper(gym.Wrapper):
         else:
             obs, reward, terminated, truncated, info = step_result
 
+        self.last_obs = obs
         return obs, reward, terminated, truncated, info
 
     def reset(self, **kwargs):
@@ -88,5 +89,7 @@ class ComboWrapper(gym.Wrapper):
         """
         for agent in self.injector.agent_state:
             self.injector.agent_state[agent]['move_sequence'] = deque()
-        obs = self.env.reset(**kwargs)
-        return obs
+        reset_result = self.env.reset(**kwargs)
+        # Gymnasium returns (obs, info); older APIs return the observation alone.
+        self.last_obs = reset_result[0] if isinstance(reset_result, tuple) else reset_result
+        return reset_result
@@ -0,0 +1,207 @@
+"""
+Tests of the ComboInjector package: the shared action encoding tables, the injectors'
+sample() results in every action mode, the wrappers stepping a stand-in env, and the
+vectorized combo sampling against the string decoder and the per-env injector.
+
+Run with `python -m pytest -q` from this directory.
+"""
+
+import collections
+
+import gymnasium as gym
+import numpy as np
+import pytest
+
+from ComboInjector import (ACTION_TABLES, BASE_ACTION_LOOKUP, BASE_ATTACKS, BASE_MOVEMENTS, DISCRETE_ACTIONS,
+                           MULTI_BINARY_ACTIONS, MULTI_DISCRETE_ACTIONS)
+from ComboInjector.action_utils import ComboProgram, decode_action_string, string_to_idx
+from ComboInjector.batched_combo_injector import BatchedComboInjector
+from ComboInjector.combo_injector import ComboInjector
+from ComboInjector.combo_wrapper import ComboWrapper
+
+MODES = tuple(ACTION_TABLES)
+# DIAMBRA action spaces of the sfiii3n moves (9, including the no-op) and attacks (7).
+ACTION_SPACES = {
+    'multi_discrete': gym.spaces.MultiDiscrete([9, 7]),
+    'discrete': gym.spaces.Discrete(15),
+    'multi_binary': gym.spaces.MultiBinary(14),
+}
+CHARACTERS = ['Gouki', 'Ken', 'Alex', 'Dudley']
+SUPER_ARTS = [1, 2, 3, 2]
+
+@pytest.fixture(autouse=True)
+def seeded():
+    np.random.seed(0)
+
+def test_action_tables_encode_every_action_index():
+    assert set(ACTION_TABLES) == {'multi_discrete', 'discrete', 'multi_binary'}
+    for token, index in BASE_ACTION_LOOKUP.items():
+        move, attack = token.split('+')
+        move_value, attack_value = BASE_MOVEMENTS[move][0], BASE_ATTACKS[attack][1]
+        assert MULTI_DISCRETE_ACTIONS[index].tolist() == [move_value, attack_value]
+        assert DISCRETE_ACTIONS[index] == (attack_value + 8 if attack_value else move_value)
+        buttons = np.zeros(14, dtype=np.int8)
+        if move_value:
+            buttons[move_value - 1] = 1
+        if attack_value:
+            buttons[8 + attack_value - 1] = 1
+        assert MULTI_BINARY_ACTIONS[index].tolist() == buttons.tolist()
+
+def test_action_tables_are_read_only():
+    for table in ACTION_TABLES.values():
+        with pytest.raises(ValueError):
+            table[0] = 1
+
+@pytest.mark.parametrize('mode', MODES)
+def test_sample_returns_indices_and_their_encoding(mode):
+    injector = ComboInjector(mode=mode)
+    injector.reset(CHARACTERS, SUPER_ARTS)
+    for _ in range(500):
+        actions = injector.sample({'own_side': np.array([1])})
+        assert set(actions) == {'index', mode}
+        assert set(actions['index']) == set(actions[mode]) == {f"agent_{i}" for i in range(len(CHARACTERS))}
+        for agent, index in actions['index'].items():
+            assert np.array_equal(actions[mode][agent], ACTION_TABLES[mode][index])
+            assert ACTION_SPACES[mode].contains(actions[mode][agent])
+
+@pytest.mark.parametrize('mode', MODES)
+def test_batched_sample_returns_indices_and_their_encoding(mode):
+    injector = BatchedComboInjector(8, mode=mode)
+    injector.reset(CHARACTERS * 2, SUPER_ARTS * 2)
+    obs = {'own_side': (np.arange(8) % 2)[:, None]}
+    for _ in range(500):
+        actions = injector.sample(obs)
+        assert set(actions) == {'index', mode, 'injected'}
+        assert actions['index'].shape == (8,) and actions['injected'].all()
+        assert actions[mode].shape == (8,) + ACTION_TABLES[mode].shape[1:]
+        assert np.array_equal(actions[mode], ACTION_TABLES[mode][actions['index']])
+        assert all(ACTION_SPACES[mode].contains(action) for action in actions[mode])
+
+def test_unknown_modes_are_rejected():
+    with pytest.raises(ValueError):
+        ComboInjector(mode='box')
+    with pytest.raises(ValueError):
+        BatchedComboInjector(4, mode='box')
+
+class StandInEnv(gym.Env):
+    """Checks that every action it gets belongs to its action space, and counts them."""
+    observation_space = gym.spaces.Dict({'own_side': gym.spaces.Discrete(2)})
+
+    def __init__(self, mode):
+        self.action_space = ACTION_SPACES[mode]
+        self.steps = 0
+
+    def reset(self, seed=None, options=None):
+        super().reset(seed=seed)
+        return {'own_side': np.array([0])}, {}
+
+    def step(self, action):
+        assert self.action_space.contains(action), action
+        self.steps += 1
+        return {'own_side': np.array([self.steps // 50 % 2])}, 0.0, self.steps % 300 == 0, False, {}
+
+@pytest.mark.parametrize('mode', MODES)
+def test_combo_wrapper_steps_the_env_in_each_mode(mode):
+    env = StandInEnv(mode)
+    wrapped = ComboWrapper(env, ['Ken'], [2], {'mode': mode})
+    wrapped.reset()
+    for _ in range(1000):
+        *_, terminated, truncated, _ = wrapped.step(env.action_space.sample())
+        if terminated or truncated:
+            wrapped.reset()
+    assert env.steps == 1000
+
+@pytest.mark.parametrize('mode', MODES)
+def test_combo_vec_wrapper_steps_the_envs_in_each_mode(mode):
+    vec_env = pytest.importorskip('stable_baselines3.common.vec_env')
+    from ComboInjector.combo_vec_wrapper import ComboVecEnvWrapper
+    envs = [StandInEnv(mode) for _ in range(4)]
+    venv = vec_env.DummyVecEnv([lambda env=env: env for env in envs])
+    wrapped = ComboVecEnvWrapper(venv, ['Ken', 'Gouki', 'Alex', 'Dudley'], [2, 1, 3, 2], {'mode': mode})
+    wrapped.reset()
+    for _ in range(500):
+        _, _, _, infos = wrapped.step(np.array([envs[0].action_space.sample() for _ in envs]))
+        assert all(info['combo_injected'] for info in infos)
+    assert [env.steps for env in envs] == [500] * 4
+
+# Combo strings covering every segment kind: comb (known and unknown move patterns), hold
+# (with and without a release), rep (tapped, plain, unknown attack) and raw, alone and chained.
+COMBO_STRINGS = [
+    'comb_qc_p', 'comb_hc_lk', 'comb_fdp_k', 'hold_d_16_64_k', 'hold_b_22_64_', 'hold_d_8_20_mp',
+    'rep_p_0_8_t', 'rep_mpk_0_2_t', 'rep_lp_3_5_', 'raw_+lp_+_+lp', 'comb_dp_k/raw_+lp',
+    'raw_+lp_+_+lp/comb_f_/raw_+lk_+_+hp', 'comb_qc_p/rep_p_0_12_t', 'hold_d_16_64_k/comb_qc_k/rep_k_1_3_',
+]
+SAMPLES = 4000
+
+def total_variation(a, b):
+    total_a, total_b = sum(a.values()), sum(b.values())
+    return sum(abs(a[key] / total_a - b[key] / total_b) for key in a.keys() | b.keys()) / 2
+
+def distributions(sequences):
+    """Length, token and last-token histograms of action index sequences."""
+    lengths = collections.Counter(map(len, sequences))
+    tokens = collections.Counter(index for sequence in sequences for index in sequence)
+    last = collections.Counter(sequence[-1] for sequence in sequences if sequence)
+    return lengths, tokens, last
+
+def assert_same_distribution(reference, sequences, tolerance):
+    for expected, got in zip(distributions(reference), distributions(sequences)):
+        assert total_variation(expected, got) < tolerance
+
+@pytest.mark.parametrize('action_string', COMBO_STRINGS)
+@pytest.mark.parametrize('side', [0, 1])
+def test_combo_programs_sample_like_decoded_strings(action_string, side):
+    program = ComboProgram(action_string)
+    reference = [string_to_idx(decode_action_string(action_string, side)) for _ in range(SAMPLES)]
+    single = [program.sample(side) for _ in range(SAMPLES)]
+    rows, lengths = program.sample_batch(np.full(SAMPLES, side))
+    batch = [row[:length].tolist() for row, length in zip(rows, lengths)]
+    # Unknown tokens are uniform over 63 indices, so their histograms are the noisiest (TV ~0.08 here).
+    tolerance = 0.12 if program.has_unknown else 0.06
+    assert_same_distribution(reference, single, tolerance)
+    assert_same_distribution(reference, batch, tolerance)
+    if not program.has_unknown:
+        # Few enough possible sequences for the reference samples to cover them all.
+        possible = set(map(tuple, reference))
+        assert set(map(tuple, single)) <= possible
+        assert set(map(tuple, batch)) <= possible
+
+def test_sample_batch_mixes_sides_row_by_row():
+    program = ComboProgram('hold_d_16_64_k/comb_qc_p/rep_p_0_4_t')
+    sides = np.arange(SAMPLES) % 2
+    rows, lengths = program.sample_batch(sides)
+    possible = {side: set(tuple(string_to_idx(decode_action_string(program.action_string, side)))
+                          for _ in range(20 * SAMPLES)) for side in (0, 1)}
+    for row, length, side in zip(rows, lengths, sides):
+        assert tuple(row[:length].tolist()) in possible[side]
+
+def test_batched_injector_samples_like_per_env_injectors():
+    combos_only = {'prob_jump': 0.0, 'prob_basic': 0.0, 'prob_combo': 1.0, 'prob_movement': 0.0}
+    characters, super_arts = CHARACTERS * 4, SUPER_ARTS * 4
+    sides = (np.arange(len(characters)) % 2)[:, None]
+    steps = 3000
+
+    injectors = []
+    for character, super_art in zip(characters, super_arts):
+        injector = ComboInjector()
+        injector.reset([character], [super_art])
+        injectors.append(injector)
+    per_env_actions, per_env_lengths = collections.Counter(), collections.Counter()
+    for _ in range(steps):
+        for env, injector in enumerate(injectors):
+            fresh = not injector.in_sequence('agent_0')
+            per_env_actions[injector.sample({'own_side': sides[env]}, **combos_only)['index']['agent_0']] += 1
+            if fresh:
+                per_env_lengths[len(injector.agent_state['agent_0']['move_sequence']) + 1] += 1
+
+    batched = BatchedComboInjector(len(characters))
+    batched.reset(characters, super_arts)
+    batched_actions, batched_lengths = collections.Counter(), collections.Counter()
+    for _ in range(steps):
+        batched_actions.update(batched.sample({'own_side': sides}, **combos_only)['index'].tolist())
+        # Queues refilled this step: their sequence length, after the cancel cutoff.
+        batched_lengths.update(batched.length[batched.cursor == 1].tolist())
+
+    # Two per-env runs differ by ~0.015 on both histograms.
+    assert total_variation(per_env_actions, batched_actions) < 0.05
+    assert total_variation(per_env_lengths, batched_lengths) < 0.05
@@ -0,0 +1,63 @@
+"""
+Follower throughput of the 'threads' and 'selector' follow modes (user-001).
+
+Every simulated container is a stub `docker logs -f` that cats the same 2000-line
+training log once, through the CLI transport. The monitor drains all of them as fast
+as it can; lines/sec, the monitor's CPU share and its peak thread count are printed
+for 10, 100 and 500 containers.
+
+    python bench/bench_follow_modes.py [--containers 10 100 500] [--modes threads selector]
+"""
+
+import argparse
+import os
+import threading
+import time
+
+import common
+
+def stub_script(containers, corpus_path, done_path):
+    # A container's log is only printed by the first follower; reconnects find it ended.
+    return (f'if [ "$1" = ps ]; then i=0; while [ $i -lt {containers} ]; do echo c$i; i=$((i+1)); done; exit 0; fi\n'
+            'if [ "$1" = events ]; then exec sleep 100000; fi\n'
+            'for name; do :; done\n'
+            f'[ -e {done_path}/$name ] && exit 0\n'
+            f'touch {done_path}/$name\n'
+            f'exec cat {corpus_path}\n')
+
+def run(containers, follow_mode, corpus_path, lines_per_container, timeout):
+    done_path = os.path.abspath(f"done-{follow_mode}-{containers}")
+    os.makedirs(done_path)
+    common.fake_docker(os.path.abspath(f"stub-{follow_mode}-{containers}"),
+                       stub_script(containers, corpus_path, done_path))
+    docker_monitor = common.quiet_monitor(min_stage=1, follow_mode=follow_mode, transport='cli', status_interval=0)
+    target = containers * lines_per_container
+    started, cpu_started = time.perf_counter(), time.process_time()
+    docker_monitor.start_monitoring()
+    threads = 0
+    deadline = started + timeout
+    while sum(docker_monitor.metrics.lines.values()) < target and time.perf_counter() < deadline:
+        threads = max(threads, threading.active_count())
+        time.sleep(0.005)
+    lines = sum(docker_monitor.metrics.lines.values())
+    wall, cpu = time.perf_counter() - started, time.process_time() - cpu_started
+    docker_monitor.stop_monitoring()
+    drained = '' if lines >= target else f" (did not drain within {timeout:.0f}s)"
+    print(f"{follow_mode:9s} N={containers:4d}  {lines / wall:9,.0f} lines/s  CPU {100 * cpu / wall:3.0f}%  "
+          f"threads {threads}{drained}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--containers', type=int, nargs='+', default=[10, 100, 500])
+    parser.add_argument('--modes', nargs='+', default=list(common.monitor.FOLLOW_MODES))
+    parser.add_argument('--lines', type=int, default=2000, help='Log lines per container (default: 2000)')
+    parser.add_argument('--timeout', type=float, default=200)
+    args = parser.parse_args()
+    common.work_dir()
+    corpus_path = common.write_log(os.path.abspath('corpus.log'), common.training_log(args.lines))
+    for containers in args.containers:
+        for follow_mode in args.modes:
+            run(containers, follow_mode, corpus_path, args.lines, args.timeout)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+Chunk ingestion throughput of process_block (user-019).
+
+Cuts the 200k-line synthetic training log, and a sparser variant with fewer SB3
+tables, into the 64 KiB chunks a follower reads, and feeds them to process_block,
+which prefilters each chunk on the rule markers as bytes, next to the per-line path
+it replaced (split, decode and strip every line, then process_output). Prints the
+best of 5 in lines/sec and the share of a core a container logging 50k lines/s costs.
+
+    python bench/bench_ingest.py [--lines 200000]
+"""
+
+import argparse
+import time
+
+import common
+import log_parsing
+
+monitor = common.monitor
+CHUNK_SIZE = 64 * 1024
+
+def process_lines(docker_monitor, lines, container_name):
+    """The former follower path: every line of a chunk is decoded and stripped before matching."""
+    started = time.perf_counter()
+    for line in lines:
+        docker_monitor.process_output(line.decode(errors='replace').strip(), container_name)
+    docker_monitor.metrics.observe(container_name, len(lines), time.perf_counter() - started)
+
+def per_line(docker_monitor, chunks):
+    pending = b''
+    for chunk in chunks:
+        lines = (pending + chunk).split(b'\n')
+        pending = lines.pop()
+        process_lines(docker_monitor, lines, 'bench-container')
+
+def per_block(docker_monitor, chunks):
+    pending = b''
+    for chunk in chunks:
+        block, pending = log_parsing.split_complete_lines(pending, chunk)
+        if block:
+            docker_monitor.process_block(block, 'bench-container')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--lines', type=int, default=200000)
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+    common.work_dir()
+    log = common.training_log(args.lines)
+    for corpus_name, corpus in (('dense', log), ('sparse', common.sparse_log(log))):
+        data = ''.join(line + '\n' for line in corpus).encode()
+        chunks = [data[start:start + CHUNK_SIZE] for start in range(0, len(data), CHUNK_SIZE)]
+        for path_name, ingest in (('per-line', per_line), ('process_block', per_block)):
+            docker_monitor = common.quiet_monitor(initial_scan=False, status_interval=0)
+            rate = len(corpus) / common.best_of(args.repeats, lambda: ingest(docker_monitor, chunks))
+            print(f"{corpus_name:6s} {path_name:13s} {rate:11,.0f} lines/s  "
+                  f"{100 * 50000 / rate:4.1f}% of a core per 50k lines/s container")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""
+Per-call process_output latency on event lines (user-013).
+
+Stage, episode and completion lines log a debug message that goes through the queue
+listener to ./output/logs/monitor.log. This times every process_output call of the
+200k-line synthetic training log and prints the p50/p99/max latency of the event
+lines: for one follower in a CPU-bound loop, then for concurrent followers each
+reading the log from its own `cat` pipe like `docker logs -f`.
+
+Both are run twice: with the queue-backed handlers of setup_logging(), and with an
+inline copy of the former setup, where the follower thread itself formats the record
+and writes the rotating file and the console, through the ColorFormatter that
+colored the record's message in place.
+
+    python bench/bench_logging.py [--followers 8]
+"""
+
+import argparse
+import contextlib
+import logging
+import os
+import threading
+import time
+from logging.handlers import RotatingFileHandler
+
+from colorama import Fore, Style
+
+import common
+import log_parsing
+import logging_setup
+import transports
+
+monitor = common.monitor
+LOGGED_EVENTS = ('stage', 'episode_done', 'game_completed')
+
+class FormerColorFormatter(logging.Formatter):
+    """The former console formatter: colors record.msg in place, which the file handler then writes too."""
+    def format(self, record):
+        if 'reached stage' in record.msg:
+            color = Fore.WHITE
+        elif 'Game completed' in record.msg:
+            color = Fore.YELLOW
+        else:
+            levelno = record.levelno
+            color = Fore.GREEN if levelno == 20 else Fore.RED if levelno >= 40 else Fore.CYAN
+        record.msg = f"{color}{record.msg}{Style.RESET_ALL}"
+        return super(FormerColorFormatter, self).format(record)
+
+@contextlib.contextmanager
+def former_logging():
+    """Swaps the monitor logger's queue handler for the handlers the former setup_logging() added."""
+    logger = logging_setup.setup_logging()
+    queued = logger.handlers[:]
+    file_handler = RotatingFileHandler('./output/logs/monitor.log', maxBytes=5*1024*1024, backupCount=2)
+    file_handler.setFormatter(logging.Formatter('%(levelname)s - %(message)s'))
+    file_handler.setLevel(logging.DEBUG)
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(FormerColorFormatter())
+    console_handler.setLevel(logging.INFO)
+    logger.handlers = [file_handler, console_handler]
+    try:
+        yield
+    finally:
+        logger.handlers = queued
+        file_handler.close()
+
+def report(label, lines, seconds, latencies):
+    latencies.sort()
+    def quantile(q):
+        return latencies[max(int(q * len(latencies)) - 1, 0)] * 1e6
+    print(f"{label:30s} {lines / seconds:9,.0f} lines/s  event lines n={len(latencies)}  "
+          f"p50 {quantile(0.5):6.1f}us  p99 {quantile(0.99):7.1f}us  max {latencies[-1] * 1e6:8.0f}us")
+
+def single_follower(log, label):
+    docker_monitor = monitor.DockerMonitor(min_stage=1, transport=None, live_discovery=False)
+    latencies = []
+    started = time.perf_counter()
+    for line in log:
+        call = time.perf_counter()
+        event = docker_monitor.process_output(line, 'bench-container')
+        if event in LOGGED_EVENTS:
+            latencies.append(time.perf_counter() - call)
+    report(f"{label}, single follower", len(log), time.perf_counter() - started, latencies)
+
+def concurrent_followers(corpus_path, followers, label):
+    docker_monitor = monitor.DockerMonitor(min_stage=1, transport=None, live_discovery=False)
+    latencies, lines = [], [0]
+
+    def follow(index):
+        stream = transports.CLILogStream(['cat', corpus_path])
+        for raw_line in log_parsing.iter_chunk_lines(stream):
+            call = time.perf_counter()
+            event = docker_monitor.process_output(raw_line.decode(), f"bench-container-{index}")
+            if event in LOGGED_EVENTS:
+                latencies.append(time.perf_counter() - call)
+            lines[0] += 1
+        stream.close()
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=follow, args=(index,)) for index in range(followers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    report(f"{label}, {followers} followers", lines[0], time.perf_counter() - started, latencies)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--lines', type=int, default=200000)
+    parser.add_argument('--followers', type=int, default=8)
+    args = parser.parse_args()
+    common.work_dir()
+    log = common.training_log(args.lines)
+    corpus_path = common.write_log(os.path.abspath('corpus.log'), log)
+    for label, handlers in (('former', former_logging), ('queued', contextlib.nullcontext)):
+        with handlers():
+            single_follower(log, label)
+            concurrent_followers(corpus_path, args.followers, label)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+Log line matching throughput of process_output (user-002).
+
+Feeds a 200k-line synthetic training log (about 98% SB3/emulator noise) to
+DockerMonitor.process_output, best of 3, next to the matching it replaced: three
+re.search calls and a formatted timestamp on every line.
+
+    python bench/bench_matcher.py [--lines 200000]
+"""
+
+import argparse
+import re
+import threading
+from datetime import datetime
+
+import common
+
+class PerLineRegexBaseline:
+    """The state updates of the original process_output, searching all patterns on every line."""
+
+    def __init__(self, minimum_stage=1):
+        self.minimum_stage = minimum_stage
+        self.lock = threading.Lock()
+        self.container_stages = {}
+        self.game_completion = {}
+
+    def process_output(self, output, container_name):
+        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        stage_match = re.search(r'\((\d+)\)Moving to stage (\d+) of (\d+)', output)
+        episode_done_match = re.search(r'\((\d+)\)Episode done', output)
+        game_completed_match = re.search(r'\((\d+)\)Game completed!', output)
+
+        with self.lock:
+            if stage_match:
+                env_number, current_stage, max_stage = stage_match.groups()
+                if int(current_stage) >= self.minimum_stage:
+                    self.container_stages[container_name] = f"[{current_time}] {container_name}({env_number}) reached stage {current_stage} of {max_stage}"
+            if episode_done_match and container_name in self.container_stages:
+                del self.container_stages[container_name]
+            if game_completed_match:
+                env_number = game_completed_match.group(1)
+                self.game_completion.setdefault(container_name, []).append(f"[{current_time}] {container_name}({env_number}): Game completed!")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--lines', type=int, default=200000)
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+    common.work_dir()
+    log = common.training_log(args.lines)
+
+    def run(process_output):
+        for line in log:
+            process_output(line, 'bench-container')
+
+    baseline = PerLineRegexBaseline()
+    docker_monitor = common.quiet_monitor(min_stage=1)
+    before = common.best_of(args.repeats, lambda: run(baseline.process_output))
+    after = common.best_of(args.repeats, lambda: run(docker_monitor.process_output))
+    completions = sum(len(completions) for completions in baseline.game_completion.values())
+    assert completions == docker_monitor.game_completion.total(), "the matchers disagree"
+    print(f"per-line regex  {args.lines / before:12,.0f} lines/s")
+    print(f"LogMatcher      {args.lines / after:12,.0f} lines/s  ({before / after:.1f}x)")
+
+if __name__ == '__main__':
+    main()
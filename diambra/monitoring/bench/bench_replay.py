@@ -0,0 +1,36 @@
+"""
+Offline replay throughput over the four saved log formats (user-011).
+
+Writes the 200k-line synthetic training log as plain `docker logs` output, gzipped,
+with --timestamps and as a docker json-file log, replays each one through a fresh
+DockerMonitor and prints lines/sec and the per-event counts. --event-db also stores
+the events in an SQLite event database, to see what recording them costs.
+
+    python bench/bench_replay.py [--lines 200000] [--event-db]
+"""
+
+import argparse
+import os
+
+import common
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--lines', type=int, default=200000)
+    parser.add_argument('--formats', nargs='+', default=list(common.FORMATS), choices=common.FORMATS)
+    parser.add_argument('--event-db', action='store_true', help='Record the replayed events in an SQLite event database')
+    args = parser.parse_args()
+    common.work_dir()
+    log = common.training_log(args.lines)
+    for log_format in args.formats:
+        suffix = {'gzip': '.log.gz', 'json-file': '-json.log'}.get(log_format, '.log')
+        path = common.write_log(os.path.abspath(f"train-{log_format}{suffix}"), log, log_format)
+        event_db = os.path.abspath(f"events-{log_format}.db") if args.event_db else None
+        docker_monitor = common.quiet_monitor(min_stage=1, event_db=event_db)
+        stats = docker_monitor.replay([path])
+        docker_monitor.stop_monitoring()
+        counts = ', '.join(f"{event}: {count}" for event, count in sorted(stats['events'].items()))
+        print(f"{log_format:10s} {stats['lines'] / stats['seconds']:10,.0f} lines/s  ({counts})")
+
+if __name__ == '__main__':
+    main()
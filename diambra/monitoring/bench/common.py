@@ -0,0 +1,110 @@
+"""
+Synthetic training logs and helpers shared by the monitor benchmarks.
+
+The corpus mimics the output of a DIAMBRA training container: mostly Stable-Baselines3
+verbose=1 table rows and emulator chatter, with stage, episode and completion messages of
+32 envs on about 1.6% of the lines. It is generated from a fixed seed, so every run of a
+benchmark parses the same lines.
+"""
+
+import gzip
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import log_parsing
+import monitor
+
+NOISE = [
+    "----------------------------------------",
+    "| rollout/                |            |",
+    "|    ep_len_mean          | 1.2e+03    |",
+    "|    ep_rew_mean          | -45.3      |",
+    "| time/                   |            |",
+    "|    fps                  | 812        |",
+    "|    iterations           | 17         |",
+    "|    time_elapsed         | 85         |",
+    "|    total_timesteps      | 69632      |",
+    "| train/                  |            |",
+    "|    approx_kl            | 0.01232    |",
+    "Round won", "Stage won", "(3)Round lost", "Opponent: Ken",
+]
+FORMATS = ('plain', 'gzip', 'timestamps', 'json-file')
+
+def training_log(lines, seed=0):
+    """Returns `lines` synthetic training log lines (without newlines)."""
+    rng = random.Random(seed)
+    log = []
+    for _ in range(lines):
+        roll = rng.random()
+        if roll < 0.01:
+            log.append(f"({rng.randint(0, 31)})Moving to stage {rng.randint(1, 10)} of 10")
+        elif roll < 0.015:
+            log.append(f"({rng.randint(0, 31)})Episode done")
+        elif roll < 0.016:
+            log.append(f"({rng.randint(0, 31)})Game completed!")
+        else:
+            log.append(rng.choice(NOISE))
+    return log
+
+def sparse_log(log):
+    """Drops most marker lines of a corpus, like a long run printing fewer SB3 tables."""
+    markers = ('stage', 'Game', 'time_elapsed', 'total_timesteps', 'Episode')
+    return [line for index, line in enumerate(log) if index % 8 == 0 or not any(marker in line for marker in markers)]
+
+def write_log(path, log, log_format='plain', start=None, line_interval=0.001):
+    """Writes a corpus as plain `docker logs` output, gzipped, with --timestamps or as a json-file log."""
+    if start is None:
+        start = time.time() - len(log) * line_interval
+    opener = gzip.open if log_format == 'gzip' else open
+    with opener(path, 'wt') as f:
+        for index, line in enumerate(log):
+            if log_format in ('timestamps', 'json-file'):
+                timestamp = log_parsing.unix_nanos_to_docker_timestamp(int((start + index * line_interval) * 1e9))
+                if log_format == 'json-file':
+                    line = json.dumps({'log': line + '\n', 'stream': 'stdout', 'time': timestamp})
+                else:
+                    line = f"{timestamp} {line}"
+            f.write(line + '\n')
+    return path
+
+def work_dir():
+    """Moves to a fresh temporary directory, where the corpora and the monitor's ./output go."""
+    path = tempfile.mkdtemp(prefix='monitor-bench-')
+    os.chdir(path)
+    return path
+
+def fake_docker(path, script):
+    """Writes a stub `docker` CLI running the given shell script and puts it first on PATH."""
+    bin_path = os.path.join(path, 'bin')
+    os.makedirs(bin_path, exist_ok=True)
+    docker = os.path.join(bin_path, 'docker')
+    with open(docker, 'w') as f:
+        f.write('#!/bin/sh\n' + script)
+    os.chmod(docker, 0o755)
+    os.environ['PATH'] = bin_path + os.pathsep + os.environ['PATH']
+
+def quiet_monitor(**kwargs):
+    """A DockerMonitor without Docker whose console only shows warnings."""
+    kwargs.setdefault('transport', None)
+    kwargs.setdefault('live_discovery', False)
+    docker_monitor = monitor.DockerMonitor(**kwargs)
+    quiet()
+    return docker_monitor
+
+def quiet():
+    logging.getLogger('DockerLogMonitor').setLevel(logging.WARNING)
+
+def best_of(repeats, function):
+    """Returns the shortest of `repeats` timed calls of `function`, in seconds."""
+    best = float('inf')
+    for _ in range(repeats):
+        started = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - started)
+    return best
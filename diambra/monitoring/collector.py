@@ -0,0 +1,275 @@
+"""
+Multi-host monitoring: the agent side shipping parsed events to a collector, and the
+collector merging them into one cluster view.
+"""
+
+import threading
+import selectors
+import logging
+import json
+import socket
+import queue
+import time
+
+from event_store import next_batch
+from log_parsing import LOG_RULES
+from logging_setup import setup_logging
+from tracking import CompletionStore, EnvStageTable, ThroughputTracker, format_duration
+from transports import READ_CHUNK_SIZE, RECONNECT_BASE_DELAY, RECONNECT_MAX_DELAY
+
+# Agents ship parsed events to a collector over TCP as newline-delimited JSON batches of up to
+# SHIP_BATCH_SIZE events, at least every SHIP_FLUSH_INTERVAL seconds. Up to SHIP_QUEUE_SIZE events
+# wait while the collector is slow or unreachable; beyond that they are dropped and counted.
+COLLECTOR_PORT = 7077
+SHIP_BATCH_SIZE = 5000
+SHIP_FLUSH_INTERVAL = 1.0
+SHIP_QUEUE_SIZE = 100000
+
+def parse_address(address, default_host='127.0.0.1'):
+    """Parses 'host:port' or 'port' into a (host, port) tuple."""
+    host, _, port = str(address).rpartition(':')
+    return host or default_host, int(port)
+
+class EventShipper:
+    """Agent side of the multi-host link: ships parsed events to a collector.
+
+    record() only enqueues the event as a compact [time, container, env, event, value, max_stage]
+    list; a sender thread writes them as JSON batches, one line per batch, over a TCP connection
+    it reopens with capped backoff. A slow collector blocks the sender on the socket (TCP flow
+    control), the bounded queue absorbs bursts meanwhile, and events that do not fit are dropped
+    and reported to the collector with the next batch.
+    """
+    events = tuple(LOG_RULES)
+    # Feeds the collector's live view, where an event is applied when it arrives.
+    history = False
+
+    def __init__(self, address, host_name, logger=None, batch_size=SHIP_BATCH_SIZE,
+                 flush_interval=SHIP_FLUSH_INTERVAL, queue_size=SHIP_QUEUE_SIZE):
+        self.address = address
+        self.host_name = host_name
+        self.logger = logger or logging.getLogger('DockerLogMonitor')
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.pending = queue.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self.sock = None
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.send_events, name='event-shipper', daemon=True)
+        self.thread.start()
+
+    def record(self, when, container, env_number, event, value=None, max_stage=None):
+        try:
+            self.pending.put_nowait([round(when, 3), container, env_number, event, value, max_stage])
+        except queue.Full:
+            self.dropped += 1
+
+    record_scanned = record
+
+    def connect(self):
+        """Connects to the collector, retrying with capped backoff; returns False once stopped."""
+        attempt = 0
+        while not self.stopped.is_set():
+            try:
+                self.sock = socket.create_connection(self.address, timeout=10)
+                self.sock.settimeout(None)
+                self.logger.debug(f"Shipping events to the collector at {self.address[0]}:{self.address[1]}.")
+                return True
+            except OSError as e:
+                delay = min(RECONNECT_BASE_DELAY * 2 ** attempt, RECONNECT_MAX_DELAY)
+                if attempt == 0:
+                    self.logger.error(f"Failed to reach the collector at {self.address[0]}:{self.address[1]}: {e}")
+                attempt += 1
+                self.stopped.wait(delay)
+        return False
+
+    def send_events(self):
+        batch = []
+        while True:
+            if not batch:
+                batch = next_batch(self.pending, self.batch_size, self.flush_interval)
+            closing = batch[-1] is None
+            events = batch[:-1] if closing else batch
+            if events or self.dropped:
+                if self.sock is None and not self.connect():
+                    return
+                dropped, self.dropped = self.dropped, 0
+                line = json.dumps({'host': self.host_name, 'dropped': dropped, 'events': events},
+                                  separators=(',', ':')) + '\n'
+                try:
+                    self.sock.sendall(line.encode())
+                except OSError as e:
+                    self.logger.error(f"Lost the connection to the collector: {e}")
+                    self.sock.close()
+                    self.sock = None
+                    # Resend the batch on the next connection.
+                    self.dropped += dropped
+                    if self.stopped.is_set():
+                        return
+                    continue
+            if closing:
+                if self.sock is not None:
+                    self.sock.close()
+                return
+            batch = []
+
+    def close(self, timeout=5):
+        """Sends the events recorded so far and stops the sender thread."""
+        try:
+            self.pending.put(None, timeout=timeout)
+        except queue.Full:
+            pass
+        self.thread.join(timeout=timeout)
+        # Gives up on a collector that is unreachable or not reading.
+        self.stopped.set()
+        if self.sock is not None:
+            try:
+                self.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+class HostView:
+    """Collector side state of one agent host, fed with the events it ships."""
+    def __init__(self, slow_ratio=0.7):
+        self.env_stages = EnvStageTable()
+        self.game_completion = CompletionStore()
+        self.throughput = ThroughputTracker(slow_ratio)
+        self.dropped = 0
+        self.events = 0
+        self.last_seen = 0.0
+        # Latest event time, on the agent's clock.
+        self.clock = 0.0
+
+    def apply(self, when, container, env_number, event, value, max_stage):
+        self.events += 1
+        if when > self.clock:
+            self.clock = when
+        if event == 'stage':
+            self.env_stages.enter_stage(container, env_number, value, max_stage, when)
+        elif event == 'episode_done':
+            self.env_stages.end_episode(container, env_number, when)
+        elif event == 'game_completed':
+            self.game_completion.add(container, env_number, when)
+        elif event == 'time_elapsed':
+            self.throughput.time_elapsed(container, value)
+        elif event == 'total_timesteps':
+            self.throughput.total_timesteps(container, value, when)
+
+class EventCollector:
+    """Merges the event streams of many agents into one cluster view.
+
+    Agent connections are multiplexed on a single selector loop and read as they
+    become ready; a collector that falls behind simply reads later, which pushes
+    back on the agents through TCP flow control.
+    """
+    def __init__(self, address, status_interval=60, slow_ratio=0.7):
+        self.logger = setup_logging()
+        self.status_interval = status_interval
+        self.slow_ratio = slow_ratio
+        self.server = socket.create_server(address)
+        self.server.setblocking(False)
+        self.address = self.server.getsockname()
+        self.hosts = {}
+        self.last_counts = {}
+        self.stopped = threading.Event()
+
+    def apply_batch(self, line):
+        """Applies one batch line of an agent; returns False if the line is not a valid batch."""
+        try:
+            batch = json.loads(line)
+            name, events, dropped = batch['host'], batch['events'], batch.get('dropped', 0)
+            if not (isinstance(name, str) and isinstance(events, list) and isinstance(dropped, int)
+                    and all(isinstance(event, list) and len(event) == 6 for event in events)):
+                raise ValueError("unexpected batch shape")
+        except (ValueError, TypeError, KeyError) as e:
+            self.logger.error(f"Malformed batch ({e!r}): {line[:80]!r}")
+            return False
+        host = self.hosts.get(name)
+        if host is None:
+            host = self.hosts[name] = HostView(self.slow_ratio)
+            self.logger.info(f"Receiving events from {name}.")
+        host.dropped += dropped
+        host.last_seen = time.time()
+        try:
+            for event in events:
+                host.apply(*event)
+        except (ValueError, TypeError, ArithmeticError) as e:
+            # ArithmeticError: an OverflowError from a value the stage table's columns cannot hold.
+            self.logger.error(f"Malformed event from {name} ({e!r}): {event!r}")
+            return False
+        return True
+
+    def serve(self):
+        """Accepts agents and applies their batches until stop() is called, reporting periodically."""
+        self.logger.info(f"Collecting events on {self.address[0]}:{self.address[1]}.")
+        selector = selectors.DefaultSelector()
+        selector.register(self.server, selectors.EVENT_READ, None)
+        next_report = time.monotonic() + self.status_interval
+        try:
+            while not self.stopped.is_set():
+                for key, _ in selector.select(timeout=min(1.0, max(0.0, next_report - time.monotonic()))):
+                    if key.data is None:
+                        connection, peer = self.server.accept()
+                        connection.setblocking(False)
+                        selector.register(connection, selectors.EVENT_READ, [peer, b''])
+                        continue
+                    try:
+                        chunk = key.fileobj.recv(READ_CHUNK_SIZE)
+                    except BlockingIOError:
+                        continue
+                    except OSError:
+                        chunk = b''
+                    if not chunk:
+                        selector.unregister(key.fileobj)
+                        key.fileobj.close()
+                        continue
+                    lines = (key.data[1] + chunk).split(b'\n')
+                    key.data[1] = lines.pop()
+                    for line in lines:
+                        if line and not self.apply_batch(line):
+                            # An agent that sends something else than batches is not one; drop it.
+                            self.logger.error(f"Dropping the connection from {key.data[0][0]}:{key.data[0][1]}.")
+                            selector.unregister(key.fileobj)
+                            key.fileobj.close()
+                            break
+                if time.monotonic() >= next_report:
+                    self.report_cluster()
+                    next_report = time.monotonic() + self.status_interval
+        finally:
+            for key in list(selector.get_map().values()):
+                key.fileobj.close()
+            selector.close()
+
+    def stop(self):
+        self.stopped.set()
+
+    def report_cluster(self):
+        """Logs per-host stage histograms, completions and throughput, then the cluster totals."""
+        if not self.hosts:
+            self.logger.info("No agents connected yet.")
+            return
+        now = time.time()
+        total_envs = total_completions = 0
+        total_rate = 0.0
+        self.logger.info(f"***Cluster status: {len(self.hosts)} host(s)***")
+        for name, host in sorted(self.hosts.items()):
+            envs = host.env_stages.current(1)
+            completions = host.game_completion.total()
+            new_completions = completions - self.last_counts.get(name, 0)
+            self.last_counts[name] = completions
+            rates, slow = host.throughput.snapshot(host.clock)
+            rate = sum(rates.values())
+            histogram = ', '.join(f"{stage}: {count}" for stage, count in sorted(host.env_stages.histogram().items()))
+            self.logger.info(f"{name}: {len(envs)} env(s) in a stage, {completions} game(s) completed "
+                             f"(+{new_completions}), {rate:.0f} steps/s"
+                             + (f", stages {histogram}" if histogram else "")
+                             + (f", {host.dropped} event(s) dropped" if host.dropped else "")
+                             + (f", last seen {format_duration(now - host.last_seen)} ago"
+                                if now - host.last_seen > 2 * self.status_interval else ""))
+            for container, (container_rate, median) in sorted(slow.items()):
+                self.logger.warning(f"{name}/{container} is running slow: {container_rate:.0f} steps/s, "
+                                    f"{100 * container_rate / median:.0f}% of its median {median:.0f} steps/s")
+            total_envs += len(envs)
+            total_completions += completions
+            total_rate += rate
+        self.logger.info(f"Cluster: {total_envs} env(s) in a stage, {total_completions} game(s) completed, "
+                         f"{total_rate:.0f} steps/s")
@@ -0,0 +1,183 @@
+"""
+SQLite history of the stage, episode and completion events, and the -q queries over it.
+"""
+
+import threading
+import logging
+import queue
+import sqlite3
+import os
+import time
+
+from tracking import format_duration, percentiles
+
+# SQLite (WAL) history of stage, episode and completion events; written by a background thread
+# in transactions of up to EVENT_BATCH_SIZE events, at least every EVENT_FLUSH_INTERVAL seconds.
+EVENTS_DB_PATH = './output/monitor_events.db'
+EVENT_BATCH_SIZE = 1000
+EVENT_FLUSH_INTERVAL = 1.0
+EVENTS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    time REAL NOT NULL,
+    container TEXT NOT NULL,
+    env INTEGER NOT NULL,
+    event TEXT NOT NULL,
+    stage INTEGER,
+    max_stage INTEGER
+);
+CREATE INDEX IF NOT EXISTS events_by_env ON events (container, env, time);
+CREATE INDEX IF NOT EXISTS events_by_event ON events (event, time);
+"""
+QUERIES = ('completions_per_hour', 'time_to_stage')
+
+def connect_event_db(path):
+    """Opens the event database in WAL mode, creating its table and indexes if needed."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    connection = sqlite3.connect(path)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.executescript(EVENTS_SCHEMA)
+    return connection
+
+def stored_until(path):
+    """Returns {container: latest event time} of an existing event database, {} if there is none."""
+    if not os.path.exists(path):
+        return {}
+    try:
+        connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            return dict(connection.execute("SELECT container, MAX(time) FROM events GROUP BY container"))
+        finally:
+            connection.close()
+    except sqlite3.Error:
+        return {}
+
+def next_batch(pending, batch_size, flush_interval):
+    """Blocks for one item of `pending`, then gathers more until the batch is full or the flush interval is over.
+
+    A None item (the closing sentinel) ends the batch.
+    """
+    batch = [pending.get()]
+    deadline = time.monotonic() + flush_interval
+    while batch[-1] is not None and len(batch) < batch_size:
+        timeout = deadline - time.monotonic()
+        if timeout <= 0:
+            break
+        try:
+            batch.append(pending.get(timeout=timeout))
+        except queue.Empty:
+            break
+    return batch
+
+class EventStore:
+    """Append-only SQLite store of stage, episode-done and game-completed events.
+
+    record() only enqueues the event; a writer thread inserts them in batches, one
+    transaction per batch, so the log followers never wait on the disk.
+
+    The initial scan finds again the completions a previous run already stored while it was
+    following live; record_scanned() skips those, i.e. the events at or before the latest time
+    the store held for the container when it was opened.
+    """
+    events = ('stage', 'episode_done', 'game_completed')
+    # Keeps events by time, so events without a time of their own are not handed to it.
+    history = True
+
+    def __init__(self, path=EVENTS_DB_PATH, logger=None, batch_size=EVENT_BATCH_SIZE,
+                 flush_interval=EVENT_FLUSH_INTERVAL):
+        self.path = path
+        self.logger = logger or logging.getLogger('DockerLogMonitor')
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.pending = queue.SimpleQueue()
+        # Set when the database cannot be opened; record() then drops the events instead of queueing them.
+        self.failed = False
+        self.stored_until = stored_until(path)
+        self.thread = threading.Thread(target=self.write_events, name='event-store', daemon=True)
+        self.thread.start()
+
+    def record(self, when, container, env_number, event, stage=None, max_stage=None):
+        if not self.failed:
+            self.pending.put((when, container, env_number, event, stage, max_stage))
+
+    def record_scanned(self, when, container, env_number, event, stage=None, max_stage=None):
+        if when > self.stored_until.get(container, float('-inf')):
+            self.record(when, container, env_number, event, stage, max_stage)
+
+    def write_events(self):
+        try:
+            connection = connect_event_db(self.path)
+        except (sqlite3.Error, OSError) as e:
+            self.logger.error(f"Failed to open the event database {self.path}, events are not stored: {e}")
+            self.failed = True
+            while not self.pending.empty():
+                self.pending.get_nowait()
+            return
+        try:
+            while True:
+                batch = next_batch(self.pending, self.batch_size, self.flush_interval)
+                closing = batch[-1] is None
+                if closing:
+                    batch.pop()
+                if batch:
+                    try:
+                        with connection:
+                            connection.executemany("INSERT INTO events VALUES (?, ?, ?, ?, ?, ?)", batch)
+                    except sqlite3.Error as e:
+                        self.logger.error(f"Failed to store {len(batch)} event(s): {e}")
+                if closing:
+                    return
+        finally:
+            connection.close()
+
+    def close(self, timeout=5):
+        """Writes the events recorded so far and stops the writer thread."""
+        self.pending.put(None)
+        self.thread.join(timeout=timeout)
+
+def completions_per_hour(connection):
+    """Returns [(container, local hour, completions)] from the event database."""
+    return connection.execute(
+        "SELECT container, strftime('%Y-%m-%d %H:00', time, 'unixepoch', 'localtime') AS hour, COUNT(*) "
+        "FROM events WHERE event = 'game_completed' GROUP BY container, hour ORDER BY container, hour").fetchall()
+
+def time_to_stage(connection, stage):
+    """Returns {container: [seconds]} from the start of an episode (the env's previous 'Episode done') to `stage`."""
+    rows = connection.execute(
+        "SELECT container, env, time, event FROM events "
+        "WHERE event = 'episode_done' OR (event = 'stage' AND stage = ?) ORDER BY container, env, time", (stage,))
+    starts = {}
+    durations = {}
+    for container, env_number, when, event in rows:
+        if event == 'episode_done':
+            starts[(container, env_number)] = when
+        elif (container, env_number) in starts:
+            durations.setdefault(container, []).append(when - starts[(container, env_number)])
+    return durations
+
+def run_query(path, query, stage):
+    """Prints one of the QUERIES over the event database."""
+    if not os.path.exists(path):
+        print(f"No event database at {path}.")
+        return
+    connection = sqlite3.connect(path)
+    try:
+        if query == 'completions_per_hour':
+            rows = completions_per_hour(connection)
+            for container, hour, count in rows:
+                print(f"{container}  {hour}  {count}")
+            if not rows:
+                print("No completions recorded.")
+        elif query == 'time_to_stage':
+            durations = time_to_stage(connection, stage)
+            for container, samples in sorted(durations.items()):
+                p50, p90 = percentiles(samples)
+                print(f"{container}: median {format_duration(p50)} / p90 {format_duration(p90)} to stage {stage} "
+                      f"({len(samples)} episode(s))")
+            if durations:
+                p50, p90 = percentiles([sample for samples in durations.values() for sample in samples])
+                print(f"all: median {format_duration(p50)} / p90 {format_duration(p90)} to stage {stage}")
+            else:
+                print(f"No episode reached stage {stage}.")
+    finally:
+        connection.close()
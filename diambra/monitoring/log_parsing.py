@@ -0,0 +1,156 @@
+"""
+The log messages the monitor understands, docker timestamps, and splitting log streams into lines.
+"""
+
+import re
+import json
+import calendar
+from datetime import datetime, timezone
+import time
+
+# Declarative table of the log messages the monitor understands, keyed by event name.
+# 'marker' is a literal substring that must be present for the line to be considered at all
+# (a cheap prefilter for the SB3/emulator noise), 'pattern' is the message that follows the
+# '(<env>)' prefix, or the whole message for rules with 'env_prefix': False. Named groups in
+# the patterns must be unique across rules.
+# Messages from other DIAMBRA games can be supported by adding rules here.
+LOG_RULES = {
+    'stage': {'marker': 'Moving to stage',
+              'pattern': r'Moving to stage (?P<current_stage>\d+) of (?P<max_stage>\d+)'},
+    'episode_done': {'marker': 'Episode done',
+                     'pattern': r'Episode done'},
+    'game_completed': {'marker': 'Game completed!',
+                       'pattern': r'Game completed!'},
+    # Rows of the time/ section of the SB3 verbose=1 table, printed once per rollout.
+    'time_elapsed': {'marker': 'time_elapsed', 'env_prefix': False,
+                     'pattern': r'\|\s+time_elapsed\s+\|\s+(?P<elapsed_seconds>\d+)'},
+    'total_timesteps': {'marker': 'total_timesteps', 'env_prefix': False,
+                        'pattern': r'\|\s+total_timesteps\s+\|\s+(?P<timesteps>\d+)'},
+}
+ENV_PREFIX = r'\((?P<env>\d+)\)'
+# Largest value of each numeric field that is tracked: stages and env numbers live in 16-bit
+# arrays, counters in SQLite integers. Lines with larger numbers are ignored.
+FIELD_LIMITS = {'env': 2**15 - 1, 'current_stage': 2**15 - 1, 'max_stage': 2**15 - 1}
+MAX_COUNTER = 2**63 - 1
+
+# Leading timestamp of `docker logs --timestamps` lines.
+DOCKER_TIMESTAMP = re.compile(r'\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d(?:\.\d+)?Z')
+
+def normalize_docker_timestamp(timestamp):
+    """Pads an RFC3339Nano timestamp to nanosecond precision so timestamps compare as strings."""
+    base, _, fraction = timestamp.rstrip('Z').partition('.')
+    return f"{base}.{fraction.ljust(9, '0')}Z"
+
+def docker_timestamp_now():
+    """Returns the current time as a UTC RFC3339Nano timestamp, the format docker logs use."""
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f000Z")
+
+def unix_nanos_to_docker_timestamp(nanos):
+    """Converts nanoseconds since the epoch (an event's timeNano) to a UTC RFC3339Nano timestamp."""
+    seconds, fraction = divmod(int(nanos), 1_000_000_000)
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(seconds)) + f".{fraction:09d}Z"
+
+def docker_timestamp_to_unix(timestamp):
+    """Converts a UTC RFC3339Nano timestamp to the 'seconds.nanoseconds' form the Engine API expects."""
+    base, _, fraction = normalize_docker_timestamp(timestamp).rstrip('Z').partition('.')
+    seconds = calendar.timegm(time.strptime(base, "%Y-%m-%dT%H:%M:%S"))
+    return f"{seconds}.{fraction}"
+
+def parse_log_line(raw_line):
+    """Splits a saved log line into (seconds since the epoch or None, message).
+
+    Understands docker json-file lines, `docker logs --timestamps` lines and plain lines.
+    """
+    if raw_line.startswith(b'{'):
+        try:
+            entry = json.loads(raw_line)
+            return float(docker_timestamp_to_unix(entry['time'])), entry['log'].rstrip('\n')
+        except (ValueError, KeyError, TypeError):
+            pass
+    line = raw_line.decode(errors='replace').rstrip('\r')
+    timestamp, _, message = line.partition(' ')
+    if DOCKER_TIMESTAMP.fullmatch(timestamp):
+        return float(docker_timestamp_to_unix(timestamp)), message
+    return None, line
+
+def split_complete_lines(pending, chunk):
+    """Returns (block, pending): the complete lines of pending + chunk as one bytes block, and the rest."""
+    end = chunk.rfind(b'\n')
+    if end < 0:
+        return b'', pending + chunk
+    return pending + chunk[:end + 1], chunk[end + 1:]
+
+def count_lines(block):
+    """Counts the lines of a block, including a last line without a newline."""
+    return block.count(b'\n') + (not block.endswith(b'\n'))
+
+def iter_line_blocks(stream):
+    """Yields the complete lines of each chunk read from a blocking log stream, as one bytes block."""
+    pending = b''
+    while True:
+        chunk = stream.read_chunk()
+        if not chunk:
+            break
+        block, pending = split_complete_lines(pending, chunk)
+        if block:
+            yield block
+    if pending:
+        yield pending
+
+def iter_chunk_lines(stream):
+    """Yields the lines of a blocking log stream, reading it in large chunks."""
+    for block in iter_line_blocks(stream):
+        lines = block.split(b'\n')
+        if not lines[-1]:
+            lines.pop()
+        yield from lines
+
+class LogMatcher:
+    """Matches log lines against a rule table with a substring prefilter and one compiled regex."""
+    def __init__(self, rules=LOG_RULES):
+        self.markers = tuple(rule['marker'] for rule in rules.values())
+        self.byte_markers = tuple(marker.encode() for marker in self.markers)
+        # Marker of each rule by event name, for callers that only look for one event.
+        self.event_markers = {name: rule['marker'].encode() for name, rule in rules.items()}
+        # Numeric fields of each rule's matches.
+        self.event_fields = {name: ('env',) * rule.get('env_prefix', True) + tuple(re.compile(rule['pattern']).groupindex)
+                             for name, rule in rules.items()}
+        env_rules = '|'.join(f"(?P<{name}>{rule['pattern']})" for name, rule in rules.items()
+                             if rule.get('env_prefix', True))
+        plain_rules = '|'.join(f"(?P<{name}>{rule['pattern']})" for name, rule in rules.items()
+                               if not rule.get('env_prefix', True))
+        pattern = f"{ENV_PREFIX}(?:{env_rules})"
+        if plain_rules:
+            pattern = f"{pattern}|{plain_rules}"
+        self.regex = re.compile(pattern)
+
+    def candidate_lines(self, block):
+        """Returns the lines of a bytes block that contain a marker, in order.
+
+        Markers are searched in the whole block with bytes.find, so the lines without
+        any (almost all of them) are never split out, decoded or stripped.
+        """
+        spans = set()
+        for marker in self.byte_markers:
+            position = block.find(marker)
+            while position >= 0:
+                start = block.rfind(b'\n', 0, position) + 1
+                end = block.find(b'\n', position)
+                if end < 0:
+                    end = len(block)
+                spans.add((start, end))
+                position = block.find(marker, end)
+        return [block[start:end] for start, end in sorted(spans)]
+
+    def match(self, line):
+        """Returns (event, fields) for the first known message in the line, or None."""
+        for marker in self.markers:
+            if marker in line:
+                break
+        else:
+            return None
+        match = self.regex.search(line)
+        if match is None:
+            return None
+        # The rule's own group encloses its fields, so it is the last group to close.
+        return match.lastgroup, match.groupdict()
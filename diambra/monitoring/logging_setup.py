@@ -0,0 +1,58 @@
+"""
+Console and file logging of the monitor.
+"""
+
+import logging
+import queue
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
+import atexit
+import os
+from colorama import Fore, Style
+
+def setup_logging():
+    """Sets up logging with file and console handlers behind a queue.
+
+    The logger only enqueues records; a listener thread formats them and does the
+    file and console I/O. Calling it again returns the already configured logger.
+    """
+    logger = logging.getLogger('DockerLogMonitor')
+    if any(isinstance(handler, QueueHandler) for handler in logger.handlers):
+        return logger
+    logger.propagate = False
+    output_log_path = './output/logs'
+    os.makedirs(output_log_path, exist_ok=True)
+
+    logger.setLevel(logging.DEBUG)
+
+    file_formatter = logging.Formatter('%(levelname)s - %(message)s')
+    file_handler = RotatingFileHandler(output_log_path + '/monitor.log', maxBytes=5*1024*1024, backupCount=2)
+    file_handler.setFormatter(file_formatter)
+    file_handler.setLevel(logging.DEBUG)
+
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(ColorFormatter())
+    console_handler.setLevel(logging.INFO)
+
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+    listener.start()
+    # Drains the queue on exit, before the logging module closes the handlers.
+    atexit.register(listener.stop)
+    logger.addHandler(QueueHandler(log_queue))
+    return logger
+
+class ColorFormatter(logging.Formatter):
+    """Custom formatter to add color to console output based on log level.
+
+    The color wraps the formatted text; the record itself is left untouched for the other handlers.
+    """
+    def format(self, record):
+        message = super(ColorFormatter, self).format(record)
+        if 'reached stage' in message:
+            color = Fore.WHITE
+        elif 'Game completed' in message:
+            color = Fore.YELLOW
+        else:
+            levelno = record.levelno
+            color = Fore.GREEN if levelno == 20 else Fore.RED if levelno >= 40 else Fore.CYAN
+        return f"{color}{message}{Style.RESET_ALL}"
@@ -1,152 +1,908 @@
 import subprocess
 import threading
+import selectors
 import re
-import logging
+import json
+import socket
+import http.server
+import queue
+import heapq
+import gzip
+import itertools
+from collections import deque
 from datetime import datetime
-from logging.handlers import RotatingFileHandler
 import os
-from colorama import Fore, Style
 import time
 import argparse
+import shlex
+
+from collector import COLLECTOR_PORT, EventCollector, EventShipper, parse_address
+from event_store import EVENTS_DB_PATH, QUERIES, EventStore, run_query
+from log_parsing import (FIELD_LIMITS, MAX_COUNTER, LogMatcher, count_lines, docker_timestamp_now,
+                         docker_timestamp_to_unix, iter_chunk_lines, iter_line_blocks, normalize_docker_timestamp,
+                         parse_log_line, split_complete_lines, unix_nanos_to_docker_timestamp)
+from logging_setup import setup_logging
+from tracking import (RECENT_COMPLETIONS, CompletionStore, EnvStageTable, ThroughputTracker, format_duration,
+                      percentiles)
+from transports import (FILE_READ_SIZE, READ_CHUNK_SIZE, RECONNECT_ATTEMPTS, RECONNECT_BASE_DELAY,
+                        RECONNECT_MAX_DELAY, TRANSPORTS, DockerError, create_transport)
+
+# 'threads' runs one blocking reader per container; 'selector' multiplexes every
+# container's log pipe on a single selectors loop (POSIX only, pipes are not selectable on Windows).
+FOLLOW_MODES = ('threads', 'selector')
+# Upper bound on stop_monitoring, whatever the number of containers.
+SHUTDOWN_TIMEOUT = 5.0
+# Latest completions listed in the status report.
+STATUS_RECENT_COMPLETIONS = 10
+# Per-container log cursors of the initial scan, so a restart only reads logs produced since the last scan.
+SCAN_STATE_PATH = './output/monitor_state.json'
+# Suffixes stripped from a saved log's file name to get the container name it is replayed as,
+# including docker's own json-file logs (<id>-json.log, rotated as <id>-json.log.1).
+REPLAY_SUFFIX = re.compile(r'(?:-json)?\.log(?:\.\d+)?(?:\.gz)?$|\.gz$')
+
+# How often stalls are checked when the periodic status report is off (-i 0).
+STALL_CHECK_INTERVAL = 30
 
 def parse_args():
     parser = argparse.ArgumentParser(description="Monitor Docker containers based on log outputs.")
     parser.add_argument('-m', '--min_stage', type=int, default=0,
                         help='Minimum stage level to start monitoring (default: 0/off)')
+    parser.add_argument('-f', '--follow_mode', choices=FOLLOW_MODES, default='threads',
+                        help='How container logs are followed: one thread per container, or all '
+                             'containers multiplexed on a single selector loop (default: threads)')
+    parser.add_argument('-t', '--transport', choices=TRANSPORTS, default='auto',
+                        help='Talk to Docker through the Engine API socket or the docker CLI '
+                             '(default: auto, API when the socket is reachable)')
+    parser.add_argument('-i', '--status_interval', type=float, default=60,
+                        help='Seconds between status reports, 0 to only log the final one (default: 60)')
+    parser.add_argument('-p', '--metrics_port', type=int, default=0,
+                        help='Serve Prometheus metrics on this port at /metrics and /metrics.json (default: 0/off)')
+    parser.add_argument('-r', '--replay', nargs='+', metavar='LOG_FILE',
+                        help='Replay saved container logs (plain, --timestamps, docker json-file or .gz) '
+                             'offline instead of monitoring Docker')
+    parser.add_argument('--realtime', action='store_true',
+                        help='Pace the replay by the original log timestamps')
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help='Speed-up factor of a --realtime replay (default: 1.0)')
+    parser.add_argument('--stall_factor', type=float, default=3.0,
+                        help="Flag an env as stalled after this many times its median episode duration "
+                             "without progress (default: 3.0)")
+    parser.add_argument('--stall_window', type=float, default=1800,
+                        help='Seconds without progress that flag an env with no finished episode yet (default: 1800)')
+    parser.add_argument('--stall_hook',
+                        help="Command run when a container gets a stalled env, e.g. 'docker restart {container}' "
+                             "({container} and {envs} are substituted)")
+    parser.add_argument('-e', '--event_db',
+                        help=f"SQLite file the stage and completion events are appended to, '' to disable "
+                             f"(default: {EVENTS_DB_PATH}; replays only store events with -e)")
+    parser.add_argument('-q', '--query', choices=QUERIES,
+                        help='Print a summary from the event database and exit')
+    parser.add_argument('--stage', type=int, default=8,
+                        help='Stage of the time_to_stage query (default: 8)')
+    parser.add_argument('-c', '--collector', metavar='HOST:PORT',
+                        help='Also ship the parsed events to a collector (agent mode)')
+    parser.add_argument('--collect', metavar='[HOST:]PORT',
+                        help=f'Run as the collector: merge the events of the agents into one cluster view '
+                             f'(default port: {COLLECTOR_PORT})')
+    parser.add_argument('--host_name', default=socket.gethostname(),
+                        help='Name this host is reported as by the collector (default: the hostname)')
+    parser.add_argument('-s', '--slow_ratio', type=float, default=0.7,
+                        help="Flag containers whose steps/sec drops below this fraction of their own median (default: 0.7)")
     return parser.parse_args()
 
-def setup_logging():
-    """Sets up logging with both file and console handlers."""
-    logger = logging.getLogger('DockerLogMonitor')
-    logger.propagate = False
-    output_log_path = './output/logs'
-    os.makedirs(os.path.dirname(output_log_path), exist_ok=True)
-
-    logger.setLevel(logging.DEBUG)
-
-    file_formatter = logging.Formatter('%(levelname)s - %(message)s')
-    file_handler = RotatingFileHandler(output_log_path + '/monitor.log', maxBytes=5*1024*1024, backupCount=2)
-    file_handler.setFormatter(file_formatter)
-    file_handler.setLevel(logging.DEBUG)
-
-    console_handler = logging.StreamHandler()
-    console_handler.setFormatter(ColorFormatter())
-    console_handler.setLevel(logging.INFO)
-
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
-    return logger
-
-class ColorFormatter(logging.Formatter):
-    """Custom formatter to add color to console output based on log level."""
-    def format(self, record):
-        if 'reached stage' in record.msg:
-            color = Fore.WHITE
-        elif 'Game completed' in record.msg:
-            color = Fore.YELLOW
+def load_scan_state(path):
+    """Loads the per-container scan cursors, or an empty state if there is none yet."""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def save_scan_state(path, state):
+    """Atomically writes the per-container scan cursors."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, indent=1)
+    os.replace(tmp_path, path)
+
+def format_unix_time(when):
+    """Formats integer seconds since the epoch in local time, like the live completion records."""
+    return datetime.fromtimestamp(when).strftime("%Y-%m-%d %H:%M:%S")
+
+def open_log_file(path):
+    """Opens a saved log for binary streaming, decompressing gzip archives on the fly."""
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    return open(path, 'rb')
+
+def replay_container_name(path):
+    """Names the container a saved log is replayed as: the file name, or the short id of a json-file log."""
+    name = REPLAY_SUFFIX.sub('', os.path.basename(path))
+    if re.fullmatch(r'[0-9a-f]{64}', name):
+        return name[:12]
+    return name
+
+class MonitorMetrics:
+    """Hot-path counters of the log followers, keyed by container.
+
+    Each container is only updated by its own follower, so plain dict updates are
+    enough (no lock); the exposition reads them only when someone scrapes.
+    """
+    def __init__(self):
+        self.lines = {}
+        self.parse_seconds = {}
+        self.last_line = {}
+        self.reconnects = {}
+
+    def observe(self, container, lines, seconds):
+        """Counts a batch of `lines` lines parsed in `seconds`."""
+        self.lines[container] = self.lines.get(container, 0) + lines
+        self.parse_seconds[container] = self.parse_seconds.get(container, 0.0) + seconds
+        self.last_line[container] = time.time()
+
+    def reconnect(self, container):
+        self.reconnects[container] = self.reconnects.get(container, 0) + 1
+
+def prometheus_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def render_prometheus(metrics):
+    """Renders the metrics dict of DockerMonitor.metrics_snapshot in the Prometheus text format."""
+    lines = []
+    for name, (kind, help_text, samples) in metrics.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            label_text = ','.join(f'{key}="{prometheus_label(label)}"' for key, label in labels.items())
+            lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+    return '\n'.join(lines) + '\n'
+
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+    """Serves /metrics (Prometheus text format) and /metrics.json for the monitor on the server."""
+    def do_GET(self):
+        if self.path == '/metrics':
+            body = render_prometheus(self.server.monitor.metrics_snapshot()).encode()
+            content_type = 'text/plain; version=0.0.4; charset=utf-8'
+        elif self.path == '/metrics.json':
+            metrics = self.server.monitor.metrics_snapshot()
+            body = json.dumps({name: [dict(labels, value=value) for labels, value in samples]
+                               for name, (_, _, samples) in metrics.items()}).encode()
+            content_type = 'application/json'
         else:
-            levelno = record.levelno
-            color = Fore.GREEN if levelno == 20 else Fore.RED if levelno >= 40 else Fore.CYAN
-        record.msg = f"{color}{record.msg}{Style.RESET_ALL}"
-        return super(ColorFormatter, self).format(record)
-    
-def create_docker_monitor(min_stage=0, delay_start=5, initial_scan=True):
-    return DockerMonitor(min_stage=min_stage, delay_start=delay_start, initial_scan=initial_scan)
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def running_stalls(stalled, follower_states):
+    """Drops the stalled envs of containers whose follower is gone; they are not running at all."""
+    return {key: info for key, info in stalled.items() if follower_states.get(key[0]) != 'gone'}
+
+def empty_status_snapshot():
+    """The snapshot the first status report is compared against."""
+    return {'stages': {}, 'histogram': {}, 'best': {}, 'reach_times': {}, 'counts': {}, 'total': 0,
+            'throughput': ({}, {}), 'recent': [], 'followers': {}, 'stalled': {}}
+
+def create_docker_monitor(min_stage=0, delay_start=5, initial_scan=True, follow_mode='threads', transport='auto',
+                          status_interval=60, slow_ratio=0.7, event_db=None, collector=None, host_name=None,
+                          metrics_port=0, stall_factor=3.0, stall_window=1800, stall_hook=None):
+    return DockerMonitor(min_stage=min_stage, delay_start=delay_start, initial_scan=initial_scan,
+                         follow_mode=follow_mode, transport=transport, status_interval=status_interval,
+                         slow_ratio=slow_ratio, event_db=event_db, collector=collector, host_name=host_name,
+                         metrics_port=metrics_port, stall_factor=stall_factor, stall_window=stall_window,
+                         stall_hook=stall_hook)
 
 class DockerMonitor:
     """A class to monitor Docker containers for specific log outputs."""
-    def __init__(self, min_stage=0, delay_start=0, initial_scan=False):
+    def __init__(self, min_stage=0, delay_start=0, initial_scan=False, follow_mode='threads',
+                 state_path=SCAN_STATE_PATH, transport='auto', live_discovery=True, event_source=None,
+                 status_interval=60, slow_ratio=0.7, event_db=None, collector=None, host_name=None,
+                 metrics_port=0, stall_factor=3.0, stall_window=1800, stall_hook=None):
+        if follow_mode not in FOLLOW_MODES:
+            raise ValueError(f"Unknown follow mode '{follow_mode}', expected one of {FOLLOW_MODES}.")
         self.logger = setup_logging()
+        # transport=None runs without Docker, e.g. to replay saved logs.
+        self.docker = create_transport(transport) if transport else None
+        if self.docker is not None:
+            self.logger.debug(f"Using the Docker {self.docker.name} transport.")
+        if follow_mode == 'selector' and getattr(self.docker, 'inotify', True) is None:
+            self.logger.warning("inotify is not available to select on json-file logs, following them with threads.")
+            follow_mode = 'threads'
         self.minimum_stage = min_stage
+        self.follow_mode = follow_mode
+        self.matcher = LogMatcher()
         self.delay_start = delay_start
         self.initial_scan = initial_scan
+        self.state_path = state_path
+        self.status_interval = status_interval
+        self.live_discovery = live_discovery
+        # Any iterable of Docker event dicts; defaults to the daemon's events stream.
+        self.event_source = event_source
+        self.events_stream = None
+        self.events_thread = None
+        self.discovery_since = docker_timestamp_now()
         self.containers = self.get_active_containers()
-        self.container_stages = {}
-        self.game_completion = {container: [] for container in self.containers}
+        self.env_stages = EnvStageTable()
+        # Optional consumers of the parsed events: the persistent history (EventStore) and
+        # the link to a multi-host collector (EventShipper).
+        self.event_sinks = []
+        if event_db:
+            self.event_sinks.append(EventStore(event_db, self.logger))
+        if collector:
+            self.event_sinks.append(EventShipper(collector, host_name or socket.gethostname(), self.logger))
+        self.throughput = ThroughputTracker(slow_ratio)
+        self.game_completion = CompletionStore()
+        for container in self.containers:
+            self.game_completion.add_container(container)
         self.lock = threading.Lock()
         self.threads = []
+        self.followers = {}
+        # 'streaming', 'reconnecting' or 'gone' per container, shown in the status report.
+        self.follower_states = {}
+        self.followers_lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.pending_streams = queue.Queue()
+        # The snapshot of the last status report, which the next one is compared against.
+        self.last_status = empty_status_snapshot()
+        self.status_thread = None
+        self.stall_factor = stall_factor
+        self.stall_window = stall_window
+        # Command template run once per container when it gets a stalled env.
+        self.stall_hook = stall_hook
+        self.metrics = MonitorMetrics()
+        self.metrics_port = metrics_port
+        self.metrics_server = None
+        # Pipe that interrupts the selector loop's select, created when the loop starts.
+        self.wakeup_read = self.wakeup_write = None
         self.monitoring = True
 
     def get_active_containers(self):
         """Fetches a list of currently active Docker containers."""
-        command = ["docker", "ps", "--format", "{{.Names}}"]
+        if self.docker is None:
+            return []
         try:
-            result = subprocess.check_output(command).decode().strip().split('\n')
+            result = self.docker.list_containers()
             self.logger.debug("Active containers: " + ", ".join(result))
             return result
-        except subprocess.CalledProcessError as e:
+        except DockerError as e:
             self.logger.error("Failed to get Docker containers: " + str(e))
             return []
 
     def scan_for_completed_games(self):
-        """Scans for already completed games upon initial startup."""
+        """Scans the logs produced since the last scan for completed games upon startup."""
+        state = load_scan_state(self.state_path)
+        recent = []
         for container in self.containers:
-            self.logger.debug(f"Scanning past logs for completed games in container: {container}")
-            cmd = ["docker", "logs", container]
-            process = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-            completions = process.stdout.count("Game completed!")
-            self.game_completion[container] += [f"Past completion: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"] * completions
-            self.logger.debug(f"Found {completions} past completions for {container}")
-        total_completions = sum(len(completions) for completions in self.game_completion.values())
+            cursor = state.setdefault(container, {'since': None, 'lines': 0, 'bytes': 0, 'completions': 0, 'recent': []})
+            if isinstance(cursor['completions'], list):
+                # Cursors written before completions were bounded kept every [timestamp, env] record.
+                cursor['recent'] = [[int(float(docker_timestamp_to_unix(timestamp))), int(env_number)]
+                                    for timestamp, env_number in cursor['completions'][-RECENT_COMPLETIONS:]]
+                cursor['completions'] = len(cursor['completions'])
+            self.logger.debug(f"Scanning past logs for completed games in container: {container} (since {cursor['since'] or 'start'})")
+            found = self.scan_container_logs(container, cursor)
+            with self.lock:
+                self.game_completion.counts[container] = self.game_completion.counts.get(container, 0) + cursor['completions']
+            recent += [(when, container, env_number) for when, env_number in cursor['recent']]
+            self.logger.debug(f"Found {found} new past completions for {container} ({cursor['completions']} in total)")
+        save_scan_state(self.state_path, state)
+        with self.lock:
+            self.game_completion.recent.extend(sorted(recent))
+            total_completions = self.game_completion.total()
         self.logger.info(f"Total past completions: {total_completions}")
 
-    def follow_logs(self, container_name):
-        """Follows the logs of a specific container and processes relevant output."""
-        start_time = datetime.now().isoformat()
-        cmd = ["docker", "logs", "--since", start_time, "-f", container_name]
-        with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, bufsize=1) as process:
+    def scan_container_logs(self, container, cursor):
+        """Streams a container's logs after its cursor, advancing the cursor and recording completions."""
+        since = cursor['since']
+        found = 0
+        recent = deque(cursor['recent'], maxlen=RECENT_COMPLETIONS)
+        last_line = None
+        # --since is inclusive, so lines at the cursor itself were already counted by the last scan.
+        at_cursor = bool(since)
+        marker = self.matcher.event_markers['game_completed']
+        try:
+            stream = self.docker.open_logs(container, since=since, timestamps=True)
+        except DockerError as e:
+            self.logger.error(f"Failed to scan logs of {container}: {e}")
+            return 0
+        try:
+            for raw_line in iter_chunk_lines(stream):
+                if at_cursor:
+                    if normalize_docker_timestamp(raw_line.partition(b' ')[0].decode()) <= since:
+                        continue
+                    at_cursor = False
+                cursor['bytes'] += len(raw_line) + 1
+                cursor['lines'] += 1
+                last_line = raw_line
+                if marker not in raw_line:
+                    continue
+                timestamp, _, message = raw_line.decode(errors='replace').partition(' ')
+                matched = self.matcher.match(message)
+                if matched and matched[0] == 'game_completed':
+                    when = float(docker_timestamp_to_unix(timestamp))
+                    recent.append([int(when), int(matched[1]['env'])])
+                    found += 1
+                    self.record_event(when, container, int(matched[1]['env']), 'game_completed', scanned=True)
+        finally:
+            stream.close()
+        if last_line:
+            cursor['since'] = normalize_docker_timestamp(last_line.decode(errors='replace').partition(' ')[0])
+        cursor['completions'] += found
+        cursor['recent'] = list(recent)
+        return found
+
+    def attach_follower(self, container, since):
+        """Starts following a container's logs from `since` unless it is already followed."""
+        with self.followers_lock:
+            if container in self.followers or not self.monitoring:
+                return
+            try:
+                stream = self.docker.open_logs(container, since=since, follow=True)
+            except DockerError as e:
+                self.logger.error(f"Failed to follow logs of {container}: {e}")
+                self.follower_states[container] = 'gone'
+                return
+            self.followers[container] = stream
+            self.follower_states[container] = 'streaming'
+        with self.lock:
+            if container not in self.containers:
+                self.containers.append(container)
+            self.game_completion.add_container(container)
+        self.logger.debug(f"Following logs of {container}.")
+        if self.follow_mode == 'selector':
+            self.pending_streams.put((container, stream))
+            os.write(self.wakeup_write, b'\0')
+        else:
+            thread = threading.Thread(target=self.follow_logs, args=(container, stream), daemon=True)
+            self.threads.append(thread)
+            thread.start()
+
+    def detach_follower(self, container):
+        """Stops following a container that is gone; its reader sees the end of the stream and cleans up."""
+        with self.followers_lock:
+            stream = self.followers.pop(container, None)
+            self.follower_states[container] = 'gone'
+        if stream is not None:
+            self.logger.debug(f"Stopped following logs of {container}.")
+            stream.interrupt()
+
+    def release_follower(self, container, stream):
+        """Forgets a follower whose stream ended; returns False if it was detached or replaced meanwhile."""
+        with self.followers_lock:
+            current = self.followers.get(container) is stream
+            if current:
+                del self.followers[container]
+        stream.close()
+        return current and self.monitoring
+
+    def reconnect_delay(self, attempt):
+        """Returns the capped exponential backoff before reconnect `attempt`."""
+        return min(RECONNECT_BASE_DELAY * 2 ** attempt, RECONNECT_MAX_DELAY)
+
+    def schedule_reconnect(self, container, attempt):
+        """Marks a follower as reconnecting, or as gone once it ran out of attempts.
+
+        Returns False if the follower should not be reconnected at all.
+        """
+        with self.followers_lock:
+            if self.follower_states.get(container) == 'gone' or container in self.followers:
+                return False
+            # `attempt` is the reconnect about to be made, so attempt - 1 reconnects have failed so far.
+            if attempt > RECONNECT_ATTEMPTS:
+                self.follower_states[container] = 'gone'
+                self.logger.info(f"Giving up on the logs of {container} after {attempt - 1} reconnects without output.")
+                return False
+            self.follower_states[container] = 'reconnecting'
+        self.metrics.reconnect(container)
+        self.logger.debug(f"Reconnecting to the logs of {container} in {self.reconnect_delay(attempt):.0f}s (attempt {attempt + 1}).")
+        return True
+
+    def reopen_follower(self, container, since):
+        """Reopens a reconnecting follower's stream; returns None if it failed or is no longer needed."""
+        with self.followers_lock:
+            if (self.follower_states.get(container) != 'reconnecting' or container in self.followers
+                    or not self.monitoring):
+                return None
+            try:
+                stream = self.docker.open_logs(container, since=since, follow=True)
+            except DockerError as e:
+                self.logger.debug(f"Reconnecting to the logs of {container} failed: {e}")
+                return None
+            self.followers[container] = stream
+            self.follower_states[container] = 'streaming'
+        return stream
+
+    def follow_logs(self, container_name, stream):
+        """Follows the logs of a specific container, reconnecting with backoff when its stream ends."""
+        attempt = 0
+        while stream is not None:
+            received = False
+            try:
+                for block in iter_line_blocks(stream):
+                    received = True
+                    if not self.monitoring:
+                        break
+                    self.process_block(block, container_name)
+            except OSError as e:
+                self.logger.error(f"Lost the log stream of {container_name}: {e}")
+            # Resume from the moment the stream ended so nothing logged during the backoff is lost.
+            since = docker_timestamp_now()
+            if not self.release_follower(container_name, stream):
+                return
+            attempt = 0 if received else attempt + 1
+            stream = None
+            while stream is None and self.schedule_reconnect(container_name, attempt):
+                if self.stopped.wait(self.reconnect_delay(attempt)):
+                    return
+                stream = self.reopen_follower(container_name, since)
+                if stream is None:
+                    attempt += 1
+
+    def multiplex_logs(self):
+        """Follows the logs of all attached containers on a single selector loop.
+
+        Every container's log stream (a `docker logs -f` pipe or an Engine API socket) is
+        registered non-blocking with one selector, read in large chunks as it becomes ready
+        and split into lines for `process_output`, so the number of monitor threads no
+        longer grows with the number of containers. Streams attached later are handed over
+        through `pending_streams`, and a byte on the wakeup pipe interrupts the select.
+        Ended streams are reopened from a heap of due reconnects instead of sleeping.
+        """
+        selector = selectors.DefaultSelector()
+        selector.register(self.wakeup_read, selectors.EVENT_READ, None)
+        # (due time, container, since, attempt) of the followers waiting to reconnect.
+        reconnects = []
+        # Keys of the streams registered since the last select. They are read once right away:
+        # output a stream buffered while it was opened (the body bytes received with the Engine
+        # API response head, the backlog of a json-file log) does not make it selectable.
+        fresh = []
+
+        def register(container, stream, attempt=0):
+            stream.set_blocking(False)
+            # Data holds the container name, any partial line left over from the last read,
+            # and the number of reconnects in a row without output (-1 once the stream produced some).
+            fresh.append(selector.register(stream, selectors.EVENT_READ, [container, b'', attempt]))
+
+        try:
             while self.monitoring:
-                output = process.stdout.readline()
-                if output:
-                    self.process_output(output.strip(), container_name)
+                timeout = 0.0 if fresh else 1.0
+                if reconnects:
+                    timeout = min(timeout, max(0.0, reconnects[0][0] - time.monotonic()))
+                ready = [key for key, _ in selector.select(timeout=timeout)]
+                ready += [key for key in fresh if key not in ready]
+                del fresh[:]
+                for key in ready:
+                    if key.data is None:
+                        os.read(self.wakeup_read, READ_CHUNK_SIZE)
+                        while not self.pending_streams.empty():
+                            register(*self.pending_streams.get_nowait())
+                        continue
+                    container, pending, attempt = key.data
+                    try:
+                        chunk = key.fileobj.read_chunk()
+                    except BlockingIOError:
+                        continue
+                    except OSError as e:
+                        self.logger.error(f"Lost the log stream of {container}: {e}")
+                        chunk = b''
+                    if not chunk:
+                        # The log stream ended; stop polling it and reconnect unless it was detached.
+                        selector.unregister(key.fileobj)
+                        if pending:
+                            self.process_block(pending, container)
+                        attempt += 1
+                        if self.release_follower(container, key.fileobj) and self.schedule_reconnect(container, attempt):
+                            heapq.heappush(reconnects, (time.monotonic() + self.reconnect_delay(attempt),
+                                                        container, docker_timestamp_now(), attempt))
+                        continue
+                    key.data[2] = -1
+                    block, key.data[1] = split_complete_lines(pending, chunk)
+                    if block:
+                        self.process_block(block, container)
+
+                while reconnects and reconnects[0][0] <= time.monotonic():
+                    _, container, since, attempt = heapq.heappop(reconnects)
+                    stream = self.reopen_follower(container, since)
+                    if stream is not None:
+                        register(container, stream, attempt)
+                    elif self.schedule_reconnect(container, attempt + 1):
+                        heapq.heappush(reconnects, (time.monotonic() + self.reconnect_delay(attempt + 1),
+                                                    container, since, attempt + 1))
+        finally:
+            for key in list(selector.get_map().values()):
+                if key.data is not None:
+                    self.release_follower(key.data[0], key.fileobj)
+            selector.close()
+
+    def docker_events(self, since):
+        """Yields container events from the Docker daemon, reconnecting if the stream drops."""
+        while self.monitoring:
+            try:
+                self.events_stream = self.docker.open_events(since=since)
+            except DockerError as e:
+                self.logger.error(f"Failed to subscribe to Docker events: {e}")
+                self.stopped.wait(1)
+                continue
+            try:
+                for raw_line in iter_chunk_lines(self.events_stream):
+                    if not raw_line.strip():
+                        continue
+                    event = json.loads(raw_line)
+                    if 'timeNano' in event:
+                        since = unix_nanos_to_docker_timestamp(event['timeNano'])
+                    yield event
+            except (OSError, ValueError) as e:
+                self.logger.error(f"Lost the Docker events stream: {e}")
+            finally:
+                self.events_stream.close()
+            self.stopped.wait(1)
 
-    def process_output(self, output, container_name):
-        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        stage_match = re.search(r'\((\d+)\)Moving to stage (\d+) of (\d+)', output)
-        episode_done_match = re.search(r'\((\d+)\)Episode done', output)
-        game_completed_match = re.search(r'\((\d+)\)Game completed!', output)
+    def watch_events(self, events):
+        """Attaches and detaches log followers as containers start, die and restart."""
+        for event in events:
+            if not self.monitoring:
+                break
+            action = event.get('Action') or event.get('status')
+            name = event.get('Actor', {}).get('Attributes', {}).get('name')
+            if event.get('Type', 'container') != 'container' or not name:
+                continue
+            if action in ('start', 'restart'):
+                since = unix_nanos_to_docker_timestamp(event['timeNano']) if 'timeNano' in event else docker_timestamp_now()
+                self.attach_follower(name, since)
+            elif action == 'die':
+                self.detach_follower(name)
 
+    def process_block(self, block, container_name):
+        """Processes the complete lines of one chunk read from a follower, counting them in the metrics.
+
+        Only the lines the marker prefilter accepts are decoded and parsed; a line that fails
+        is logged and skipped.
+        """
+        started = time.perf_counter()
+        for line in self.matcher.candidate_lines(block):
+            try:
+                self.process_output(line.decode(errors='replace').strip(), container_name)
+            except Exception:
+                # One unexpected line must not stop the follower, or with the selector, every follower.
+                self.logger.exception(f"Failed to process a log line of {container_name}: {line[:200]!r}")
+        self.metrics.observe(container_name, count_lines(block), time.perf_counter() - started)
+
+    def process_output(self, output, container_name, when=None, scanned=False):
+        """Applies one log line to the tracked state and returns the event it matched, if any.
+
+        `when` is the time the line was logged (seconds since the epoch), defaulting to now.
+        `scanned` marks lines read again from saved logs (replays), whose events the sinks may
+        already hold; those without a time are applied now, and kept out of the event history.
+        """
+        matched = self.matcher.match(output)
+        if matched is None:
+            return None
+        timed = when is not None or not scanned
+        if when is None:
+            when = time.time()
+        event, fields = matched
+        if any(int(fields[name]) > FIELD_LIMITS.get(name, MAX_COUNTER) for name in self.matcher.event_fields[event]):
+            self.logger.warning(f"Ignoring a line of {container_name} with out-of-range numbers: {output[:200]!r}")
+            return None
+        if event == 'time_elapsed':
+            with self.lock:
+                self.throughput.time_elapsed(container_name, int(fields['elapsed_seconds']))
+            self.record_event(when, container_name, None, event, int(fields['elapsed_seconds']),
+                              scanned=scanned, timed=timed)
+            return event
+        if event == 'total_timesteps':
+            with self.lock:
+                self.throughput.total_timesteps(container_name, int(fields['timesteps']), when)
+            self.record_event(when, container_name, None, event, int(fields['timesteps']),
+                              scanned=scanned, timed=timed)
+            return event
+        env_number = fields['env']
+        current_time = datetime.fromtimestamp(when).strftime("%Y-%m-%d %H:%M:%S")
+
+        # Only the state update holds the lock; the message is logged after releasing it.
+        message = None
         with self.lock:
-            if stage_match:
-                env_number, current_stage, max_stage = stage_match.groups()
+            if event == 'stage':
+                current_stage, max_stage = fields['current_stage'], fields['max_stage']
+                self.env_stages.enter_stage(container_name, int(env_number), int(current_stage), int(max_stage), when)
                 if int(current_stage) >= self.minimum_stage:
-                    self.container_stages[container_name] = f"[{current_time}] {container_name}({env_number}) reached stage {current_stage} of {max_stage}"
-                    self.logger.debug(f"[{current_time}] {container_name}({env_number}) reached stage {current_stage}. Now monitoring...")
-
-            if episode_done_match:
-                env_number = episode_done_match.group(1)
-                if container_name in self.container_stages:
-                    self.logger.debug(f"[{current_time}] 'Episode done' for {container_name}({env_number}): Monitoring stopped.")
-                    del self.container_stages[container_name]
-
-            if game_completed_match:
-                env_number = game_completed_match.group(1)
-                completion_info = f"[{current_time}] {container_name}({env_number}): Game completed!"
-                if container_name not in self.game_completion:
-                    self.game_completion[container_name] = []
-                self.game_completion[container_name].append(completion_info)
-                self.logger.debug(f"[{current_time}] {container_name}({env_number}) completed the game at {current_time}! Congratulations!")
+                    message = f"[{current_time}] {container_name}({env_number}) reached stage {current_stage}. Now monitoring..."
+
+            elif event == 'episode_done':
+                index = self.env_stages.slots.get((container_name, int(env_number)))
+                if index is not None and self.env_stages.stage[index] >= self.minimum_stage:
+                    message = f"[{current_time}] 'Episode done' for {container_name}({env_number}): Monitoring stopped."
+                self.env_stages.end_episode(container_name, int(env_number), when)
+
+            elif event == 'game_completed':
+                self.game_completion.add(container_name, env_number, when)
+                message = f"[{current_time}] {container_name}({env_number}) completed the game at {current_time}! Congratulations!"
+        if message is not None:
+            self.logger.debug(message)
+        if event == 'stage':
+            self.record_event(when, container_name, int(env_number), event, int(fields['current_stage']),
+                              int(fields['max_stage']), scanned=scanned, timed=timed)
+        else:
+            self.record_event(when, container_name, int(env_number), event, scanned=scanned, timed=timed)
+        return event
+
+    def record_event(self, when, container, env_number, event, value=None, max_stage=None, scanned=False,
+                     timed=True):
+        """Hands a parsed event to the event sinks that take it.
+
+        `scanned` marks events found by the initial scan or a replay, which sinks may already hold from a previous run.
+        Events that are not `timed` (replayed from lines without a timestamp) skip the sinks keeping a history.
+        """
+        for sink in self.event_sinks:
+            if event in sink.events and (timed or not sink.history):
+                record = sink.record_scanned if scanned else sink.record
+                record(when, container, env_number, event, value, max_stage)
+
+    def close_event_sinks(self, timeout=SHUTDOWN_TIMEOUT):
+        """Flushes and stops the event sinks."""
+        for sink in self.event_sinks:
+            sink.close(timeout=timeout)
+
+    def replay_file(self, path, totals):
+        """Yields (time, container, message) for the lines of a saved log that carry a known marker.
+
+        Every line read is counted in totals['lines']; lines without a timestamp get the previous one.
+        """
+        container = replay_container_name(path)
+        when = None
+        pending = b''
+        with open_log_file(path) as f:
+            while True:
+                chunk = f.read(FILE_READ_SIZE)
+                block, pending = split_complete_lines(pending, chunk) if chunk else (pending, b'')
+                if block:
+                    totals['lines'] += count_lines(block)
+                    for raw_line in self.matcher.candidate_lines(block):
+                        line_time, message = parse_log_line(raw_line)
+                        if line_time is not None:
+                            when = line_time
+                        yield when, container, message
+                if not chunk:
+                    break
+
+    def replay(self, paths, realtime=False, speed=1.0):
+        """Runs saved logs through process_output without Docker and returns replay statistics.
+
+        Files are streamed one after the other as fast as possible or, with `realtime`, merged
+        in timestamp order and paced by their original timestamps sped up by `speed`. The events
+        go to the sinks as scanned ones, so replaying logs again does not store them twice.
+        """
+        totals = {'lines': 0}
+        events = {}
+        sources = [self.replay_file(path, totals) for path in paths]
+        if realtime:
+            records = heapq.merge(*sources, key=lambda record: record[0] or 0)
+        else:
+            records = itertools.chain(*sources)
+        started = time.perf_counter()
+        origin = last = None
+        for when, container, message in records:
+            if realtime and when is not None:
+                if origin is None:
+                    origin = when
+                delay = started + (when - origin) / speed - time.perf_counter()
+                if delay > 0 and self.stopped.wait(delay):
+                    break
+            event = self.process_output(message, container, when, scanned=True)
+            if event is not None:
+                events[event] = events.get(event, 0) + 1
+            if when is not None:
+                last = when
+        seconds = time.perf_counter() - started
+        return {'lines': totals['lines'], 'seconds': seconds, 'events': events, 'until': last}
+
+    def report_replay(self, stats):
+        """Logs the final status of a replay followed by its throughput and per-event counts."""
+        self.report_status(empty_status_snapshot(), self.status_snapshot(stats['until']))
+        rate = stats['lines'] / stats['seconds'] if stats['seconds'] else 0
+        self.logger.info(f"Replayed {stats['lines']} line(s) in {stats['seconds']:.2f}s ({rate:,.0f} lines/s)")
+        counts = ', '.join(f"{event}: {count}" for event, count in sorted(stats['events'].items()))
+        self.logger.info(f"Events: {counts or 'none'}")
+
+    def status_snapshot(self, now=None):
+        """Copies the state the status report needs; the only part of reporting done under the locks."""
+        if now is None:
+            now = time.time()
+        with self.lock:
+            snapshot = {
+                'stages': self.env_stages.current(self.minimum_stage),
+                'histogram': self.env_stages.histogram(),
+                'best': self.env_stages.best_stages(),
+                'reach_times': {stage: list(samples) for stage, samples in self.env_stages.reach_times.items()},
+                'counts': dict(self.game_completion.counts),
+                'total': self.game_completion.total(),
+                'throughput': self.throughput.snapshot(now),
+                'recent': list(self.game_completion.recent)[-STATUS_RECENT_COMPLETIONS:],
+                'stalled': self.env_stages.stalled(now, self.stall_factor, self.stall_window),
+            }
+        with self.followers_lock:
+            snapshot['followers'] = dict(self.follower_states)
+        snapshot['stalled'] = running_stalls(snapshot['stalled'], snapshot['followers'])
+        return snapshot
+
+    def metrics_snapshot(self):
+        """Returns {metric name: (type, help, [(labels, value)])} for the metrics endpoint."""
+        now = time.time()
+        with self.lock:
+            envs = [(container, env_number, self.env_stages.stage[index], self.env_stages.max_stage[index])
+                    for (container, env_number), index in self.env_stages.slots.items()]
+            idle = [(container, env_number, now - self.env_stages.last_progress[index])
+                    for (container, env_number), index in self.env_stages.slots.items()]
+            stalled = self.env_stages.stalled(now, self.stall_factor, self.stall_window)
+            completions = dict(self.game_completion.counts)
+            rates, _ = self.throughput.snapshot(now)
+        with self.followers_lock:
+            states = dict(self.follower_states)
+        stalled = running_stalls(stalled, states)
+        lines = dict(self.metrics.lines)
+        parse_seconds = dict(self.metrics.parse_seconds)
+        last_line = dict(self.metrics.last_line)
+        reconnects = dict(self.metrics.reconnects)
+        return {
+            'diambra_env_stage': ('gauge', 'Current stage of a training env, 0 between episodes.',
+                                  [({'container': c, 'env': e}, stage) for c, e, stage, _ in envs]),
+            'diambra_env_best_stage': ('gauge', 'Highest stage a training env ever reached.',
+                                       [({'container': c, 'env': e}, best) for c, e, _, best in envs]),
+            'diambra_env_idle_seconds': ('gauge', 'Seconds since a training env last made stage or episode progress.',
+                                         [({'container': c, 'env': e}, round(seconds, 3)) for c, e, seconds in idle]),
+            'diambra_env_stalled': ('gauge', 'Whether a training env went without progress for longer than its window.',
+                                    [({'container': c, 'env': e}, int((c, e) in stalled)) for c, e, _ in idle]),
+            'diambra_games_completed_total': ('counter', 'Games completed per container.',
+                                              [({'container': c}, count) for c, count in sorted(completions.items())]),
+            'diambra_steps_per_second': ('gauge', 'Rolling training steps/sec from the SB3 log tables.',
+                                         [({'container': c}, round(rate, 3)) for c, rate in sorted(rates.items())]),
+            'diambra_monitor_lines_total': ('counter', 'Log lines processed per container.',
+                                            [({'container': c}, count) for c, count in sorted(lines.items())]),
+            'diambra_monitor_parse_seconds_total': ('counter', 'Time spent parsing log lines per container.',
+                                                    [({'container': c}, round(seconds, 6))
+                                                     for c, seconds in sorted(parse_seconds.items())]),
+            'diambra_monitor_follower_lag_seconds': ('gauge', 'Seconds since a follower last received log output.',
+                                                     [({'container': c}, round(now - when, 3))
+                                                      for c, when in sorted(last_line.items())]),
+            'diambra_monitor_follower_reconnects_total': ('counter', 'Reconnects of a container log follower.',
+                                                          [({'container': c}, count)
+                                                           for c, count in sorted(reconnects.items())]),
+            'diambra_monitor_follower_up': ('gauge', 'Whether a container log follower is streaming.',
+                                            [({'container': c, 'state': state}, int(state == 'streaming'))
+                                             for c, state in sorted(states.items())]),
+        }
+
+    def start_metrics_server(self):
+        """Serves the metrics endpoint from a daemon thread."""
+        try:
+            self.metrics_server = http.server.ThreadingHTTPServer(('', self.metrics_port), MetricsHandler)
+        except OSError as e:
+            self.logger.error(f"Failed to serve metrics on port {self.metrics_port}: {e}")
+            return
+        self.metrics_server.daemon_threads = True
+        self.metrics_server.monitor = self
+        threading.Thread(target=self.metrics_server.serve_forever, name='metrics', daemon=True).start()
+        self.logger.info(f"Serving metrics on port {self.metrics_server.server_address[1]} (/metrics, /metrics.json).")
+
+    def report_status(self, previous, current):
+        """Logs what changed between two status snapshots plus a stage histogram across containers."""
+        stages, old_stages = current['stages'], previous['stages']
+        changed = {container: info for container, info in stages.items() if old_stages.get(container) != info}
+        finished = [container for container in old_stages if container not in stages]
+        new_completions = current['total'] - previous['total']
+        if not (changed or finished or new_completions or current['followers'] != previous['followers']):
+            self.logger.info(f"No changes since the last report ({len(stages)} container(s) monitored, "
+                             f"{current['total']} game(s) completed).")
+            self.report_throughput(*current['throughput'])
+            self.report_stalls(previous, current)
+            return
+
+        if stages:
+            containers = len({container for container, _ in stages})
+            self.logger.info(f"***Currently monitoring statuses for {len(stages)} env(s) in {containers} container(s)***")
+        elif finished:
+            self.logger.info("No containers are currently monitored.")
+        for (container, env_number), (when, stage, max_stage) in sorted(changed.items()):
+            self.logger.info(f"[{format_unix_time(when)}] {container}({env_number}) reached stage {stage} of {max_stage}")
+        for container, env_number in sorted(finished):
+            self.logger.info(f"{container}({env_number}): episode done, no longer monitored")
+        if current['histogram']:
+            counts = ', '.join(f"stage {stage}: {count}" for stage, count in sorted(current['histogram'].items()))
+            self.logger.info(f"Envs per stage: {counts}")
+        reach = []
+        for stage, samples in sorted(current['reach_times'].items()):
+            p50, p90 = percentiles(samples)
+            reach.append(f"stage {stage}: p50 {format_duration(p50)} / p90 {format_duration(p90)}")
+        if reach:
+            self.logger.info(f"Time to reach stage: {'; '.join(reach)}")
+        improved = [f"{container} {stage}" for container, stage in sorted(current['best'].items())
+                    if stage != previous['best'].get(container)]
+        if improved:
+            self.logger.info(f"Best stage reached: {', '.join(improved)}")
+        self.report_throughput(*current['throughput'])
+
+        if new_completions:
+            self.logger.info(f"***{current['total']} Game(s) Completed!*** (+{new_completions} since the last report)")
+            for container, count in sorted(current['counts'].items()):
+                if count != previous['counts'].get(container, 0):
+                    self.logger.info(f"{container}: {count} game(s) completed")
+            for when, container, env_number in current['recent'][-new_completions:]:
+                self.logger.info(f"[{format_unix_time(when)}] {container}({env_number}): Game completed!")
+
+        if current['followers'] != previous['followers']:
+            self.log_follower_states(current['followers'])
+        self.report_stalls(previous, current)
+
+    def report_stalls(self, previous, current):
+        """Logs the envs that stalled or recovered since the last report and runs the stall hook."""
+        stalled, old_stalled = current['stalled'], previous['stalled']
+        new = {key: info for key, info in stalled.items() if key not in old_stalled}
+        for (container, env_number), (idle, window) in sorted(new.items()):
+            self.logger.warning(f"{container}({env_number}) looks stalled: no progress for {format_duration(idle)} "
+                                f"(window {format_duration(window)})")
+        recovered = sorted(key for key in old_stalled if key not in stalled)
+        if recovered:
+            self.logger.info(f"Making progress again: {', '.join(f'{c}({e})' for c, e in recovered)}")
+        if stalled:
+            containers = sorted({container for container, _ in stalled})
+            self.logger.warning(f"{len(stalled)} stalled env(s) in {len(containers)} container(s): {', '.join(containers)}")
+        old_containers = {container for container, _ in old_stalled}
+        for container in sorted({container for container, _ in new} - old_containers):
+            envs = ','.join(str(env_number) for c, env_number in sorted(stalled) if c == container)
+            self.run_stall_hook(container, envs)
+
+    def run_stall_hook(self, container, envs):
+        """Starts the stall hook command for a container, without waiting for it."""
+        if not self.stall_hook:
+            return
+        command = [part.format(container=container, envs=envs) for part in shlex.split(self.stall_hook)]
+        self.logger.info(f"Running the stall hook for {container}: {shlex.join(command)}")
+        try:
+            subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        except OSError as e:
+            self.logger.error(f"Failed to run the stall hook for {container}: {e}")
+
+    def report_throughput(self, rates, slow):
+        """Logs the host's training steps/sec and the containers running slow against their own history."""
+        if not rates:
+            return
+        per_container = ', '.join(f"{container} {rate:.0f}" for container, rate in sorted(rates.items()))
+        self.logger.info(f"Throughput: {sum(rates.values()):.0f} steps/s on this host ({per_container})")
+        for container, (rate, median) in sorted(slow.items()):
+            self.logger.warning(f"{container} is running slow: {rate:.0f} steps/s, "
+                                f"{100 * rate / median:.0f}% of its median {median:.0f} steps/s")
 
     def print_current_status(self):
-        """Periodically logs the current status of the monitored containers."""
+        """Periodically logs what changed in the monitored containers since the last report."""
+        # With the periodic report off, only the stall detection runs.
+        reporting = self.status_interval > 0
         while self.monitoring:
-            with self.lock:
-                if not self.container_stages and all(not completions for completions in self.game_completion.values()):
-                    self.logger.info("No containers are currently monitored.")
-                else:
-                    if self.container_stages:
-                        self.logger.info(f"***Currently monitoring statuses for {len(self.container_stages)} container(s)***")
-                        for container, stage_info in self.container_stages.items():
-                            self.logger.info(stage_info)
-                    total_completions = sum(len(completions) for completions in self.game_completion.values())
-                    if total_completions:
-                        self.logger.info(f"***{total_completions} Game(s) Completed!***")
-                        for container, completions in self.game_completion.items():
-                            for completion in completions:
-                                self.logger.info(completion)
-                    else:
-                        self.logger.info("No games have been completed yet.")
-            time.sleep(60)
+            current = self.status_snapshot()
+            if reporting:
+                self.report_status(self.last_status, current)
+            else:
+                self.report_stalls(self.last_status, current)
+            self.last_status = current
+            self.stopped.wait(self.status_interval if reporting else STALL_CHECK_INTERVAL)
+
+    def log_follower_states(self, states):
+        """Logs how many log followers are streaming, reconnecting or gone."""
+        if not states:
+            return
+        summary = []
+        for state in ('streaming', 'reconnecting', 'gone'):
+            containers = sorted(container for container, s in states.items() if s == state)
+            if containers:
+                listed = f" ({', '.join(containers)})" if state != 'streaming' else ""
+                summary.append(f"{len(containers)} {state}{listed}")
+        self.logger.info(f"Log followers: {', '.join(summary)}")
 
     def start_monitoring(self):
         # Check if minimum stage is equal to 0
@@ -161,29 +917,102 @@ class DockerMonitor:
             self.logger.info(f"Delaying start of monitoring for {self.delay_start} seconds.")
             time.sleep(self.delay_start)
 
-        self.status_thread = threading.Thread(target=self.print_current_status)
+        if self.metrics_port:
+            self.start_metrics_server()
+        self.status_thread = threading.Thread(target=self.print_current_status, daemon=True)
         self.status_thread.start()
-        for container in self.containers:
-            thread = threading.Thread(target=self.follow_logs, args=(container,))
+        if self.follow_mode == 'selector':
+            self.wakeup_read, self.wakeup_write = os.pipe()
+            thread = threading.Thread(target=self.multiplex_logs, daemon=True)
             self.threads.append(thread)
             thread.start()
+        start_time = docker_timestamp_now()
+        for container in list(self.containers):
+            self.attach_follower(container, start_time)
+        if self.live_discovery:
+            # Replay events since the container snapshot so nothing started in between is missed.
+            events = self.event_source if self.event_source is not None else self.docker_events(self.discovery_since)
+            self.events_thread = threading.Thread(target=self.watch_events, args=(events,), daemon=True)
+            self.events_thread.start()
+
+    def stop_monitoring(self, timeout=SHUTDOWN_TIMEOUT):
+        """Stops all monitoring activities and logs a final status, within `timeout` seconds.
 
-    def stop_monitoring(self):
-        """Stops all monitoring activities."""
+        Every log stream is interrupted at once (the `docker logs` children terminated, API
+        sockets shut down), which wakes all blocked readers together; the threads are then
+        joined against a single deadline, so shutdown does not grow with the number of containers.
+        """
+        deadline = time.monotonic() + timeout
         self.monitoring = False
-        for thread in self.threads:
-            thread.join(timeout=5)  # Join with timeout to prevent hang up
-        if self.status_thread.is_alive():
-            self.status_thread.join(timeout=5) 
+        self.stopped.set()
+        with self.followers_lock:
+            streams = list(self.followers.values())
+        for stream in streams:
+            stream.interrupt()
+        if self.events_stream is not None:
+            self.events_stream.interrupt()
+        if self.wakeup_write is not None:
+            os.write(self.wakeup_write, b'\0')
+        threads = self.threads + [self.status_thread, self.events_thread]
+        for thread in threads:
+            if thread is not None:
+                thread.join(timeout=max(0.0, deadline - time.monotonic()))
+        stuck = [thread.name for thread in threads if thread is not None and thread.is_alive()]
+        if stuck:
+            self.logger.warning(f"{len(stuck)} thread(s) still running after {timeout:.0f}s, leaving them behind.")
+        if self.status_thread is not None:
+            self.logger.info("Final status:")
+            self.report_status(self.last_status, self.status_snapshot())
+        if self.metrics_server is not None:
+            self.metrics_server.shutdown()
+            self.metrics_server.server_close()
+        self.close_event_sinks(timeout=max(1.0, deadline - time.monotonic()))
             
 if __name__ == "__main__":
     args = parse_args()
+    event_db = EVENTS_DB_PATH if args.event_db is None else args.event_db
+
+    if args.query:
+        run_query(event_db, args.query, args.stage)
+        exit(0)
+
+    collector = parse_address(args.collector) if args.collector else None
+
+    if args.collect:
+        collector = EventCollector(parse_address(args.collect, default_host='0.0.0.0'),
+                                   status_interval=args.status_interval, slow_ratio=args.slow_ratio)
+        try:
+            collector.serve()
+        except KeyboardInterrupt:
+            print("Interrupted by user, stopping the collector...")
+        collector.report_cluster()
+        exit(0)
+
+    if args.replay:
+        monitor = DockerMonitor(min_stage=args.min_stage, transport=None, live_discovery=False,
+                                slow_ratio=args.slow_ratio, event_db=args.event_db, collector=collector,
+                                host_name=args.host_name)
+        try:
+            stats = monitor.replay(args.replay, realtime=args.realtime, speed=args.speed)
+        except KeyboardInterrupt:
+            print("Interrupted by user, stopping replay...")
+            stats = None
+        monitor.close_event_sinks()
+        if stats is None:
+            exit(1)
+        monitor.report_replay(stats)
+        exit(0)
 
     if args.min_stage > 0:
         print(f"Setting minimum stage to {args.min_stage}")
         delay_start = 5 
         initial_scan = True 
-        monitor = create_docker_monitor(min_stage=args.min_stage)
+        monitor = create_docker_monitor(min_stage=args.min_stage, follow_mode=args.follow_mode,
+                                        transport=args.transport, status_interval=args.status_interval,
+                                        slow_ratio=args.slow_ratio, event_db=event_db, collector=collector,
+                                        host_name=args.host_name, metrics_port=args.metrics_port,
+                                        stall_factor=args.stall_factor, stall_window=args.stall_window,
+                                        stall_hook=args.stall_hook)
         monitor.start_monitoring()
     else:
         print("No minimum stage set. Please provide a minimum stage to start monitoring.")
@@ -0,0 +1,747 @@
+"""
+Tests of monitor.py against fake Docker backends: a fake Engine API served on a temporary
+unix socket and stub `docker` CLIs put first on PATH.
+
+Run with `python -m pytest -q` from this directory.
+"""
+
+import json
+import os
+import queue
+import select
+import socket
+import socketserver
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+import pytest
+
+import collector
+import event_store
+import log_parsing
+import monitor
+import tracking
+import transports
+
+@pytest.fixture(autouse=True)
+def in_tmp_path(tmp_path, monkeypatch):
+    """Runs every test in its own directory, so ./output of the monitor lands there."""
+    monkeypatch.chdir(tmp_path)
+
+def wait_for(condition, timeout=5.0):
+    """Polls `condition` until it holds or `timeout` seconds passed; returns its last value."""
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.02)
+    return condition()
+
+class FakeEngineHandler(BaseHTTPRequestHandler):
+    """Serves the few Engine API endpoints the monitor uses from the FakeEngine it belongs to."""
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        self.server.engine.connections += 1
+        super().setup()
+
+    def log_message(self, format, *args):
+        pass
+
+    def address_string(self):
+        return 'unix'
+
+    def send_body(self, status, body):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_chunk(self, data):
+        self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+
+    def do_GET(self):
+        engine = self.server.engine
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if url.path == '/containers/json':
+            self.send_body(200, json.dumps([{'Names': ['/' + name]} for name in engine.logs]).encode())
+            return
+        name = url.path.split('/')[2]
+        if name not in engine.logs:
+            self.send_body(404, b'{"message":"No such container: ' + name.encode() + b'"}')
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/vnd.docker.multiplexed-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        since = float(query.get('since', ['0'])[0])
+        frames = b''.join(engine.frame(stream, line, when, query.get('timestamps') == ['1'])
+                          for when, stream, line in engine.logs[name] if when >= since)
+        # Frame headers and payloads deliberately straddle the transfer-encoding chunks.
+        for offset in range(0, len(frames), engine.chunk_size):
+            self.send_chunk(frames[offset:offset + engine.chunk_size])
+        self.wfile.flush()
+        if query.get('follow') == ['1']:
+            # Like the daemon, keep a followed stream open until the client goes away.
+            engine.open_follows += 1
+            try:
+                self.connection.recv(1)
+            except OSError:
+                pass
+            engine.open_follows -= 1
+        try:
+            self.wfile.write(b'0\r\n\r\n')
+            self.wfile.flush()
+        except OSError:
+            pass
+
+class FakeEngine(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """A fake Docker Engine API on a unix socket.
+
+    `logs` maps container names to [(unix time, stream, line)], stream being 1 (stdout) or 2 (stderr).
+    """
+    daemon_threads = True
+
+    def __init__(self, path, chunk_size=7):
+        super().__init__(path, FakeEngineHandler)
+        self.engine = self
+        self.logs = {}
+        self.chunk_size = chunk_size
+        self.connections = 0
+        self.open_follows = 0
+
+    @staticmethod
+    def frame(stream, line, when, timestamps):
+        if timestamps:
+            line = log_parsing.unix_nanos_to_docker_timestamp(int(when * 1e9)) + ' ' + line
+        payload = (line + '\n').encode()
+        return bytes([stream, 0, 0, 0]) + len(payload).to_bytes(4, 'big') + payload
+
+@pytest.fixture
+def engine(tmp_path):
+    server = FakeEngine(str(tmp_path / 'docker.sock'))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def read_all(stream):
+    data = b''
+    for chunk in iter(stream.read_chunk, b''):
+        data += chunk
+    stream.close()
+    return data
+
+def test_api_log_stream_dechunks_and_demuxes(engine):
+    now = time.time()
+    engine.logs['c0'] = [(now, 1, '(0)Moving to stage 2 of 10'), (now, 2, 'a stderr line'),
+                         (now, 1, 'x' * 70000), (now, 1, '(1)Game completed!')]
+    api = transports.DockerEngineAPI(engine.server_address)
+    assert read_all(api.open_logs('c0')) == (b'(0)Moving to stage 2 of 10\na stderr line\n' + b'x' * 70000 +
+                                             b'\n(1)Game completed!\n')
+
+def test_api_log_stream_since_and_timestamps(engine):
+    now = time.time()
+    engine.logs['c0'] = [(now - 60, 1, 'old'), (now, 1, 'new')]
+    api = transports.DockerEngineAPI(engine.server_address)
+    lines = read_all(api.open_logs('c0', since=log_parsing.unix_nanos_to_docker_timestamp(int((now - 1) * 1e9)),
+                                   timestamps=True)).splitlines()
+    assert len(lines) == 1 and lines[0].endswith(b'Z new')
+    assert log_parsing.DOCKER_TIMESTAMP.match(lines[0].decode())
+
+def test_api_missing_container_raises_docker_error(engine):
+    api = transports.DockerEngineAPI(engine.server_address)
+    with pytest.raises(transports.DockerError, match='404'):
+        api.open_logs('nope')
+    with pytest.raises(transports.DockerError, match='404'):
+        api.log_path('nope')
+
+def test_api_requests_reuse_a_pooled_connection(engine):
+    engine.logs = {'c0': [], 'c1': []}
+    api = transports.DockerEngineAPI(engine.server_address)
+    for _ in range(50):
+        assert api.list_containers() == ['c0', 'c1']
+    assert engine.connections == 1
+
+def engine_monitor(engine, follow_mode, **kwargs):
+    """A DockerMonitor talking to the fake engine; the status report is off."""
+    docker_monitor = monitor.DockerMonitor(min_stage=1, follow_mode=follow_mode, transport=None,
+                                           status_interval=0, **kwargs)
+    docker_monitor.docker = transports.DockerEngineAPI(engine.server_address)
+    docker_monitor.containers = docker_monitor.get_active_containers()
+    return docker_monitor
+
+def container_event(action, name):
+    return {'Type': 'container', 'Action': action, 'Actor': {'Attributes': {'name': name}},
+            'timeNano': time.time_ns() - 1_000_000_000}
+
+@pytest.mark.parametrize('follow_mode', monitor.FOLLOW_MODES)
+def test_events_attach_and_detach_followers(engine, follow_mode):
+    engine.logs = {'c0': [], 'c1': []}
+    events = queue.SimpleQueue()
+    docker_monitor = engine_monitor(engine, follow_mode, event_source=iter(events.get, None))
+    docker_monitor.start_monitoring()
+    try:
+        assert wait_for(lambda: sorted(docker_monitor.followers) == ['c0', 'c1'])
+
+        # A container started later is followed from its start event.
+        engine.logs['c2'] = [(time.time(), 1, '(0)Moving to stage 3 of 10')]
+        events.put(container_event('start', 'c2'))
+        assert wait_for(lambda: sorted(docker_monitor.followers) == ['c0', 'c1', 'c2'])
+        assert wait_for(lambda: ('c2', 0) in docker_monitor.env_stages.slots)
+
+        events.put(container_event('die', 'c0'))
+        assert wait_for(lambda: sorted(docker_monitor.followers) == ['c1', 'c2'])
+        assert docker_monitor.follower_states['c0'] == 'gone'
+
+        # Start and restart of the same container attach a single follower.
+        events.put(container_event('start', 'c0'))
+        events.put(container_event('restart', 'c0'))
+        assert wait_for(lambda: docker_monitor.follower_states['c0'] == 'streaming')
+        assert sorted(docker_monitor.followers) == ['c0', 'c1', 'c2']
+        assert wait_for(lambda: engine.open_follows == 3)
+    finally:
+        events.put(None)
+        docker_monitor.stop_monitoring()
+    assert wait_for(lambda: engine.open_follows == 0)
+
+class UnreachableEvents:
+    """A transport whose events stream cannot be opened."""
+    name = 'unreachable'
+
+    def __init__(self):
+        self.attempts = 0
+
+    def list_containers(self):
+        return []
+
+    def open_events(self, since=None):
+        self.attempts += 1
+        raise transports.DockerError('Cannot connect to the Docker daemon')
+
+def test_stop_does_not_wait_for_the_events_retry_delay():
+    docker_monitor = monitor.DockerMonitor(min_stage=1, transport=None)
+    docker_monitor.docker = UnreachableEvents()
+    docker_monitor.start_monitoring()
+    assert wait_for(lambda: docker_monitor.docker.attempts >= 1)
+    started = time.monotonic()
+    docker_monitor.stop_monitoring()
+    assert time.monotonic() - started < 0.5
+    assert not docker_monitor.events_thread.is_alive()
+    assert docker_monitor.docker.attempts == 1
+
+def test_out_of_range_numbers_are_ignored(engine):
+    docker_monitor = monitor.DockerMonitor(transport=None, live_discovery=False)
+    assert docker_monitor.process_output('(0)Moving to stage 70000 of 10', 'c0') is None
+    assert docker_monitor.process_output('(70000)Game completed!', 'c0') is None
+    assert docker_monitor.process_output('|    total_timesteps      | 99999999999999999999 |', 'c0') is None
+    assert docker_monitor.process_output('(0)Moving to stage 3 of 10', 'c0') == 'stage'
+    assert docker_monitor.env_stages.histogram() == {3: 1}
+    assert docker_monitor.game_completion.total() == 0
+
+@pytest.mark.parametrize('follow_mode', monitor.FOLLOW_MODES)
+def test_a_failing_line_does_not_stop_the_followers(engine, follow_mode):
+    # Followers ask for the logs since they attached, so these are dated a little ahead.
+    later = time.time() + 60
+    engine.logs = {'c0': [(later, 1, '(9)Game completed!'), (later, 1, '(0)Game completed!')],
+                   'c1': [(later, 1, '(1)Game completed!')]}
+    docker_monitor = engine_monitor(engine, follow_mode, live_discovery=False)
+    add = docker_monitor.game_completion.add
+
+    def add_failing_for_env_9(container, env_number, when):
+        if env_number == '9':
+            raise RuntimeError('unexpected failure')
+        add(container, env_number, when)
+    docker_monitor.game_completion.add = add_failing_for_env_9
+    docker_monitor.start_monitoring()
+    try:
+        assert wait_for(lambda: docker_monitor.game_completion.counts == {'c0': 1, 'c1': 1})
+        assert docker_monitor.follower_states == {'c0': 'streaming', 'c1': 'streaming'}
+    finally:
+        docker_monitor.stop_monitoring()
+
+def fake_docker(tmp_path, monkeypatch, script):
+    """Puts a stub `docker` CLI running the given shell script first on PATH."""
+    bin_path = tmp_path / 'bin'
+    bin_path.mkdir()
+    docker = bin_path / 'docker'
+    docker.write_text('#!/bin/sh\n' + script)
+    docker.chmod(0o755)
+    monkeypatch.setenv('PATH', f"{bin_path}{os.pathsep}{os.environ['PATH']}")
+
+def list_containers_script(count):
+    """Shell lines of a stub `docker` answering `ps` with c0..c<count - 1> and never ending `events`."""
+    return (f'if [ "$1" = ps ]; then i=0; while [ $i -lt {count} ]; do echo c$i; i=$((i+1)); done; exit 0; fi\n'
+            'if [ "$1" = events ]; then exec sleep 100000; fi\n')
+
+def cli_monitor(follow_mode, **kwargs):
+    return monitor.DockerMonitor(min_stage=1, follow_mode=follow_mode, transport='cli', live_discovery=False,
+                                 status_interval=0, **kwargs)
+
+@pytest.mark.parametrize('follow_mode', monitor.FOLLOW_MODES)
+def test_dead_streams_cost_near_zero_cpu(tmp_path, monkeypatch, follow_mode):
+    # Every `docker logs -f` exits at once, as for a container whose log stream keeps ending.
+    fake_docker(tmp_path, monkeypatch, list_containers_script(20) + 'exit 0\n')
+    docker_monitor = cli_monitor(follow_mode)
+    docker_monitor.start_monitoring()
+    try:
+        assert wait_for(lambda: set(docker_monitor.follower_states.values()) == {'reconnecting'})
+        cpu_started, started = time.process_time(), time.perf_counter()
+        time.sleep(2.5)
+        cpu = (time.process_time() - cpu_started) / (time.perf_counter() - started)
+    finally:
+        docker_monitor.stop_monitoring()
+    # A follower spinning on an exhausted pipe costs a whole core.
+    assert cpu < 0.1
+
+@pytest.mark.parametrize('follow_mode', monitor.FOLLOW_MODES)
+def test_dead_streams_are_given_up(tmp_path, monkeypatch, follow_mode):
+    fake_docker(tmp_path, monkeypatch, list_containers_script(5) + 'exit 0\n')
+    monkeypatch.setattr(monitor, 'RECONNECT_BASE_DELAY', 0.01)
+    monkeypatch.setattr(monitor, 'RECONNECT_MAX_DELAY', 0.05)
+    docker_monitor = cli_monitor(follow_mode)
+    docker_monitor.start_monitoring()
+    try:
+        assert wait_for(lambda: list(docker_monitor.follower_states.values()) == ['gone'] * 5)
+        assert docker_monitor.metrics.reconnects == {f"c{i}": monitor.RECONNECT_ATTEMPTS for i in range(5)}
+    finally:
+        docker_monitor.stop_monitoring()
+
+def test_reconnect_backoff_is_capped():
+    docker_monitor = monitor.DockerMonitor(transport=None, live_discovery=False)
+    delays = [docker_monitor.reconnect_delay(attempt) for attempt in range(10)]
+    assert delays[:3] == [1.0, 2.0, 4.0] and max(delays) == monitor.RECONNECT_MAX_DELAY
+
+def play_episodes(env_stages, container, env_number, durations, start=1e9):
+    """Records back to back episodes of the given durations; returns when the last one ended."""
+    env_stages.end_episode(container, env_number, start)
+    for duration in durations:
+        start += duration
+        env_stages.end_episode(container, env_number, start)
+    return start
+
+def test_stall_window_is_a_multiple_of_the_median_episode_duration():
+    env_stages = tracking.EnvStageTable()
+    end = play_episodes(env_stages, 'c0', '0', [100, 900, 200, 300])
+    env_stages.enter_stage('c1', '0', 2, 10, end)
+    # Median 250s, so a 750s window; c1 never finished an episode and gets the default window.
+    assert env_stages.stalled(end + 749, 3.0, 1000) == {}
+    assert env_stages.stalled(end + 751, 3.0, 1000) == {('c0', '0'): (751, 750)}
+    assert env_stages.stalled(end + 1001, 3.0, 1000) == {('c0', '0'): (1001, 750), ('c1', '0'): (1001, 1000)}
+
+def test_stall_window_is_never_below_the_minimum():
+    env_stages = tracking.EnvStageTable()
+    end = play_episodes(env_stages, 'c0', '0', [5] * 10)
+    assert env_stages.stalled(end + tracking.STALL_MIN_WINDOW - 1, 3.0, 1000) == {}
+    assert list(env_stages.stalled(end + tracking.STALL_MIN_WINDOW + 1, 3.0, 1000)) == [('c0', '0')]
+
+def test_stalls_of_gone_followers_are_not_reported():
+    docker_monitor = monitor.DockerMonitor(transport=None, live_discovery=False, stall_window=1800)
+    long_ago = time.time() - 3600
+    for container in ('c0', 'c1'):
+        docker_monitor.env_stages.enter_stage(container, '0', 2, 10, long_ago)
+    docker_monitor.follower_states.update({'c0': 'gone', 'c1': 'streaming'})
+    assert list(docker_monitor.status_snapshot()['stalled']) == [('c1', '0')]
+    _, _, samples = docker_monitor.metrics_snapshot()['diambra_env_stalled']
+    assert sorted((labels['container'], value) for labels, value in samples) == [('c0', 0), ('c1', 1)]
+
+def test_stall_hook_runs_once_per_container_until_it_recovers(monkeypatch):
+    docker_monitor = monitor.DockerMonitor(transport=None, live_discovery=False, stall_window=600,
+                                           stall_hook='docker restart {container} --envs {envs}')
+    commands = []
+    monkeypatch.setattr(monitor.subprocess, 'Popen', lambda command, **kwargs: commands.append(command))
+    env_stages = docker_monitor.env_stages
+
+    def report(now):
+        current = docker_monitor.status_snapshot(now)
+        docker_monitor.report_stalls(docker_monitor.last_status, current)
+        docker_monitor.last_status = current
+
+    env_stages.enter_stage('c0', '0', 2, 10, 0)
+    env_stages.enter_stage('c0', '1', 2, 10, 300)
+    env_stages.enter_stage('c1', '0', 2, 10, 10000)
+    report(700)
+    report(1000)
+    assert commands == [['docker', 'restart', 'c0', '--envs', '0']]
+    report(1100)
+    assert len(commands) == 1
+    env_stages.enter_stage('c0', '0', 3, 10, 1100)
+    env_stages.enter_stage('c0', '1', 3, 10, 1100)
+    report(1200)
+    report(1800)
+    assert commands[1:] == [['docker', 'restart', 'c0', '--envs', '0,1']]
+
+def running(pid):
+    """Returns True if the process exists and is not a zombie."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().rpartition(')')[2].split()[0] != 'Z'
+    except FileNotFoundError:
+        return False
+
+@pytest.mark.skipif(not os.path.isdir('/proc/self'), reason='needs /proc to find the producers')
+@pytest.mark.parametrize('follow_mode', monitor.FOLLOW_MODES)
+@pytest.mark.parametrize('count', [10, 200])
+def test_shutdown_is_bounded_whatever_the_container_count(tmp_path, monkeypatch, follow_mode, count):
+    # Log producers that never exit, each recording its pid.
+    pids_path = tmp_path / 'pids'
+    fake_docker(tmp_path, monkeypatch, list_containers_script(count) +
+                f'echo "(1)Moving to stage 3 of 10"\necho $$ >> {pids_path}\nexec sleep 100000\n')
+    docker_monitor = cli_monitor(follow_mode)
+    docker_monitor.start_monitoring()
+    try:
+        assert wait_for(lambda: pids_path.exists() and len(pids_path.read_text().split()) == count, timeout=30)
+        assert wait_for(lambda: len(docker_monitor.env_stages.slots) == count, timeout=30)
+    finally:
+        started = time.perf_counter()
+        docker_monitor.stop_monitoring()
+        took = time.perf_counter() - started
+    assert took < monitor.SHUTDOWN_TIMEOUT / 5
+    pids = [int(pid) for pid in pids_path.read_text().split()]
+    assert not [pid for pid in pids if running(pid)]
+
+@pytest.fixture
+def event_collector():
+    event_collector = collector.EventCollector(('127.0.0.1', 0), status_interval=3600)
+    thread = threading.Thread(target=event_collector.serve, daemon=True)
+    thread.start()
+    event_collector.thread = thread
+    yield event_collector
+    event_collector.stop()
+    thread.join(timeout=5)
+
+def test_collector_merges_replaying_agents(tmp_path, event_collector):
+    for host in range(3):
+        log_path = tmp_path / f"train{host}.log"
+        log_path.write_text(''.join(f"({env})Moving to stage {host + 2} of 10\nnoise\n" for env in range(4)) +
+                            "(0)Game completed!\n" * (host + 1))
+        agent = monitor.DockerMonitor(transport=None, live_discovery=False, collector=event_collector.address,
+                                      host_name=f"h{host}")
+        agent.replay([str(log_path)])
+        agent.close_event_sinks()
+    assert wait_for(lambda: sum(host.events for host in event_collector.hosts.values()) == 3 * 4 + 1 + 2 + 3)
+    for host in range(3):
+        view = event_collector.hosts[f"h{host}"]
+        assert view.game_completion.counts == {f"train{host}": host + 1}
+        assert view.env_stages.histogram() == {host + 2: 4}
+
+def test_shipper_does_not_block_on_a_collector_that_never_reads():
+    # Accepts the connection (through the listen backlog) but never reads from it.
+    server = socket.create_server(('127.0.0.1', 0))
+    try:
+        shipper = collector.EventShipper(server.getsockname(), 'h0', queue_size=1000)
+        started = time.perf_counter()
+        for event in range(200000):
+            shipper.record(time.time(), 'c0', event % 32, 'stage', 1, 10)
+        recorded = time.perf_counter() - started
+        started = time.perf_counter()
+        shipper.close(timeout=1)
+        closed = time.perf_counter() - started
+    finally:
+        server.close()
+    # The followers recording events never wait for the collector; what does not fit is dropped.
+    assert recorded < 5
+    # The close timeout is spent once for the queue and once for the sender thread.
+    assert closed < 3 and not shipper.thread.is_alive()
+
+@pytest.mark.parametrize('batch', [b'{"events": []}', b'[1, 2]', b'{"host": "h0", "events": [[1, 2]]}',
+                                   b'{"host": "h0", "events": [["x", "c0", 0, "stage", 1, 10]]}', b'not json',
+                                   b'{"host": "h0", "events": [[1.0, "c0", 0, "stage", 70000, 10]]}'])
+def test_collector_drops_agents_sending_malformed_batches(event_collector, batch):
+    with socket.create_connection(event_collector.address, timeout=5) as bad_agent:
+        bad_agent.sendall(batch + b'\n')
+        assert bad_agent.recv(1) == b''
+    good_batch = {'host': 'h1', 'dropped': 0, 'events': [[time.time(), 'c0', 0, 'game_completed', None, None]]}
+    with socket.create_connection(event_collector.address, timeout=5) as agent:
+        agent.sendall(json.dumps(good_batch).encode() + b'\n')
+        hosts = event_collector.hosts
+        assert wait_for(lambda: 'h1' in hosts and hosts['h1'].game_completion.total() == 1)
+    assert event_collector.thread.is_alive()
+
+class ListedContainers:
+    """Stands in for the transport the json-file transport asks for the container list."""
+    def __init__(self, names):
+        self.names = list(names)
+
+    def list_containers(self):
+        return list(self.names)
+
+def json_log_entry(message):
+    return json.dumps({'log': message, 'stream': 'stdout', 'time': log_parsing.docker_timestamp_now()}) + '\n'
+
+def rotate(path):
+    """Rotates a json-file log like the driver with max-file=3: path -> path.1 -> path.2."""
+    if os.path.exists(path + '.1'):
+        os.replace(path + '.1', path + '.2')
+    os.replace(path, path + '.1')
+
+def write_rotating_log(path, lines, rotate_every, pause):
+    """Appends `lines` json-file entries, every tenth a completion, rotating every `rotate_every` entries."""
+    f = open(path, 'a')
+    for line in range(lines):
+        f.write(json_log_entry(f"({line % 4})Game completed!\n" if line % 10 == 0 else f"noise line {line}\n"))
+        f.flush()
+        if line % rotate_every == rotate_every - 1:
+            f.close()
+            rotate(path)
+            f = open(path, 'a')
+        if line % 100 == 0:
+            time.sleep(pause)
+    f.close()
+
+def json_log_paths(tmp_path, count):
+    """Creates empty json-file logs laid out like /var/lib/docker/containers, one directory per container."""
+    paths = {}
+    for container in range(count):
+        container_id = f"{container:064x}"
+        (tmp_path / container_id).mkdir()
+        paths[f"c{container}"] = path = str(tmp_path / container_id / f"{container_id}-json.log")
+        open(path, 'w').close()
+    return paths
+
+@pytest.mark.parametrize('follow_mode, inotify, rotate_every, pause', [
+    ('threads', True, 700, 0.02),
+    ('selector', True, 700, 0.02),
+    # Polling once per second, with rotations further apart than the poll interval.
+    ('threads', False, 1500, 0.05),
+])
+def test_json_file_tailing_follows_rotations(tmp_path, follow_mode, inotify, rotate_every, pause):
+    containers, lines = 4, 3000
+    paths = json_log_paths(tmp_path, containers)
+    docker_monitor = monitor.DockerMonitor(min_stage=1, follow_mode=follow_mode, transport=None,
+                                           live_discovery=False, status_interval=0)
+    docker_monitor.docker = transports.JsonFileTransport(ListedContainers(paths), paths)
+    if not inotify:
+        docker_monitor.docker.inotify = None
+    if inotify and docker_monitor.docker.inotify is None:
+        pytest.skip('inotify is not available')
+    docker_monitor.containers = docker_monitor.get_active_containers()
+    docker_monitor.start_monitoring()
+    try:
+        writers = [threading.Thread(target=write_rotating_log, args=(path, lines, rotate_every, pause))
+                   for path in paths.values()]
+        for writer in writers:
+            writer.start()
+        for writer in writers:
+            writer.join()
+        assert wait_for(lambda: sum(docker_monitor.metrics.lines.values()) == containers * lines, timeout=10)
+        assert docker_monitor.game_completion.counts == {container: lines // 10 for container in paths}
+    finally:
+        started = time.perf_counter()
+        docker_monitor.stop_monitoring()
+    assert time.perf_counter() - started < 1.0
+
+def test_json_file_stream_reads_rotated_files_in_order(tmp_path):
+    path = json_log_paths(tmp_path, 1)['c0']
+    with open(path, 'a') as f:
+        f.write(json_log_entry('too old\n'))
+    time.sleep(0.01)
+    since = log_parsing.docker_timestamp_now()
+    with open(path, 'a') as f:
+        f.write(json_log_entry('line 0\n'))
+    rotate(path)
+    with open(path, 'a') as f:
+        # A long line split over two entries by the driver.
+        f.write(json_log_entry('line 1, ') + json_log_entry('continued\n'))
+    rotate(path)
+    with open(path, 'a') as f:
+        f.write(json_log_entry('line 2\n'))
+    lines = read_all(transports.JsonFileLogStream(path, since=since, timestamps=True)).splitlines()
+    assert [line.partition(b' ')[2] for line in lines] == [b'line 0', b'line 1, continued', b'line 2']
+    assert all(log_parsing.DOCKER_TIMESTAMP.match(line.decode()) for line in lines)
+
+def inotify_instances():
+    """Counts the inotify instances this process has open."""
+    fds = '/proc/self/fd'
+    count = 0
+    for fd in os.listdir(fds):
+        try:
+            count += os.readlink(os.path.join(fds, fd)) == 'anon_inode:inotify'
+        except OSError:
+            pass
+    return count
+
+class FailingInotify:
+    """libc whose inotify instances cannot be created, as when fs.inotify.max_user_instances is reached."""
+    def inotify_init1(self, flags):
+        return -1
+
+def test_followed_json_file_streams_share_one_inotify_instance(tmp_path):
+    paths = json_log_paths(tmp_path, 200)
+    transport = transports.JsonFileTransport(ListedContainers(paths), paths)
+    if transport.inotify is None:
+        pytest.skip('inotify is not available')
+    # Instances of earlier tests are closed within a poll interval once their streams are.
+    assert wait_for(lambda: inotify_instances() == 0)
+    streams = [transport.open_logs(container, follow=True) for container in paths]
+    try:
+        for stream in streams:
+            stream.set_blocking(False)
+        assert inotify_instances() == 1
+        with open(paths['c150'], 'a') as f:
+            f.write(json_log_entry('(3)Game completed!\n'))
+        ready, _, _ = select.select(streams, [], [], 0.5)
+        assert ready == [streams[150]]
+        assert streams[150].read_chunk() == b'(3)Game completed!\n'
+    finally:
+        for stream in streams:
+            stream.close()
+    assert wait_for(lambda: inotify_instances() == 0)
+
+def test_json_file_streams_poll_without_an_inotify_instance(tmp_path):
+    paths = json_log_paths(tmp_path, 2)
+    transport = transports.JsonFileTransport(ListedContainers(paths), paths)
+    if transport.inotify is None:
+        pytest.skip('inotify is not available')
+    transport.inotify.libc = FailingInotify()
+    streams = [transport.open_logs(container, follow=True) for container in paths]
+    try:
+        for stream in streams:
+            stream.set_blocking(False)
+        with open(paths['c1'], 'a') as f:
+            f.write(json_log_entry('(0)Episode done\n'))
+        # Nothing signals the change, but the watcher wakes polled streams every FILE_POLL_INTERVAL.
+        ready, _, _ = select.select(streams, [], [], 2 * transports.FILE_POLL_INTERVAL + 0.5)
+        assert streams[1] in ready
+        assert streams[1].read_chunk() == b'(0)Episode done\n'
+    finally:
+        for stream in streams:
+            stream.close()
+
+def replay_into(event_db, paths):
+    docker_monitor = monitor.DockerMonitor(transport=None, live_discovery=False, event_db=event_db)
+    docker_monitor.replay(paths)
+    docker_monitor.close_event_sinks()
+
+def stored_events(event_db):
+    connection = sqlite3.connect(event_db)
+    try:
+        return connection.execute("SELECT container, event, time FROM events ORDER BY time").fetchall()
+    finally:
+        connection.close()
+
+def test_replaying_logs_again_does_not_store_their_events_twice(tmp_path):
+    path = str(tmp_path / 'train.log')
+    with open(path, 'w') as f:
+        f.write('2024-05-01T10:00:00.000000000Z (0)Moving to stage 2 of 10\n'
+                '2024-05-01T10:30:00.000000000Z (0)Game completed!\n')
+    event_db = str(tmp_path / 'events.db')
+    replay_into(event_db, [path])
+    replay_into(event_db, [path])
+    assert [(container, event) for container, event, _ in stored_events(event_db)] == [
+        ('train', 'stage'), ('train', 'game_completed')]
+    connection = sqlite3.connect(event_db)
+    completions = event_store.completions_per_hour(connection)
+    assert [(container, count) for container, _, count in completions] == [('train', 1)]
+    connection.close()
+
+def test_replayed_lines_without_timestamps_are_not_stored(tmp_path):
+    path = str(tmp_path / 'train.log')
+    with open(path, 'w') as f:
+        f.write('(0)Moving to stage 2 of 10\n(0)Game completed!\n')
+    event_db = str(tmp_path / 'events.db')
+    replay_into(event_db, [path])
+    assert stored_events(event_db) == []
+
+def test_replays_only_store_events_with_an_explicit_event_db(tmp_path):
+    path = str(tmp_path / 'train.log')
+    with open(path, 'w') as f:
+        f.write('2024-05-01T10:30:00.000000000Z (0)Game completed!\n')
+    subprocess.run([sys.executable, monitor.__file__, '-r', path], check=True, capture_output=True, timeout=60)
+    assert not os.path.exists(event_store.EVENTS_DB_PATH)
+    subprocess.run([sys.executable, monitor.__file__, '-r', path, '-e', 'events.db'], check=True,
+                   capture_output=True, timeout=60)
+    assert [event for _, event, _ in stored_events('events.db')] == ['game_completed']
+
+def test_event_store_skips_scanned_events_it_already_holds(tmp_path):
+    event_db = str(tmp_path / 'events.db')
+    store = event_store.EventStore(event_db)
+    for when in (100, 200, 300):
+        store.record(when, 'c0', '0', 'game_completed')
+    store.close()
+    # A restart scans the same logs again: only what is newer than the store is kept.
+    store = event_store.EventStore(event_db)
+    assert store.stored_until == {'c0': 300}
+    for when in (250, 300, 400):
+        store.record_scanned(when, 'c0', '0', 'game_completed')
+    store.record_scanned(50, 'c1', '0', 'game_completed')
+    store.close()
+    assert stored_events(event_db) == [('c1', 'game_completed', 50), ('c0', 'game_completed', 100),
+                                       ('c0', 'game_completed', 200), ('c0', 'game_completed', 300),
+                                       ('c0', 'game_completed', 400)]
+
+def test_event_store_writes_full_batches_and_flushes_the_rest_on_close(tmp_path):
+    event_db = str(tmp_path / 'events.db')
+    store = event_store.EventStore(event_db, batch_size=4, flush_interval=60)
+
+    def stored():
+        try:
+            return len(stored_events(event_db))
+        except sqlite3.OperationalError:
+            # The writer thread did not create the table yet.
+            return 0
+    for when in range(10):
+        store.record(when, 'c0', '0', 'stage', 2, 10)
+    assert wait_for(lambda: stored() == 8)
+    time.sleep(0.2)
+    assert stored() == 8
+    store.close()
+    assert stored() == 10
+    connection = sqlite3.connect(event_db)
+    assert connection.execute("PRAGMA journal_mode").fetchone() == ('wal',)
+    connection.close()
+
+def test_event_store_drops_events_when_the_database_cannot_be_opened(tmp_path):
+    (tmp_path / 'output').write_text('not a directory')
+    store = event_store.EventStore(str(tmp_path / 'output' / 'events.db'))
+    assert wait_for(lambda: store.failed)
+    store.record(100, 'c0', '0', 'game_completed')
+    assert store.pending.empty()
+    store.close(timeout=1)
+    assert not store.thread.is_alive()
+
+def write_event_db(event_db, events):
+    connection = event_store.connect_event_db(event_db)
+    with connection:
+        connection.executemany("INSERT INTO events VALUES (?, ?, ?, ?, ?, ?)", events)
+    connection.close()
+
+def test_completions_per_hour_query(tmp_path, capsys):
+    event_db = str(tmp_path / 'events.db')
+    ten = time.mktime((2024, 5, 1, 10, 0, 0, 0, 0, -1))
+    write_event_db(event_db, [(ten + 60, 'c0', 0, 'game_completed', None, None),
+                              (ten + 1800, 'c0', 1, 'game_completed', None, None),
+                              (ten + 3660, 'c0', 0, 'game_completed', None, None),
+                              (ten + 120, 'c0', 0, 'stage', 2, 10),
+                              (ten + 300, 'c1', 0, 'game_completed', None, None)])
+    connection = sqlite3.connect(event_db)
+    assert event_store.completions_per_hour(connection) == [
+        ('c0', '2024-05-01 10:00', 2), ('c0', '2024-05-01 11:00', 1), ('c1', '2024-05-01 10:00', 1)]
+    connection.close()
+    event_store.run_query(event_db, 'completions_per_hour', 8)
+    assert capsys.readouterr().out.splitlines() == [
+        'c0  2024-05-01 10:00  2', 'c0  2024-05-01 11:00  1', 'c1  2024-05-01 10:00  1']
+
+def test_time_to_stage_query(tmp_path, capsys):
+    event_db = str(tmp_path / 'events.db')
+    write_event_db(event_db, [(1000, 'c0', 0, 'episode_done', None, None), (1100, 'c0', 0, 'stage', 3, 10),
+                              (2000, 'c0', 0, 'episode_done', None, None), (2300, 'c0', 0, 'stage', 3, 10),
+                              # No episode start seen for this env, and another stage: both left out.
+                              (500, 'c0', 1, 'stage', 3, 10), (2100, 'c0', 0, 'stage', 2, 10),
+                              (0, 'c1', 0, 'episode_done', None, None), (50, 'c1', 0, 'stage', 3, 10)])
+    connection = sqlite3.connect(event_db)
+    assert event_store.time_to_stage(connection, 3) == {'c0': [100, 300], 'c1': [50]}
+    assert event_store.time_to_stage(connection, 8) == {}
+    connection.close()
+    event_store.run_query(event_db, 'time_to_stage', 3)
+    out = capsys.readouterr().out.splitlines()
+    assert len(out) == 3 and out[0].startswith('c0: median') and out[1].startswith('c1: median')
+    assert out[2].startswith('all: median')
+    event_store.run_query(event_db, 'time_to_stage', 8)
+    assert capsys.readouterr().out == 'No episode reached stage 8.\n'
@@ -0,0 +1,211 @@
+"""
+In-memory tracking of the monitored envs: completions, stages and training throughput.
+Shared by the monitor and the collector's per-host views.
+"""
+
+import statistics
+from array import array
+from collections import deque
+
+# Completion records kept for the status report and in each container's scan cursor;
+# older completions only survive as per-container counters.
+RECENT_COMPLETIONS = 256
+# Episode-start-to-stage durations kept per stage for the time-to-reach percentiles.
+STAGE_REACH_SAMPLES = 1024
+# An env with no stage or episode progress for stall_factor times the median of its last
+# STALL_HISTORY episode durations (never less than STALL_MIN_WINDOW seconds) is flagged as
+# stalled; until it finished an episode, stall_window seconds are used instead.
+STALL_HISTORY = 20
+STALL_MIN_WINDOW = 60
+# Steps/sec is measured over the last THROUGHPUT_WINDOW SB3 tables of a container and compared
+# with the median of its last THROUGHPUT_HISTORY measurements; a container running below
+# slow_ratio of its own median is flagged once it has THROUGHPUT_MIN_HISTORY measurements.
+THROUGHPUT_WINDOW = 3
+THROUGHPUT_HISTORY = 100
+THROUGHPUT_MIN_HISTORY = 5
+# Containers that printed no table for this long are left out of the host throughput.
+THROUGHPUT_STALE = 600
+
+class CompletionStore:
+    """Per-container completion counters plus a fixed-size ring buffer of the latest completions.
+
+    Memory and reporting cost depend on the number of containers, not on how many
+    games were completed over the lifetime of the monitor.
+    """
+    def __init__(self, capacity=RECENT_COMPLETIONS):
+        self.counts = {}
+        # (unix time, container, env number) tuples, oldest first.
+        self.recent = deque(maxlen=capacity)
+
+    def add_container(self, container):
+        self.counts.setdefault(container, 0)
+
+    def add(self, container, env_number, when):
+        """Records one completion at `when` (seconds since the epoch)."""
+        self.counts[container] = self.counts.get(container, 0) + 1
+        self.recent.append((int(when), container, int(env_number)))
+
+    def total(self):
+        return sum(self.counts.values())
+
+class EnvStageTable:
+    """Array-backed stage tracking per (container, env number).
+
+    Each training env gets a slot index on first sight; its current stage, the stage
+    count of the game, the highest stage it ever reached, when it entered the current
+    stage, when its current episode started and when it last made progress live in
+    parallel arrays, so every event is an O(1) update. Durations from episode start to
+    reaching each stage are sampled for percentiles, and each env keeps its last episode
+    durations for the stall window (both only for episodes whose start was seen).
+    """
+    def __init__(self, samples=STAGE_REACH_SAMPLES):
+        self.slots = {}
+        self.keys = []
+        self.stage = array('h')
+        self.stage_count = array('h')
+        self.max_stage = array('h')
+        self.stage_since = array('d')
+        self.episode_start = array('d')
+        self.last_progress = array('d')
+        self.episode_durations = []
+        self.samples = samples
+        self.reach_times = {}
+
+    def slot(self, container, env_number):
+        key = (container, env_number)
+        index = self.slots.get(key)
+        if index is None:
+            index = self.slots[key] = len(self.keys)
+            self.keys.append(key)
+            for column in (self.stage, self.stage_count, self.max_stage):
+                column.append(0)
+            self.stage_since.append(0.0)
+            self.episode_start.append(0.0)
+            self.last_progress.append(0.0)
+            self.episode_durations.append(deque(maxlen=STALL_HISTORY))
+        return index
+
+    def enter_stage(self, container, env_number, stage, stage_count, when):
+        """Records that an env moved to `stage` (of `stage_count`) at `when`."""
+        index = self.slot(container, env_number)
+        self.stage[index] = stage
+        self.stage_count[index] = stage_count
+        self.stage_since[index] = when
+        self.last_progress[index] = when
+        if stage > self.max_stage[index]:
+            self.max_stage[index] = stage
+        if self.episode_start[index]:
+            samples = self.reach_times.get(stage)
+            if samples is None:
+                samples = self.reach_times[stage] = deque(maxlen=self.samples)
+            samples.append(when - self.episode_start[index])
+
+    def end_episode(self, container, env_number, when):
+        """Records that an env's episode ended at `when`; the next one starts now."""
+        index = self.slot(container, env_number)
+        if self.episode_start[index]:
+            self.episode_durations[index].append(when - self.episode_start[index])
+        self.stage[index] = 0
+        self.stage_since[index] = when
+        self.episode_start[index] = when
+        self.last_progress[index] = when
+
+    def stalled(self, now, factor, default_window):
+        """Returns {(container, env): (seconds without progress, window)} for envs idle longer than their window."""
+        stalled = {}
+        for index, last in enumerate(self.last_progress):
+            durations = self.episode_durations[index]
+            window = max(factor * statistics.median(durations), STALL_MIN_WINDOW) if durations else default_window
+            if now - last > window:
+                stalled[self.keys[index]] = (now - last, window)
+        return stalled
+
+    def current(self, minimum_stage=1):
+        """Returns {(container, env): (stage entry time, stage, stage count)} for envs at or past `minimum_stage`."""
+        minimum_stage = max(minimum_stage, 1)
+        return {self.keys[index]: (int(self.stage_since[index]), stage, self.stage_count[index])
+                for index, stage in enumerate(self.stage) if stage >= minimum_stage}
+
+    def best_stages(self):
+        """Returns {container: highest stage any of its envs ever reached}."""
+        best = {}
+        for (container, _), stage in zip(self.keys, self.max_stage):
+            if stage > best.get(container, 0):
+                best[container] = stage
+        return best
+
+    def histogram(self):
+        """Returns {stage: number of envs currently in it}."""
+        counts = {}
+        for stage in self.stage:
+            if stage:
+                counts[stage] = counts.get(stage, 0) + 1
+        return counts
+
+class ThroughputTracker:
+    """Rolling training steps/sec per container, parsed from SB3's verbose log tables.
+
+    SB3's own `fps` row is a cumulative average since the start of training, so the
+    rate is derived from `total_timesteps` and `time_elapsed` deltas between tables.
+    """
+    def __init__(self, slow_ratio=0.7):
+        self.slow_ratio = slow_ratio
+        self.elapsed = {}
+        self.points = {}
+        self.history = {}
+        self.rates = {}
+        self.updated = {}
+
+    def time_elapsed(self, container, seconds):
+        self.elapsed[container] = seconds
+
+    def total_timesteps(self, container, steps, when):
+        """Closes one SB3 table of `container`, updating its rolling steps/sec."""
+        elapsed = self.elapsed.pop(container, None)
+        if elapsed is None:
+            return
+        points = self.points.get(container)
+        if points is None:
+            points = self.points[container] = deque(maxlen=THROUGHPUT_WINDOW + 1)
+        if points and (steps < points[-1][0] or elapsed < points[-1][1]):
+            # Training restarted inside the container.
+            points.clear()
+        points.append((steps, elapsed))
+        self.updated[container] = when
+        if len(points) < 2 or points[-1][1] == points[0][1]:
+            return
+        rate = (points[-1][0] - points[0][0]) / (points[-1][1] - points[0][1])
+        self.rates[container] = rate
+        history = self.history.get(container)
+        if history is None:
+            history = self.history[container] = deque(maxlen=THROUGHPUT_HISTORY)
+        history.append(rate)
+
+    def snapshot(self, now):
+        """Returns ({container: steps/sec}, {container: (steps/sec, own median)} for slow ones)."""
+        rates = {container: rate for container, rate in self.rates.items()
+                 if now - self.updated[container] <= THROUGHPUT_STALE}
+        slow = {}
+        for container, rate in rates.items():
+            history = self.history[container]
+            if len(history) >= THROUGHPUT_MIN_HISTORY:
+                median = statistics.median(history)
+                if rate < self.slow_ratio * median:
+                    slow[container] = (rate, median)
+        return rates, slow
+
+def percentiles(samples, points=(50, 90)):
+    """Returns the given percentiles of a list of durations."""
+    if len(samples) < 2:
+        return [samples[0] if samples else 0.0 for _ in points]
+    cuts = statistics.quantiles(samples, n=100, method='inclusive')
+    return [cuts[point - 1] for point in points]
+
+def format_duration(seconds):
+    """Formats seconds as e.g. '1h02m', '4m10s' or '12s'."""
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m{seconds % 60:02d}s"
+    return f"{seconds}s"
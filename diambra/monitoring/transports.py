@@ -0,0 +1,679 @@
+"""
+Docker transports of the monitor: the CLI, the Engine API over the unix socket and the
+json-file log tailing, all handing out log streams with the same interface (fileno,
+set_blocking, read_chunk, interrupt, close).
+"""
+
+import subprocess
+import threading
+import json
+import socket
+import http.client
+import queue
+import ctypes
+import struct
+import mmap
+import select
+import glob
+from urllib.parse import quote, urlencode
+import os
+import time
+
+from log_parsing import docker_timestamp_to_unix, normalize_docker_timestamp
+
+READ_CHUNK_SIZE = 64 * 1024
+# 'api' talks to the Engine HTTP API over the unix socket, 'cli' forks the docker binary,
+# 'auto' uses the API when the socket is reachable and falls back to the CLI otherwise.
+# 'files' tails the json-file log files directly (Docker is only asked where they are).
+TRANSPORTS = ('auto', 'api', 'cli', 'files')
+DOCKER_SOCKET = '/var/run/docker.sock'
+# Tailed json-file logs are read through mmap in regions of at most FILE_READ_SIZE bytes.
+# Without inotify (or when an event is missed) the files are checked every FILE_POLL_INTERVAL seconds.
+FILE_READ_SIZE = 4 * 1024 * 1024
+FILE_POLL_INTERVAL = 1.0
+# inotify_init1 flags and the events that mean a container log directory changed.
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+IN_LOG_DIR_EVENTS = 0x2 | 0x40 | 0x80 | 0x100 | 0x200  # MODIFY, MOVED_FROM/TO, CREATE, DELETE
+IN_IGNORED = 0x8000
+# struct inotify_event header: watch descriptor, mask, cookie and the length of the name that follows.
+INOTIFY_EVENT = struct.Struct('iIII')
+# Container lifecycle events that attach or detach log followers.
+CONTAINER_EVENTS = ('start', 'die', 'restart')
+# A follower whose stream ends reconnects after a capped exponential backoff and is
+# given up ('gone') after this many reconnects in a row that produced no output.
+RECONNECT_BASE_DELAY = 1.0
+RECONNECT_MAX_DELAY = 60.0
+RECONNECT_ATTEMPTS = 8
+
+class DockerError(Exception):
+    """Raised when a Docker transport cannot complete a request."""
+
+class CLILogStream:
+    """A container log stream read from the stdout pipe of a `docker logs` child process.
+
+    With `merge_stderr` the child's stderr (the container's stderr) goes to the same pipe.
+    """
+    def __init__(self, cmd, merge_stderr=False):
+        stderr = subprocess.STDOUT if merge_stderr else subprocess.DEVNULL
+        try:
+            self.process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr)
+        except OSError as e:
+            raise DockerError(f"Failed to run {cmd[0]}: {e}") from e
+
+    def fileno(self):
+        return self.process.stdout.fileno()
+
+    def set_blocking(self, blocking):
+        os.set_blocking(self.fileno(), blocking)
+
+    def read_chunk(self):
+        """Returns the next chunk of log bytes, b'' at EOF; raises BlockingIOError when non-blocking and idle."""
+        return os.read(self.fileno(), READ_CHUNK_SIZE)
+
+    def interrupt(self):
+        """Wakes up a reader blocked on the stream; it sees the end of the stream."""
+        if self.process.poll() is None:
+            self.process.terminate()
+
+    def close(self):
+        if self.process.poll() is None:
+            self.process.terminate()
+        self.process.stdout.close()
+        try:
+            self.process.wait(timeout=1)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+class DockerCLI:
+    """Docker transport that forks the `docker` CLI for every request."""
+    name = 'cli'
+
+    def list_containers(self):
+        """Returns the names of the running containers."""
+        command = ["docker", "ps", "--format", "{{.Names}}"]
+        try:
+            output = subprocess.check_output(command).decode().strip()
+        except (OSError, subprocess.CalledProcessError) as e:
+            raise DockerError(str(e)) from e
+        return output.split('\n') if output else []
+
+    def logs_command(self, container, since=None, follow=False, timestamps=False):
+        """Builds the `docker logs` command for the given options."""
+        return (["docker", "logs"] + (["--timestamps"] if timestamps else []) +
+                (["--since", since] if since else []) + (["-f"] if follow else []) + [container])
+
+    def open_logs(self, container, since=None, follow=False, timestamps=False):
+        """Opens a stream of a container's log output (stdout and stderr) from `since` onwards."""
+        return CLILogStream(self.logs_command(container, since, follow, timestamps), merge_stderr=True)
+
+    def log_path(self, container):
+        """Returns the path of a container's json-file log."""
+        command = ["docker", "inspect", "--format", "{{.LogPath}}", container]
+        try:
+            return subprocess.check_output(command).decode().strip()
+        except (OSError, subprocess.CalledProcessError) as e:
+            raise DockerError(str(e)) from e
+
+    def open_events(self, since=None):
+        """Opens a stream of newline-delimited JSON container start/die/restart events."""
+        return CLILogStream(["docker", "events", "--format", "{{json .}}", "--filter", "type=container"] +
+                            [arg for event in CONTAINER_EVENTS for arg in ("--filter", f"event={event}")] +
+                            (["--since", since] if since else []))
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """An HTTP connection to a server listening on a unix socket."""
+    def __init__(self, socket_path, timeout=10):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+class APILogStream:
+    """A container log stream read straight from an Engine API response socket.
+
+    The response headers are read when the stream is opened; the body is decoded
+    incrementally (chunked transfer encoding, then the multiplexed stdout/stderr frame
+    headers) so the socket can be handed to a selector like any pipe.
+    """
+    def __init__(self, sock, multiplexed=True):
+        self.sock = sock
+        self.buffer = b''
+        self.frames = b''
+        self.chunked = False
+        self.multiplexed = multiplexed
+        self.remaining = None
+        self.finished = False
+        self._read_headers()
+
+    def _read_headers(self):
+        data = b''
+        while b'\r\n\r\n' not in data:
+            received = self.sock.recv(READ_CHUNK_SIZE)
+            if not received:
+                raise DockerError("Connection closed before the response headers were received.")
+            data += received
+        head, _, self.buffer = data.partition(b'\r\n\r\n')
+        status_line, *header_lines = head.decode('latin-1').split('\r\n')
+        status = int(status_line.split()[1])
+        headers = {}
+        for line in header_lines:
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+        if status != 200:
+            raise DockerError(f"Engine API returned {status_line}: {self.buffer.decode(errors='replace').strip()}")
+        self.chunked = headers.get('transfer-encoding', '').lower() == 'chunked'
+        if 'content-length' in headers:
+            self.remaining = int(headers['content-length'])
+        # Containers with a TTY send a raw stream without frame headers.
+        if headers.get('content-type') == 'application/vnd.docker.raw-stream':
+            self.multiplexed = False
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def set_blocking(self, blocking):
+        self.sock.setblocking(blocking)
+
+    def _dechunk(self):
+        """Moves complete transfer-encoding chunks from the buffer to the frame buffer."""
+        if not self.chunked:
+            data = self.buffer
+            if self.remaining is not None:
+                data = data[:self.remaining]
+                self.remaining -= len(data)
+                self.finished = self.remaining == 0
+            self.frames += data
+            self.buffer = b''
+            return
+        while True:
+            size_end = self.buffer.find(b'\r\n')
+            if size_end < 0:
+                return
+            size = int(self.buffer[:size_end].split(b';')[0], 16)
+            if size == 0:
+                self.finished = True
+                self.buffer = b''
+                return
+            chunk_end = size_end + 2 + size
+            if len(self.buffer) < chunk_end + 2:
+                return
+            self.frames += self.buffer[size_end + 2:chunk_end]
+            self.buffer = self.buffer[chunk_end + 2:]
+
+    def _demux(self):
+        """Strips the 8-byte stream frame headers, returning the complete payloads."""
+        if not self.multiplexed:
+            payload, self.frames = self.frames, b''
+            return payload
+        payloads = []
+        offset = 0
+        while len(self.frames) - offset >= 8:
+            size = int.from_bytes(self.frames[offset + 4:offset + 8], 'big')
+            if len(self.frames) - offset - 8 < size:
+                break
+            payloads.append(self.frames[offset + 8:offset + 8 + size])
+            offset += 8 + size
+        self.frames = self.frames[offset:]
+        return b''.join(payloads)
+
+    def read_chunk(self):
+        """Returns the next decoded log bytes, b'' at EOF; raises BlockingIOError when non-blocking and idle."""
+        while True:
+            if self.buffer:
+                self._dechunk()
+                payload = self._demux()
+                if payload:
+                    return payload
+            if self.finished:
+                return b''
+            received = self.sock.recv(READ_CHUNK_SIZE)
+            if not received:
+                self.finished = True
+                return self._demux()
+            self.buffer += received
+
+    def interrupt(self):
+        """Wakes up a reader blocked on the stream; it sees the end of the stream."""
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def close(self):
+        self.sock.close()
+
+class DockerEngineAPI:
+    """Docker transport that talks to the Engine HTTP API over its unix socket.
+
+    Short requests reuse keep-alive connections from a small pool; every followed log
+    stream gets a dedicated connection whose socket can be selected on directly.
+    """
+    name = 'api'
+
+    def __init__(self, socket_path=DOCKER_SOCKET, pool_size=4, timeout=10):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.pool = queue.LifoQueue(maxsize=pool_size)
+
+    @staticmethod
+    def available(socket_path=DOCKER_SOCKET):
+        """Returns True if the Engine API socket exists and is accessible."""
+        return os.path.exists(socket_path) and os.access(socket_path, os.R_OK | os.W_OK)
+
+    def request(self, method, path):
+        """Sends a request over a pooled connection and returns the decoded JSON body."""
+        try:
+            connection = self.pool.get_nowait()
+            reused = True
+        except queue.Empty:
+            connection = UnixHTTPConnection(self.socket_path, self.timeout)
+            reused = False
+        try:
+            connection.request(method, path)
+            response = connection.getresponse()
+            body = response.read()
+        except (http.client.HTTPException, OSError) as e:
+            connection.close()
+            if reused:
+                # The daemon may have dropped an idle keep-alive connection; retry on a fresh one.
+                return self.request(method, path)
+            raise DockerError(f"{method} {path} failed: {e}") from e
+        if response.will_close:
+            connection.close()
+        else:
+            try:
+                self.pool.put_nowait(connection)
+            except queue.Full:
+                connection.close()
+        if response.status >= 400:
+            raise DockerError(f"{method} {path} returned {response.status}: {body.decode(errors='replace').strip()}")
+        return json.loads(body) if body else None
+
+    def list_containers(self):
+        """Returns the names of the running containers."""
+        return [container['Names'][0].lstrip('/') for container in self.request('GET', '/containers/json')]
+
+    def open_logs(self, container, since=None, follow=False, timestamps=False):
+        """Opens a stream of a container's log output (stdout and stderr) from `since` onwards."""
+        params = {'stdout': 1, 'stderr': 1, 'follow': int(follow), 'timestamps': int(timestamps)}
+        if since:
+            params['since'] = docker_timestamp_to_unix(since)
+        try:
+            return self.open_stream(f"/containers/{quote(container)}/logs?{urlencode(params)}")
+        except DockerError as e:
+            raise DockerError(f"Failed to open logs of {container}: {e}") from e
+
+    def log_path(self, container):
+        """Returns the path of a container's json-file log."""
+        return self.request('GET', f"/containers/{quote(container)}/json")['LogPath']
+
+    def open_events(self, since=None):
+        """Opens a stream of newline-delimited JSON container start/die/restart events."""
+        params = {'filters': json.dumps({'type': ['container'], 'event': list(CONTAINER_EVENTS)})}
+        if since:
+            params['since'] = docker_timestamp_to_unix(since)
+        return self.open_stream(f"/events?{urlencode(params)}", multiplexed=False)
+
+    def open_stream(self, path, multiplexed=True):
+        """Sends a GET request on a dedicated connection and returns its body as a stream."""
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+            # Closing the connection after the response makes the end of the stream readable to a selector.
+            sock.sendall(f"GET {path} HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n".encode())
+            stream = APILogStream(sock, multiplexed)
+        except (OSError, DockerError) as e:
+            sock.close()
+            raise DockerError(str(e)) from e
+        # Followed streams may stay idle for a long time.
+        sock.settimeout(None)
+        return stream
+
+def rotated_log_files(path):
+    """Returns the rotated json-file logs of `path` (path.1, path.2, ...), oldest first."""
+    names = glob.glob(glob.escape(path) + '.[0-9]*')
+    return sorted((name for name in names if name.rpartition('.')[2].isdigit()),
+                  key=lambda name: -int(name.rpartition('.')[2]))
+
+def load_inotify():
+    """Returns libc with the inotify functions, or None where inotify is not available."""
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        for function in ('inotify_init1', 'inotify_add_watch', 'inotify_rm_watch'):
+            getattr(libc, function)
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+class InotifyWatcher:
+    """One inotify instance shared by all the json-file streams of a transport.
+
+    Linux caps the inotify instances of a user (fs.inotify.max_user_instances, 128 by
+    default), so streams do not get one each: every container directory gets one watch
+    on the shared instance, and a dispatcher thread wakes the streams of a directory that
+    changed through their notify() method. Streams whose directory cannot be watched (or
+    when the instance cannot be created) are woken every FILE_POLL_INTERVAL instead, so
+    they poll. The instance and the thread only live while streams are watched.
+    """
+    def __init__(self, libc):
+        self.libc = libc
+        self.lock = threading.Lock()
+        self.fd = None
+        self.thread = None
+        self.streams = set()
+        # Watch descriptor -> streams of the directory, directory -> watch descriptor.
+        self.watches = {}
+        self.directories = {}
+        self.polled = set()
+
+    def watch(self, stream, directory):
+        """Starts waking `stream` when `directory` changes; returns False if it is polled instead."""
+        with self.lock:
+            if self.fd is None:
+                fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+                self.fd = fd if fd >= 0 else None
+            watch = self.directories.get(directory)
+            if watch is None and self.fd is not None:
+                watch = self.libc.inotify_add_watch(self.fd, directory.encode(), IN_LOG_DIR_EVENTS)
+                if watch >= 0:
+                    self.directories[directory] = watch
+                    self.watches[watch] = set()
+                else:
+                    watch = None
+            if watch is None:
+                self.polled.add(stream)
+            else:
+                self.watches[watch].add(stream)
+            self.streams.add(stream)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.dispatch, name='inotify', daemon=True)
+                self.thread.start()
+            return watch is not None
+
+    def unwatch(self, stream):
+        """Stops waking `stream`; once this returns, notify() is not called on it anymore."""
+        with self.lock:
+            self.streams.discard(stream)
+            self.polled.discard(stream)
+            for directory, watch in list(self.directories.items()):
+                streams = self.watches[watch]
+                if stream in streams:
+                    streams.discard(stream)
+                    if not streams:
+                        self.libc.inotify_rm_watch(self.fd, watch)
+                        del self.watches[watch], self.directories[directory]
+
+    def read_events(self):
+        """Returns the watch descriptors of the pending inotify events, dropping the watches the kernel removed."""
+        watches = set()
+        try:
+            while True:
+                data = os.read(self.fd, READ_CHUNK_SIZE)
+                offset = 0
+                while offset < len(data):
+                    watch, mask, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+                    offset += INOTIFY_EVENT.size + length
+                    watches.add(watch)
+                    if mask & IN_IGNORED and watch in self.watches:
+                        # The directory is gone (or the watch was removed): poll its remaining streams.
+                        self.polled.update(self.watches.pop(watch))
+                        self.directories = {name: kept for name, kept in self.directories.items() if kept != watch}
+        except BlockingIOError:
+            pass
+        return watches
+
+    def dispatch(self):
+        """Wakes the streams of changed directories, and the polled streams every FILE_POLL_INTERVAL."""
+        next_poll = time.monotonic() + FILE_POLL_INTERVAL
+        while True:
+            # Only this thread closes the instance, so it can be selected on without the lock.
+            select.select([self.fd] if self.fd is not None else [], [], [], max(0.0, next_poll - time.monotonic()))
+            with self.lock:
+                if not self.streams:
+                    if self.fd is not None:
+                        os.close(self.fd)
+                        self.fd = None
+                    self.thread = None
+                    return
+                woken = set()
+                if self.fd is not None:
+                    for watch in self.read_events():
+                        woken.update(self.watches.get(watch, ()))
+                if time.monotonic() >= next_poll:
+                    woken.update(self.polled)
+                    next_poll = time.monotonic() + FILE_POLL_INTERVAL
+                # Notified under the lock: unwatch() returns before a stream closes its descriptor.
+                for stream in woken:
+                    stream.notify()
+
+class JsonFileLogStream:
+    """A container log stream tailed straight from the json-file driver's log file.
+
+    Appended regions are mapped with mmap and unwrapped from their JSON envelopes. When
+    the driver rotates the log (renames it to .1 and starts a new file), the old file is
+    drained before the new one is opened. Followed through an InotifyWatcher, the stream
+    gets an eventfd the watcher signals when the container directory changes, which makes
+    it selectable and wakes blocked readers; without one it polls.
+    """
+    def __init__(self, path, since=None, follow=False, timestamps=False, inotify=None):
+        self.path = path
+        self.since = normalize_docker_timestamp(since) if since else None
+        self.follow = follow
+        self.timestamps = timestamps
+        self.blocking = True
+        self.finished = False
+        self.interrupted = threading.Event()
+        self.pending = b''
+        self.line_start = True
+        # Open files to read after the current one: rotated files still holding logs from
+        # `since` onwards, oldest first, then the live log.
+        # File times come from a coarse clock and can trail the entries' own times by a few ms, so
+        # files changed up to a second before `since` are read too; their entries are filtered anyway.
+        since_unix = float(docker_timestamp_to_unix(since)) - 1 if since else None
+        names = [name for name in rotated_log_files(path) if since_unix is None or os.stat(name).st_mtime >= since_unix]
+        self.queue = [open(name, 'rb') for name in names + [path]]
+        self.file = None
+        self.drained = False
+        self.open_next()
+        self.inotify = inotify
+        self.notify_fd = None
+        # Guards notify_fd against interrupt() racing close() from another thread.
+        self.notify_lock = threading.Lock()
+        if inotify is not None and follow:
+            self.notify_fd = os.eventfd(0, os.EFD_NONBLOCK | os.EFD_CLOEXEC)
+            inotify.watch(self, os.path.dirname(path) or '.')
+
+    def open_next(self):
+        if self.file is not None:
+            self.file.close()
+        self.file = self.queue.pop(0)
+        self.offset = 0
+        self.pending = b''
+        self.inode = os.fstat(self.file.fileno()).st_ino
+
+    def fileno(self):
+        if self.notify_fd is None:
+            raise OSError("json-file logs can only be selected on with inotify")
+        return self.notify_fd
+
+    def notify(self):
+        """Marks the stream readable; called by the watcher and by interrupt()."""
+        with self.notify_lock:
+            if self.notify_fd is not None:
+                os.eventfd_write(self.notify_fd, 1)
+
+    def set_blocking(self, blocking):
+        self.blocking = blocking
+
+    def read_region(self):
+        """Maps and returns the bytes appended to the current file since the last read."""
+        size = os.fstat(self.file.fileno()).st_size
+        if size < self.offset:
+            # Truncated in place: start over.
+            self.offset = 0
+            self.pending = b''
+        if size == self.offset:
+            return b''
+        end = min(size, self.offset + FILE_READ_SIZE)
+        start = self.offset - self.offset % mmap.ALLOCATIONGRANULARITY
+        with mmap.mmap(self.file.fileno(), end - start, access=mmap.ACCESS_READ, offset=start) as mapped:
+            region = mapped[self.offset - start:]
+        self.offset = end
+        return region
+
+    def unwrap(self, lines):
+        """Returns the log payload of complete json-file lines, skipping the entries before `since`."""
+        payloads = []
+        for line in lines:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if self.since is not None:
+                if normalize_docker_timestamp(entry['time']) < self.since:
+                    continue
+                # Entries are in time order, so nothing after this one needs the check.
+                self.since = None
+            payload = entry['log'].encode()
+            if self.timestamps and self.line_start:
+                payload = entry['time'].encode() + b' ' + payload
+            # Long lines are split over several entries, only the last one ends with a newline.
+            self.line_start = payload.endswith(b'\n')
+            payloads.append(payload)
+        return b''.join(payloads)
+
+    def queue_rotations(self):
+        """Opens the files written since the current one was rotated away: newer rotated files, then the live log."""
+        names = rotated_log_files(self.path)
+        for index, name in enumerate(names):
+            try:
+                if os.stat(name).st_ino == self.inode:
+                    names = names[index + 1:]
+                    break
+            except FileNotFoundError:
+                pass
+        for name in names + [self.path]:
+            try:
+                self.queue.append(open(name, 'rb'))
+            except FileNotFoundError:
+                pass
+
+    def rotated(self):
+        """Returns True if the log path now names a newer file than the one being read."""
+        try:
+            return os.stat(self.path).st_ino != self.inode
+        except FileNotFoundError:
+            return False
+
+    def wait(self):
+        """Blocks until the log directory changes, the poll interval passes or the stream is interrupted."""
+        if self.notify_fd is None:
+            self.interrupted.wait(FILE_POLL_INTERVAL)
+            return
+        select.select([self.notify_fd], [], [], FILE_POLL_INTERVAL)
+        self.drain_events()
+
+    def drain_events(self):
+        """Consumes the pending notifications; returns True if there were any."""
+        try:
+            os.eventfd_read(self.notify_fd)
+        except BlockingIOError:
+            return False
+        return True
+
+    def read_chunk(self):
+        """Returns the next log bytes, b'' at the end; raises BlockingIOError when non-blocking and idle."""
+        while not self.finished:
+            region = self.read_region()
+            if region:
+                self.drained = False
+                lines = (self.pending + region).split(b'\n')
+                self.pending = lines.pop()
+                payload = self.unwrap(lines)
+                if payload:
+                    return payload
+                continue
+            if self.queue or self.rotated():
+                if not self.drained:
+                    # Entries may have been appended to the old file just before it was rotated.
+                    self.drained = True
+                    continue
+                self.drained = False
+                if not self.queue:
+                    self.queue_rotations()
+                if self.queue:
+                    self.open_next()
+            elif not self.follow:
+                return b''
+            elif not self.blocking:
+                # Events are only consumed once the stream looks idle, so the selector keeps
+                # waking us while there is more to read; changes seen here get another look.
+                if self.notify_fd is not None and self.drain_events():
+                    continue
+                raise BlockingIOError
+            else:
+                self.wait()
+        return b''
+
+    def interrupt(self):
+        """Wakes up a reader blocked on the stream; it sees the end of the stream."""
+        self.finished = True
+        self.interrupted.set()
+        # Wakes selectors and blocked readers.
+        self.notify()
+
+    def close(self):
+        for file in [self.file] + self.queue:
+            if file is not None:
+                file.close()
+        if self.notify_fd is not None:
+            self.inotify.unwatch(self)
+            with self.notify_lock:
+                os.close(self.notify_fd)
+                self.notify_fd = None
+
+class JsonFileTransport:
+    """Docker transport that tails the json-file logs of the containers directly.
+
+    Listing containers, events and looking up the log paths go through another transport;
+    `log_paths` can map container names to log files up front.
+    """
+    name = 'files'
+
+    def __init__(self, docker, log_paths=None):
+        self.docker = docker
+        self.log_paths = dict(log_paths or {})
+        libc = load_inotify()
+        self.inotify = InotifyWatcher(libc) if libc is not None else None
+
+    def list_containers(self):
+        return self.docker.list_containers()
+
+    def open_events(self, since=None):
+        return self.docker.open_events(since)
+
+    def open_logs(self, container, since=None, follow=False, timestamps=False):
+        """Opens a stream of a container's json-file log from `since` onwards."""
+        path = self.log_paths.get(container)
+        if path is None:
+            path = self.log_paths[container] = self.docker.log_path(container)
+        try:
+            return JsonFileLogStream(path, since, follow, timestamps, self.inotify)
+        except OSError as e:
+            raise DockerError(f"Failed to open the log file of {container}: {e}") from e
+
+def create_transport(transport='auto', socket_path=DOCKER_SOCKET):
+    """Creates the Docker transport, preferring the Engine API in 'auto' mode."""
+    if transport == 'files':
+        return JsonFileTransport(create_transport('auto', socket_path))
+    if transport == 'api' or (transport == 'auto' and DockerEngineAPI.available(socket_path)):
+        return DockerEngineAPI(socket_path)
+    if transport == 'cli' or transport == 'auto':
+        return DockerCLI()
+    raise ValueError(f"Unknown transport '{transport}', expected one of {TRANSPORTS}.")